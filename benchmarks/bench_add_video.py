@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+What adding a video costs the main loop: the bookkeeping of
+MainWindow.add_new_video (VideoItem, central_item_dict, video keys, saving
+to the queue store) with the row insertion left out, and the construction
+of one Downloadable row on its own.
+
+The queue store and caches are kept in a temporary directory. Needs
+PyGObject and a display; on a headless machine run it under a virtual one:
+    xvfb-run python3 benchmarks/bench_add_video.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# must be set before the window opens its stores
+state_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+os.environ["XDG_STATE_HOME"] = os.environ["XDG_CACHE_HOME"] = state_dir
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+from main_win import MainWindow
+from downloadables import Downloadable
+from video_item import VideoItem
+from synthetic import make_info_dict
+
+VIDEOS = 2000
+ROWS = 300
+
+
+def new_window():
+    """ Returns a MainWindow whose new rows are only collected """
+    main_win = MainWindow()
+    inserted = []
+    main_win.row_inserter.queue = \
+        lambda function, item, placeholder: inserted.append(item)
+    return main_win
+
+def bench_add_new_video(videos=VIDEOS):
+    """
+    Returns the time (in microseconds) add_new_video takes per video, for
+    info dicts (extracted in threads) and for VideoItems (extracted in
+    processes, see extraction_pool)
+    """
+    results = {}
+    for name, make in (("info_dict_us", make_info_dict),
+                       ("video_item_us",
+                        lambda index: VideoItem(make_info_dict(index)))):
+        main_win = new_window()
+        items = [make(index) for index in range(videos)]
+
+        start = time.perf_counter()
+        for item in items:
+            main_win.add_new_video(item)
+        results[name] = (time.perf_counter() - start) / videos * 1e6
+
+        main_win.queue_store.close()
+        main_win.destroy()
+
+    return results
+
+def bench_row_construction(rows=ROWS):
+    """
+    Returns the time (in microseconds) of building one Downloadable row
+    and of showing it in the list
+    """
+    main_win = new_window()
+    main_win.show_all()
+    for index in range(rows):
+        main_win.add_new_video(make_info_dict(index))
+    item_dicts = list(main_win.central_item_dict.values())
+
+    start = time.perf_counter()
+    row_widgets = [Downloadable(main_win, item_dict) for item_dict in item_dicts]
+    constructing = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in row_widgets:
+        main_win.downloadables_listbox.add(row)
+        row.show_all()
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+    showing = time.perf_counter() - start
+
+    main_win.queue_store.close()
+    main_win.destroy()
+
+    return {
+        "construct_us": constructing / rows * 1e6,
+        "show_us": showing / rows * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    added = bench_add_new_video()
+    print("add_new_video: {:.1f} µs per info dict, {:.1f} µs per VideoItem"
+          .format(added["info_dict_us"], added["video_item_us"]))
+
+    rows = bench_row_construction()
+    print("Downloadable rows: {:.1f} µs to build, {:.1f} µs to show"
+          .format(rows["construct_us"], rows["show_us"]))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Format classification and description on synthetic info dicts shaped like
+data/sample_dict.txt: the is_* classifiers one format at a time versus
+classify_formats in one pass, on youtube_dl's dicts and on the FormatInfo
+records of a VideoItem, and human_readable_format for every format of
+a video (what the format popover shows).
+
+Run from the repository root:  python3 benchmarks/bench_classifiers.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import basic_functions as bf
+from video_item import VideoItem
+from synthetic import make_info_dict
+
+FORMATS = 24
+VIDEOS = 200
+ROUNDS = 10
+
+
+def timed(function, rounds=ROUNDS):
+    """
+    Returns the time of the fastest of 'rounds' calls of 'function', in
+    seconds; these take milliseconds, so the mean would be mostly noise
+    """
+    function()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def classify_one_by_one(formats):
+    """ Sorts formats with the is_* classifiers, as the rows used to """
+    return (
+        [f for f in formats if bf.is_both_a_v(f)],
+        [f for f in formats if bf.is_video_only(f)],
+        [f for f in formats if bf.is_audio_only(f)],
+    )
+
+def bench_classify(videos=VIDEOS, n_formats=FORMATS):
+    """
+    Returns the time (in milliseconds) of classifying the formats of
+    'videos' videos with the is_* classifiers and with classify_formats,
+    on raw format dicts and on FormatInfo records
+    """
+    info_dicts = [make_info_dict(index, n_formats) for index in range(videos)]
+    video_items = [VideoItem(info_dict) for info_dict in info_dicts]
+    raw_lists = [info_dict["formats"] for info_dict in info_dicts]
+    record_lists = [video_item.formats for video_item in video_items]
+
+    def run_all(classify, format_lists):
+        return lambda: [classify(formats) for formats in format_lists]
+
+    return {
+        "is_star_dicts_ms":
+            timed(run_all(classify_one_by_one, raw_lists)) * 1000,
+        "classify_formats_dicts_ms":
+            timed(run_all(bf.classify_formats, raw_lists)) * 1000,
+        "is_star_records_ms":
+            timed(run_all(classify_one_by_one, record_lists)) * 1000,
+        "classify_formats_records_ms":
+            timed(run_all(bf.classify_formats, record_lists)) * 1000,
+    }
+
+def bench_describe(videos=VIDEOS, n_formats=FORMATS):
+    """
+    Returns the time (in milliseconds) of describing every format of
+    'videos' videos with human_readable_format, long and short, from
+    their VideoItems
+    """
+    video_items = [VideoItem(make_info_dict(index, n_formats))
+                   for index in range(videos)]
+
+    def describe_all(short):
+        def describe():
+            for video_item in video_items:
+                for format_info in video_item.formats:
+                    bf.human_readable_format(format_info.format_id,
+                                             video_item, short=short)
+        return describe
+
+    return {
+        "long_ms": timed(describe_all(False)) * 1000,
+        "short_ms": timed(describe_all(True)) * 1000,
+    }
+
+def bench_video_item(videos=VIDEOS, n_formats=FORMATS):
+    """
+    Returns the time (in milliseconds) of building the VideoItems of
+    'videos' videos, which includes classifying and indexing their formats
+    """
+    info_dicts = [make_info_dict(index, n_formats) for index in range(videos)]
+    return {
+        "video_items_ms":
+            timed(lambda: [VideoItem(info_dict) for info_dict in info_dicts])
+            * 1000,
+    }
+
+
+if __name__ == "__main__":
+    classify = bench_classify()
+    print("classify {} videos x {} formats: is_* {:.2f} ms, classify_formats "
+          "{:.2f} ms (dicts); is_* {:.2f} ms, classify_formats {:.2f} ms "
+          "(records)".format(VIDEOS, FORMATS, classify["is_star_dicts_ms"],
+                             classify["classify_formats_dicts_ms"],
+                             classify["is_star_records_ms"],
+                             classify["classify_formats_records_ms"]))
+
+    describe = bench_describe()
+    print("describe every format: long {:.2f} ms, short {:.2f} ms".format(
+        describe["long_ms"], describe["short_ms"]))
+
+    print("build {} VideoItems: {:.2f} ms".format(
+        VIDEOS, bench_video_item()["video_items_ms"]))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Format lookups by ID on synthetic info dicts with 200 formats: the old
+linear search over ytdl_info_dict["formats"] versus the index a VideoItem
+keeps (built like basic_functions.index_formats does), both for plain
+lookups and for describing every format the way a row's format stores do.
+
+Run from the repository root:  python3 benchmarks/bench_format_lookup.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import basic_functions as bf
+from video_item import VideoItem
+from synthetic import make_info_dict
+
+FORMATS = 200
+ROUNDS = 20
+
+
+def linear_get_format_by_id(format_id, ytdl_info_dict):
+    """ get_format_by_id as it used to be """
+    for format_dict in ytdl_info_dict["formats"]:
+        if format_dict["format_id"] == format_id:
+            return format_dict
+
+    return None
+
+def timed(function, rounds=ROUNDS):
+    """ Returns the mean time of one call of 'function', in seconds """
+    function()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds
+
+def bench_format_lookup(n_formats=FORMATS):
+    """
+    Returns the time (in milliseconds) of looking up every format of one
+    video once, without and with the index, plus the time of building the
+    index itself
+    """
+    info_dict = make_info_dict(n_formats=n_formats)
+    video_item = VideoItem(info_dict)
+    format_ids = [f["format_id"] for f in info_dict["formats"]]
+
+    def all_linear():
+        for format_id in format_ids:
+            linear_get_format_by_id(format_id, info_dict)
+
+    def all_indexed():
+        for format_id in format_ids:
+            bf.get_format_by_id(format_id, video_item)
+
+    return {
+        "linear_ms": timed(all_linear) * 1000,
+        "indexed_ms": timed(all_indexed) * 1000,
+        "build_index_ms": timed(lambda: bf.index_formats(info_dict)) * 1000,
+    }
+
+def bench_describe_formats(n_formats=FORMATS):
+    """
+    Returns the time (in milliseconds) of describing every format of one
+    video with human_readable_format, without and with the index
+    """
+    info_dict = make_info_dict(n_formats=n_formats)
+    video_item = VideoItem(info_dict)
+    format_ids = [f["format_id"] for f in info_dict["formats"]]
+
+    def describe_all(item):
+        return lambda: [bf.human_readable_format(format_id, item, short=True)
+                        for format_id in format_ids]
+
+    # temporarily swap the old lookup in
+    indexed_get_format_by_id = bf.get_format_by_id
+    bf.get_format_by_id = linear_get_format_by_id
+    try:
+        linear = timed(describe_all(info_dict))
+    finally:
+        bf.get_format_by_id = indexed_get_format_by_id
+
+    return {
+        "linear_ms": linear * 1000,
+        "indexed_ms": timed(describe_all(video_item)) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    for name, bench in (("lookup every format", bench_format_lookup),
+                        ("describe every format", bench_describe_formats)):
+        results = bench()
+        print("{} ({} formats): linear {:.3f} ms, indexed {:.3f} ms".format(
+            name, FORMATS, results["linear_ms"], results["indexed_ms"]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Memory kept per queued video: the full info dict plus the filtered format
+lists (how central_item_dict used to look) versus a compact VideoItem.
+Info dicts go through a JSON round trip first, like those coming from the
+info cache, so that no strings are shared between videos by accident.
+
+Run from the repository root:  python3 benchmarks/bench_item_memory.py
+"""
+
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import basic_functions as bf
+from video_item import VideoItem
+from synthetic import make_info_dict
+
+ITEMS = 10000
+
+
+def fresh_info_dict(index):
+    """ A synthetic info dict that shares nothing with other ones """
+    return json.loads(json.dumps(make_info_dict(index)))
+
+def old_item(index):
+    """ What add_new_video used to keep for a video """
+    ytdl_info_dict = fresh_info_dict(index)
+    formats_list = ytdl_info_dict["formats"]
+    return {
+        "ytdl_info_dict": ytdl_info_dict,
+        # the index used to be stored in the info dict
+        "formats_by_id": bf.index_formats(ytdl_info_dict),
+        "available_a_v_s": [av for av in formats_list if bf.is_both_a_v(av)],
+        "available_video_s": [v for v in formats_list if bf.is_video_only(v)],
+        "available_audio_s": [a for a in formats_list if bf.is_audio_only(a)],
+    }
+
+def new_item(index):
+    """ What add_new_video keeps now; the info dict is dropped """
+    return {"video_item": VideoItem(fresh_info_dict(index))}
+
+def retained_bytes(make_item, items):
+    """ Returns how much memory 'items' items made by make_item keep """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    kept = [make_item(index) for index in range(items)]
+
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+
+    return after - before
+
+def bench_item_memory(items=ITEMS):
+    """ Returns MiB retained by 'items' videos, before and after """
+    return {
+        "info_dict_mib": retained_bytes(old_item, items) / 1048576,
+        "video_item_mib": retained_bytes(new_item, items) / 1048576,
+    }
+
+
+if __name__ == "__main__":
+    results = bench_item_memory()
+    print("{} items, full info dicts: {:8.1f} MiB".format(
+        ITEMS, results["info_dict_mib"]))
+    print("{} items, VideoItem:       {:8.1f} MiB".format(
+        ITEMS, results["video_item_mib"]))
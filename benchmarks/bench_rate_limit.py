@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Checks the bandwidth limiter against real downloads: several videos are
+downloaded at once through the DownloadQueue and ytdl_wrapper.download_vid
+from the local stand-in server (local_server.py), and the measured
+aggregate throughput is compared with the configured cap; a throughput
+over the cap (give or take TOLERANCE), or far below it, fails the
+benchmark. No network access is needed.
+
+Run from the repository root:  python3 benchmarks/bench_rate_limit.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+from threading import Event, Lock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import ytdl_wrapper as yw
+from download_queue import DownloadQueue, DownloadJob
+from local_server import MediaServer
+
+MiB = 1048576
+# How far over the cap the measured throughput may be; the limiter lets
+# a burst of a quarter of a second through at the start
+TOLERANCE = 0.1
+# Less than this fraction of the cap means the limiter holds back too much
+MIN_RATIO = 0.5
+
+
+def download_all(server, urls, max_workers):
+    """
+    Downloads 'urls' through a DownloadQueue; returns (seconds taken,
+    {host: bytes downloaded}) once all of them are done
+    """
+    done = Event()
+    lock = Lock()
+    remaining = [len(urls)]
+    failed = []
+
+    def status_changed(job):
+        if job.status not in ("downloaded", "failed"):
+            return
+        with lock:
+            if job.status == "failed":
+                failed.append(job.error)
+            remaining[0] -= 1
+            if not remaining[0]:
+                done.set()
+
+    queue = DownloadQueue(yw.download_vid, max_workers=max_workers,
+                          per_host_limit=None, status_callback=status_changed)
+    target_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+
+    start = time.perf_counter()
+    for number, url in enumerate(urls):
+        where = os.path.join(target_dir, "{}.mp4".format(number))
+        queue.submit(DownloadJob(url, "best", where))
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    if failed:
+        raise RuntimeError("Downloads failed: {}".format(failed))
+
+    bytes_per_host = {}
+    for number, url in enumerate(urls):
+        host = url.split("/")[2].split(":")[0]
+        size = os.path.getsize(os.path.join(target_dir, "{}.mp4".format(number)))
+        bytes_per_host[host] = bytes_per_host.get(host, 0) + size
+
+    return elapsed, bytes_per_host
+
+def check_throughput(name, measured, cap):
+    """ Raises AssertionError if 'measured' bytes/s doesn't fit 'cap' """
+    if measured > cap * (1 + TOLERANCE):
+        raise AssertionError("{}: {:.2f} MiB/s is over the cap of {:.2f} "
+                             "MiB/s".format(name, measured / MiB, cap / MiB))
+    if measured < cap * MIN_RATIO:
+        raise AssertionError("{}: {:.2f} MiB/s is far below the cap of {:.2f} "
+                             "MiB/s".format(name, measured / MiB, cap / MiB))
+
+def bench_total_cap(cap=4 * MiB, downloads=4, size=4 * MiB):
+    """
+    Downloads 'downloads' files at once with a total limit of 'cap' bytes/s;
+    returns the configured and measured aggregate throughput in MiB/s.
+    Raises AssertionError if the measured one doesn't keep to the cap.
+    """
+    server = MediaServer().start()
+    rate_limiter = yw.get_rate_limiter()
+    rate_limiter.set_rate(cap)
+    rate_limiter.set_per_host_rate(None)
+    try:
+        urls = [server.url("/media/cap-{}-{}.mp4".format(number, size))
+                for number in range(downloads)]
+        elapsed, bytes_per_host = download_all(server, urls, downloads)
+    finally:
+        rate_limiter.set_rate(None)
+        server.stop()
+
+    measured = sum(bytes_per_host.values()) / elapsed
+    check_throughput("total", measured, cap)
+    return {
+        "cap_mib_s": cap / MiB,
+        "measured_mib_s": measured / MiB,
+        "ratio": measured / cap,
+    }
+
+def bench_per_host_cap(host_cap=1 * MiB, downloads_per_host=2, size=1 * MiB):
+    """
+    Downloads from two 'websites' (127.0.0.1 and localhost, both the local
+    server) with no total limit and a per-host limit of 'host_cap' bytes/s;
+    returns the configured and measured per-host throughput in MiB/s.
+    Raises AssertionError if either host doesn't keep to its cap.
+    """
+    server = MediaServer().start()
+    rate_limiter = yw.get_rate_limiter()
+    rate_limiter.set_rate(None)
+    rate_limiter.set_per_host_rate(host_cap)
+    hosts = ("127.0.0.1", "localhost")
+    try:
+        urls = [server.url("/media/host-{}-{}.mp4".format(number, size), host)
+                for host in hosts for number in range(downloads_per_host)]
+        elapsed, bytes_per_host = download_all(server, urls, len(urls))
+    finally:
+        rate_limiter.set_per_host_rate(None)
+        server.stop()
+
+    # both hosts run in parallel, so each should get about host_cap for
+    # the whole time
+    results = {"host_cap_mib_s": host_cap / MiB}
+    for host in hosts:
+        measured = bytes_per_host[host] / elapsed
+        check_throughput(host, measured, host_cap)
+        results["{}_mib_s".format(host)] = measured / MiB
+    results["total_mib_s"] = sum(bytes_per_host.values()) / elapsed / MiB
+    return results
+
+
+if __name__ == "__main__":
+    total = bench_total_cap()
+    print("total cap {:.1f} MiB/s: measured {:.2f} MiB/s ({:.0%} of cap)"
+          .format(total["cap_mib_s"], total["measured_mib_s"],
+                  total["ratio"]))
+
+    per_host = bench_per_host_cap()
+    print("per-host cap {:.1f} MiB/s: 127.0.0.1 {:.2f}, localhost {:.2f}, "
+          "together {:.2f} MiB/s".format(
+              per_host["host_cap_mib_s"], per_host["127.0.0.1_mib_s"],
+              per_host["localhost_mib_s"], per_host["total_mib_s"]))
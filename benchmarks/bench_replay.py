@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Runs the whole path of a video through CatFetch offline: the web pages of
+videos on the local stand-in server (local_server.py) are extracted once
+while their HTTP exchanges are recorded (http_fixtures.py), then extracted
+again from the recording, turned into VideoItems as add_new_video does
+and downloaded with ytdl_wrapper.download_vid from the local server.
+Times of each stage are reported; the downloaded files are checked
+byte by byte.
+
+The info cache is kept in a temporary directory, so every run starts
+from the same state. Run from the repository root:
+    python3 benchmarks/bench_replay.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# must be set before the info cache is opened
+os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="catfetch-bench-")
+
+import ytdl_wrapper as yw
+import http_fixtures
+from video_item import VideoItem
+from local_server import MediaServer, media_bytes
+
+MiB = 1048576
+
+
+def extract_all(urls):
+    """ Extracts 'urls' (not from the info cache); returns (dicts, seconds) """
+    start = time.perf_counter()
+    info_dicts = [yw.extract_vid_info(url, use_cache=False) for url in urls]
+    return info_dicts, time.perf_counter() - start
+
+def bench_replay(videos=20, size=2 * MiB):
+    """
+    Extracts 'videos' pages from the local server while recording them,
+    then from the recording with the server's pages unused; returns
+    milliseconds per extraction of both
+    """
+    server = MediaServer().start()
+    fixture_dir = tempfile.mkdtemp(prefix="catfetch-fixtures-")
+    urls = [server.url("/watch/replay{}-{}".format(number, size))
+            for number in range(videos)]
+    # youtube_dl is imported and set up before anything is measured
+    yw.warm_up()
+    try:
+        http_fixtures.use_fixtures("record", fixture_dir)
+        recorded_dicts, recording = extract_all(urls)
+        server.stop()
+
+        # the server is gone: any request missing from the fixtures fails
+        http_fixtures.use_fixtures("replay", fixture_dir)
+        replayed_dicts, replaying = extract_all(urls)
+    finally:
+        http_fixtures.use_fixtures(None)
+
+    for recorded, replayed in zip(recorded_dicts, replayed_dicts):
+        assert recorded["formats"] == replayed["formats"], recorded["id"]
+
+    return {
+        "videos": videos,
+        "fixture_files": len(os.listdir(fixture_dir)),
+        "recording_ms": recording / videos * 1000,
+        "replaying_ms": replaying / videos * 1000,
+    }
+
+def bench_offline_pipeline(videos=8, size=2 * MiB):
+    """
+    Replays the extraction of 'videos' pages, builds their VideoItems and
+    downloads their default (720p, 'size' bytes) format; returns the time
+    of each stage in milliseconds and the download throughput in MiB/s
+    """
+    server = MediaServer().start()
+    fixture_dir = tempfile.mkdtemp(prefix="catfetch-fixtures-")
+    target_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+    urls = [server.url("/watch/pipeline{}-{}".format(number, size))
+            for number in range(videos)]
+    yw.warm_up()
+    try:
+        http_fixtures.use_fixtures("record", fixture_dir)
+        extract_all(urls)
+
+        http_fixtures.use_fixtures("replay", fixture_dir)
+        info_dicts, extracting = extract_all(urls)
+
+        start = time.perf_counter()
+        video_items = [VideoItem(info_dict) for info_dict in info_dicts]
+        building = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for number, video_item in enumerate(video_items):
+            where = os.path.join(target_dir, "{}.mp4".format(number))
+            yw.download_vid(video_item.webpage_url,
+                            video_item.default_format_id, where)
+        downloading = time.perf_counter() - start
+    finally:
+        http_fixtures.use_fixtures(None)
+        server.stop()
+
+    for number in range(videos):
+        with open(os.path.join(target_dir, "{}.mp4".format(number)), "rb") as f:
+            assert f.read() == media_bytes(0, size), number
+
+    return {
+        "videos": videos,
+        "extract_ms": extracting * 1000,
+        "video_items_ms": building * 1000,
+        "download_ms": downloading * 1000,
+        "download_mib_s": videos * size / downloading / MiB,
+    }
+
+
+if __name__ == "__main__":
+    replay = bench_replay()
+    print("{} extractions ({} recorded exchanges): live {:.1f} ms, "
+          "replayed {:.1f} ms per video".format(
+              replay["videos"], replay["fixture_files"],
+              replay["recording_ms"], replay["replaying_ms"]))
+
+    pipeline = bench_offline_pipeline()
+    print("{} videos offline: extraction {:.1f} ms, VideoItems {:.2f} ms, "
+          "downloads {:.1f} ms ({:.1f} MiB/s)".format(
+              pipeline["videos"], pipeline["extract_ms"],
+              pipeline["video_items_ms"], pipeline["download_ms"],
+              pipeline["download_mib_s"]))
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Inserts 5000 rows into the main window's ListBox and reports how long the
+GTK main loop was blocked, for the old way (one idle callback per row, each
+followed by show_all() over the whole list) and for the batched RowInserter.
+
+Needs a display; on a headless machine run it under a virtual one:
+    xvfb-run python3 benchmarks/bench_row_insertion.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, GLib
+
+from main_win import MainWindow
+from downloadables import Downloadable
+from synthetic import make_info_dict
+
+ROWS = 5000
+# The heartbeat runs this often; anything later than that is a stall
+HEARTBEAT_MS = 5
+
+
+class StallMeter(object):
+    """ Records how late a periodic main loop callback gets to run """
+
+    def __init__(self):
+        self.stalls = []
+        self.last = time.perf_counter()
+        GLib.timeout_add(HEARTBEAT_MS, self.beat)
+
+    def beat(self):
+        now = time.perf_counter()
+        self.stalls.append(max(0.0, now - self.last - HEARTBEAT_MS / 1000))
+        self.last = now
+        return True
+
+    def summary(self):
+        stalls = sorted(self.stalls) or [0.0]
+        return {
+            "max_stall_ms": stalls[-1] * 1000,
+            "p95_stall_ms": stalls[int(len(stalls) * 0.95)] * 1000,
+            "stalls_over_50ms": sum(1 for stall in stalls if stall > 0.05),
+        }
+
+def old_add_listbox_row(main_win, item_dict):
+    """ add_listbox_row as it used to be """
+    listbox_row = Downloadable(main_win, item_dict)
+    item_dict["listbox_row"] = listbox_row
+    main_win.downloadables_listbox.add(listbox_row)
+    main_win.downloadables_listbox.show_all()
+
+def run(batched, rows=ROWS):
+    """ Inserts 'rows' rows; returns the stall summary and total time """
+    main_win = MainWindow()
+    main_win.show_all()
+    info_dicts = [make_info_dict(index) for index in range(rows)]
+
+    # let the window appear first
+    while Gtk.events_pending():
+        Gtk.main_iteration()
+
+    meter = StallMeter()
+    start = time.perf_counter()
+
+    if batched:
+        for info_dict in info_dicts:
+            main_win.add_new_video(info_dict)
+    else:
+        # same bookkeeping as add_new_video, but one idle call per row
+        main_win.row_inserter.queue = \
+            lambda function, item, placeholder: GLib.idle_add(
+                old_add_listbox_row, main_win, item)
+        for info_dict in info_dicts:
+            main_win.add_new_video(info_dict)
+
+    def all_inserted():
+        if len(main_win.downloadables_listbox.get_children()) < rows:
+            return True
+        Gtk.main_quit()
+        return False
+
+    GLib.timeout_add(HEARTBEAT_MS, all_inserted)
+    Gtk.main()
+
+    results = meter.summary()
+    results["total_s"] = time.perf_counter() - start
+    main_win.destroy()
+
+    return results
+
+def bench_row_insertion(rows=ROWS):
+    """ Returns stall statistics of both insertion strategies """
+    return {
+        "per_row_idle": run(batched=False, rows=rows),
+        "batched": run(batched=True, rows=rows),
+    }
+
+
+if __name__ == "__main__":
+    for name, results in bench_row_insertion().items():
+        print("{:>12}: total {:7.2f} s, max stall {:8.1f} ms, "
+              "p95 stall {:6.1f} ms, stalls over 50 ms: {}".format(
+                  name, results["total_s"], results["max_stall_ms"],
+                  results["p95_stall_ms"], results["stalls_over_50ms"]))
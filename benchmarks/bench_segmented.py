@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Compares downloading one large file over a single connection (YoutubeDL)
+with downloading it in segments over several connections at once
+(segmented.py), from the local stand-in server (local_server.py) set to
+limit the speed of each connection, as many video hosts do. Also checks
+that a server without Range support falls back to a normal download and
+that the downloaded bytes are right in every case.
+
+Run from the repository root:  python3 benchmarks/bench_segmented.py
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import ytdl_wrapper as yw
+from local_server import MediaServer, media_bytes
+
+MiB = 1048576
+
+
+def timed_download(url, where, segments):
+    """ Downloads 'url' with 'segments' connections; returns seconds taken """
+    # as in the application, the video has been extracted when it was added
+    yw.extract_vid_info(url)
+    yw.set_download_segments(segments)
+    try:
+        start = time.perf_counter()
+        # direct links get the format id "mp4" from the generic extractor
+        yw.download_vid(url, "mp4", where)
+        return time.perf_counter() - start
+    finally:
+        yw.set_download_segments(1)
+
+def check_content(where, size):
+    """ Raises AssertionError unless 'where' is the whole media file """
+    with open(where, "rb") as downloaded:
+        assert downloaded.read() == media_bytes(0, size), where
+
+def bench_segments(size=8 * MiB, connection_rate=2 * MiB, segments=4):
+    """
+    Downloads a 'size'-byte file over one connection and over 'segments'
+    connections, each connection limited to 'connection_rate' bytes/s;
+    returns the throughput of both in MiB/s
+    """
+    server = MediaServer(connection_rate=connection_rate).start()
+    target_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+    results = {"connection_mib_s": connection_rate / MiB}
+    try:
+        for count in (1, segments):
+            url = server.url("/media/segments-{}-{}.mp4".format(count, size))
+            where = os.path.join(target_dir, "{}.mp4".format(count))
+            elapsed = timed_download(url, where, count)
+            check_content(where, size)
+            results["{}_connections_mib_s".format(count)] = size / elapsed / MiB
+    finally:
+        server.stop()
+
+    results["speedup"] = results["{}_connections_mib_s".format(segments)] \
+        / results["1_connections_mib_s"]
+    return results
+
+def bench_fallback(size=8 * MiB, segments=4):
+    """
+    Asks for a segmented download from a server that ignores Range headers;
+    returns the throughput of the (single connection) download it falls
+    back to, in MiB/s
+    """
+    server = MediaServer(ranges=False).start()
+    target_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+    try:
+        url = server.url("/media/fallback-{}.mp4".format(size))
+        where = os.path.join(target_dir, "fallback.mp4")
+        elapsed = timed_download(url, where, segments)
+        check_content(where, size)
+    finally:
+        server.stop()
+
+    return {"fallback_mib_s": size / elapsed / MiB}
+
+
+if __name__ == "__main__":
+    segmented_results = bench_segments()
+    print("connections limited to {:.1f} MiB/s: 1 connection {:.2f} MiB/s, "
+          "4 connections {:.2f} MiB/s ({:.1f}x)".format(
+              segmented_results["connection_mib_s"],
+              segmented_results["1_connections_mib_s"],
+              segmented_results["4_connections_mib_s"],
+              segmented_results["speedup"]))
+
+    fallback = bench_fallback()
+    print("no Range support: fell back to one connection, {:.2f} MiB/s"
+          .format(fallback["fallback_mib_s"]))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Startup cost: how long importing the application's modules takes (from
+`python -X importtime`, each in a fresh interpreter), whether youtube_dl is
+among the imports, what the first extractor lookup costs with and without
+ytdl_wrapper.warm_up() having run, and the time to the window's first
+frame.
+
+The first-paint measurement needs PyGObject and a display; on a headless
+machine run it under a virtual one:
+    xvfb-run python3 benchmarks/bench_startup.py
+Without them, it is skipped and the rest still runs.
+"""
+
+import os
+import sys
+import subprocess
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+URL = "https://www.youtube.com/watch?v=GoImjQOEp-Q"
+# Modules whose import cost matters for startup; youtube_dl for reference
+MODULES = ("youtube_dl", "ytdl_wrapper", "catfetch_cli", "main_win")
+
+
+def run_python(code, *options):
+    """
+    Runs 'code' in a fresh interpreter (with src/ importable); returns
+    the completed process, with stdout and stderr as text
+    """
+    return subprocess.run(
+        [sys.executable] + list(options) + ["-c", code],
+        cwd=SRC_DIR, capture_output=True, text=True
+    )
+
+def import_time(module):
+    """
+    Returns (total import time in ms, whether youtube_dl got imported) for
+    importing 'module' in a fresh interpreter, or None if it can't be
+    imported here (e.g. no PyGObject)
+    """
+    process = run_python("import {}".format(module), "-X", "importtime")
+    if process.returncode != 0:
+        return None
+
+    total_us = 0
+    imported_youtube_dl = False
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # top-level imports are not indented; their cumulative times
+        # include everything they imported
+        if not name.startswith("  "):
+            total_us += int(cumulative)
+        if name.strip() == "youtube_dl":
+            imported_youtube_dl = True
+
+    return total_us / 1000, imported_youtube_dl
+
+def bench_import_time():
+    """ Returns import time (ms) and youtube_dl presence per module """
+    results = {}
+    for module in MODULES:
+        measured = import_time(module)
+        if measured is None:
+            results[module] = None
+        else:
+            results[module] = {
+                "import_ms": measured[0],
+                "imports_youtube_dl": measured[1],
+            }
+    return results
+
+FIRST_LOOKUP = """
+import time
+import ytdl_wrapper as yw
+if {warm}:
+    yw.warm_up()
+start = time.perf_counter()
+ytdl = yw.load_youtube_dl()
+[ie for ie in ytdl.extractor.gen_extractor_classes() if ie.suitable({url!r})]
+print((time.perf_counter() - start) * 1000)
+"""
+
+def bench_first_lookup():
+    """
+    Returns the time (ms) of the first search for the extractor of an
+    address, which YoutubeDL does at the start of every extraction:
+    in a cold process and after warm_up()
+    """
+    results = {}
+    for name, warm in (("cold_ms", False), ("warmed_up_ms", True)):
+        process = run_python(FIRST_LOOKUP.format(warm=warm, url=URL))
+        results[name] = float(process.stdout)
+    return results
+
+FIRST_PAINT = """
+import time
+start = time.perf_counter()
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+from main_win import MainWindow
+
+def drawn(widget, cairo_context):
+    print((time.perf_counter() - start) * 1000)
+    Gtk.main_quit()
+    return False
+
+main_win = MainWindow()
+main_win.connect_after("draw", drawn)
+main_win.show_all()
+Gtk.main()
+"""
+
+def bench_first_paint():
+    """
+    Returns the time (ms) from interpreter start to the window's first
+    frame, or None if there's no GTK or display here
+    """
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")):
+        return None
+    process = run_python(FIRST_PAINT)
+    if process.returncode != 0:
+        return None
+    return {"first_paint_ms": float(process.stdout.split()[0])}
+
+
+if __name__ == "__main__":
+    for module, result in bench_import_time().items():
+        if result is None:
+            print("import {:14} skipped (can't be imported here)".format(
+                module))
+        else:
+            print("import {:14} {:8.1f} ms{}".format(
+                module, result["import_ms"],
+                "  (imports youtube_dl)" if result["imports_youtube_dl"]
+                else ""))
+
+    lookup = bench_first_lookup()
+    print("first extractor lookup, cold:   {:8.1f} ms".format(
+        lookup["cold_ms"]))
+    print("first extractor lookup, warmed: {:8.1f} ms".format(
+        lookup["warmed_up_ms"]))
+
+    paint = bench_first_paint()
+    if paint is None:
+        print("first paint skipped (needs PyGObject and a display)")
+    else:
+        print("first paint: {:8.1f} ms".format(paint["first_paint_ms"]))
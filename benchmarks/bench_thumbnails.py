@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Measures the thumbnail service (thumbnails.py) against the local stand-in
+server (local_server.py): how long request() keeps the calling (main)
+thread busy, and how long a screenful of thumbnails takes to arrive from
+the network, from the disk cache and from memory. Thumbnails are decoded
+and scaled with GdkPixbuf if it's installed; otherwise the raw images are
+measured and the decoding is skipped.
+
+Run from the repository root:  python3 benchmarks/bench_thumbnails.py
+"""
+
+import os
+import importlib
+import sys
+import time
+import tempfile
+from threading import Event, Lock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import thumbnails
+from local_server import MediaServer, png_bytes
+
+# about as many rows as are in view and within a page of it
+ROWS = 30
+
+
+def gdk_pixbuf_available():
+    try:
+        import gi
+        gi.require_version('GdkPixbuf', '2.0')
+        importlib.import_module("gi.repository.GdkPixbuf")
+    except (ImportError, ValueError):
+        return False
+    return True
+
+def request_all(service, urls):
+    """
+    Requests the thumbnails of 'urls' at once; returns (seconds spent in
+    the request() calls, seconds until all of them arrived)
+    """
+    done = Event()
+    lock = Lock()
+    remaining = [len(urls)]
+    failed = []
+
+    def loaded(url, thumbnail):
+        with lock:
+            if thumbnail is None:
+                failed.append(url)
+            remaining[0] -= 1
+            if not remaining[0]:
+                done.set()
+
+    start = time.perf_counter()
+    for url in urls:
+        service.request(url, loaded)
+    requesting = time.perf_counter() - start
+    done.wait()
+    elapsed = time.perf_counter() - start
+
+    if failed:
+        raise RuntimeError("Thumbnails failed: {}".format(failed[:3]))
+    return requesting, elapsed
+
+def new_service(cache_dir, decode):
+    if decode:
+        return thumbnails.ThumbnailService(cache_dir=cache_dir)
+    return thumbnails.ThumbnailService(cache_dir=cache_dir, decode=None)
+
+def bench_thumbnails(rows=ROWS, width=480, height=360):
+    """
+    Loads 'rows' width x height thumbnails three times: cold (network),
+    with a new service over the same disk cache, and again from memory;
+    returns the times in milliseconds
+    """
+    decode = gdk_pixbuf_available()
+    server = MediaServer().start()
+    cache_dir = tempfile.mkdtemp(prefix="catfetch-bench-")
+    urls = [server.url("/thumbnails/row{}-{}x{}.png".format(row, width, height))
+            for row in range(rows)]
+    results = {"rows": rows, "decoded": decode}
+    # generated once up front, so the server doesn't hold the GIL meanwhile
+    png_bytes(width, height)
+    try:
+        service = new_service(cache_dir, decode)
+        requesting, elapsed = request_all(service, urls)
+        results["network_ms"] = elapsed * 1000
+        results["request_calls_ms"] = requesting * 1000
+        service.close()
+
+        service = new_service(cache_dir, decode)
+        _, elapsed = request_all(service, urls)
+        results["disk_cache_ms"] = elapsed * 1000
+
+        _, elapsed = request_all(service, urls)
+        results["memory_ms"] = elapsed * 1000
+        service.close()
+    finally:
+        server.stop()
+
+    results["disk_cache_bytes"] = sum(
+        entry.stat().st_size for entry in os.scandir(cache_dir))
+    return results
+
+
+if __name__ == "__main__":
+    results = bench_thumbnails()
+    print("{} thumbnails ({}):".format(
+        results["rows"],
+        "decoded with GdkPixbuf" if results["decoded"]
+        else "not decoded, GdkPixbuf isn't installed"))
+    print("  request() calls on the main thread: {:.2f} ms in total"
+          .format(results["request_calls_ms"]))
+    print("  from the network: {:.1f} ms, disk cache: {:.1f} ms, "
+          "memory: {:.2f} ms".format(results["network_ms"],
+                                     results["disk_cache_ms"],
+                                     results["memory_ms"]))
+    print("  disk cache: {} KiB".format(results["disk_cache_bytes"] // 1024))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Per-URL cost of extracting with a new YoutubeDL object for every address
+(the old way) versus reusing the calling thread's object from
+ytdl_wrapper.get_ydl(): the same extract_info() call, against watch pages
+of the local stand-in server (local_server.py), is timed both ways. The
+info cache isn't involved. No network access is needed.
+
+Run from the repository root:  python3 benchmarks/bench_ydl_pool.py
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import youtube_dl
+import ytdl_wrapper as yw
+from local_server import MediaServer
+
+ROUNDS = 50
+SIZE = 1048576
+
+
+def fresh_ydl():
+    """ What extract_vid_info used to do for every address """
+    return youtube_dl.YoutubeDL({
+        "logger": yw.MyLogger(),
+        "progress_hooks": [yw.my_hook],
+        "format": "best"
+    })
+
+def pooled_ydl():
+    """ What extract_vid_info does now """
+    return yw.get_ydl("info")
+
+def timed_extractions(get_ydl, urls):
+    """
+    Returns the mean time of extracting one of 'urls' with a YoutubeDL
+    from get_ydl(), in seconds
+    """
+    # one warm-up extraction so that imports and class setup aren't measured
+    get_ydl().extract_info(urls[0], download=False)
+    start = time.perf_counter()
+    for url in urls[1:]:
+        get_ydl().extract_info(url, download=False)
+    return (time.perf_counter() - start) / (len(urls) - 1)
+
+def bench_ydl_overhead(rounds=ROUNDS):
+    """
+    Returns the mean time of one extraction in milliseconds, with a new
+    and with a reused YoutubeDL
+    """
+    server = MediaServer().start()
+    try:
+        results = {}
+        for name, get_ydl in (("fresh_ms", fresh_ydl),
+                              ("pooled_ms", pooled_ydl)):
+            # different addresses every round, as in real use
+            urls = [server.url("/watch/{}{}-{}".format(name, number, SIZE))
+                    for number in range(rounds + 1)]
+            results[name] = timed_extractions(get_ydl, urls) * 1000
+    finally:
+        server.stop()
+
+    results["speedup"] = results["fresh_ms"] / results["pooled_ms"]
+    return results
+
+
+if __name__ == "__main__":
+    results = bench_ydl_overhead()
+    print("new YoutubeDL per URL:    {:8.3f} ms".format(results["fresh_ms"]))
+    print("reused YoutubeDL per URL: {:8.3f} ms ({:.1f}x)".format(
+        results["pooled_ms"], results["speedup"]))
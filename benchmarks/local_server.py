@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for video hosting, used by the benchmarks so they don't
+depend on the network. Serves synthetic "video" files of any size at
+    /media/<name>-<size in bytes>.mp4
+and PNG "thumbnails" of any size at
+    /thumbnails/<name>-<width>x<height>.png
+and a web page for every media file, which YoutubeDL's generic extractor
+finds the video in, at
+    /watch/<name>-<size in bytes>
+Media files come with HEAD and Range request support (206 Partial
+Content), which is what YoutubeDL needs to download a direct link and to
+continue a .part file.
+MediaServer(ranges=False) ignores Range headers, like servers that don't
+support them; with connection_rate, every connection is slowed down to that
+many bytes per second, like servers that limit each client connection.
+
+    server = MediaServer()
+    server.start()
+    url = server.url("/media/cat-1048576.mp4")
+    ...
+    server.stop()
+
+Run on its own (python3 benchmarks/local_server.py [port]) it serves until
+interrupted.
+"""
+
+import re
+import sys
+import time
+import zlib
+import struct
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+MEDIA_PATH = re.compile(r"^/media/[\w.-]+-(\d+)\.mp4$")
+WATCH_PATH = re.compile(r"^/watch/([\w.-]+-\d+)$")
+THUMBNAIL_PATH = re.compile(r"^/thumbnails/[\w.-]+-(\d+)x(\d+)\.png$")
+RANGE_HEADER = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Size of the blocks written to the socket
+CHUNK_SIZE = 65536
+
+# The content of every file is this pattern, repeated; the byte at offset
+# N is PATTERN[N % len(PATTERN)], so any range can be produced and checked
+PATTERN = bytes(range(251))
+
+
+def media_bytes(start, end):
+    """ Returns the bytes of a media file from 'start' up to 'end' (excl.) """
+    offset = start % len(PATTERN)
+    length = end - start
+    repeats = (offset + length) // len(PATTERN) + 1
+    return (PATTERN * repeats)[offset:offset + length]
+
+
+@lru_cache(maxsize=16)
+def png_bytes(width, height):
+    """ Returns a PNG image (an RGB gradient) of the given size """
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data \
+            + struct.pack(">I", zlib.crc32(kind + data))
+
+    # every row: filter type 0, then width RGB pixels
+    rows = b"".join(
+        b"\0" + b"".join(bytes((x * 255 // width, y * 255 // height, 128))
+                         for x in range(width))
+        for y in range(height)
+    )
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) \
+        + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def watch_page(name):
+    """
+    Returns the HTML of the web page of media file 'name' ("<title>-<size>"):
+    a JW Player setup (which YoutubeDL's generic extractor understands)
+    offering the file as "720p" and a file of half its size as "360p"
+    """
+    title, size = name.rsplit("-", 1)
+    return (
+        "<!DOCTYPE html>\n<html><head><title>{title}</title></head><body>\n"
+        "<div id=\"player\"></div>\n<script>\n"
+        "jwplayer(\"player\").setup({{\"title\": \"{title}\", "
+        "\"image\": \"/thumbnails/{title}-480x360.png\", \"sources\": ["
+        "{{\"file\": \"/media/{title}-360p-{half}.mp4\", \"label\": \"360p\", "
+        "\"type\": \"video/mp4\"}}, "
+        "{{\"file\": \"/media/{title}-720p-{size}.mp4\", \"label\": \"720p\", "
+        "\"type\": \"video/mp4\"}}]}});\n"
+        "</script>\n</body></html>\n"
+    ).format(title=title, size=size, half=int(size) // 2).encode("utf-8")
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """ Serves the synthetic media files; see the module docstring """
+    protocol_version = "HTTP/1.1"
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        thumbnail_match = THUMBNAIL_PATH.match(self.path.split("?")[0])
+        if thumbnail_match is not None:
+            self.respond_thumbnail(send_body, *map(int, thumbnail_match.groups()))
+            return
+
+        watch_match = WATCH_PATH.match(self.path.split("?")[0])
+        if watch_match is not None:
+            self.respond_page(send_body, watch_page(watch_match.group(1)))
+            return
+
+        match = MEDIA_PATH.match(self.path.split("?")[0])
+        if match is None:
+            self.send_error(404)
+            return
+        size = int(match.group(1))
+
+        start, end = 0, size
+        status = 200
+        range_match = RANGE_HEADER.match(self.headers.get("Range", ""))
+        if range_match is not None and self.server.ranges:
+            first, last = range_match.groups()
+            if first:
+                start = int(first)
+                end = min(size, int(last) + 1) if last else size
+            elif last:
+                # "bytes=-N" means the last N bytes
+                start = max(0, size - int(last))
+            if start >= size or start >= end:
+                self.send_response(416)
+                self.send_header("Content-Range", "bytes */{}".format(size))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start))
+        if status == 206:
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(
+                start, end - 1, size))
+        self.end_headers()
+
+        if not send_body:
+            return
+        rate = self.server.connection_rate
+        sending_start = time.monotonic()
+        try:
+            for chunk_start in range(start, end, CHUNK_SIZE):
+                chunk_end = min(end, chunk_start + CHUNK_SIZE)
+                self.wfile.write(media_bytes(chunk_start, chunk_end))
+                if rate:
+                    # sleep until this connection is back at 'rate'
+                    due = sending_start + (chunk_end - start) / rate
+                    time.sleep(max(0, due - time.monotonic()))
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading, e.g. a cancelled download
+            pass
+
+    def respond_page(self, send_body, page):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(page)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(page)
+
+    def respond_thumbnail(self, send_body, width, height):
+        image = png_bytes(width, height)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(image)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(image)
+
+    def log_message(self, format, *args):
+        # keep benchmark output clean
+        pass
+
+
+class MediaServer(object):
+    """ A MediaRequestHandler server running in a background thread """
+
+    def __init__(self, port=0, handler=MediaRequestHandler, ranges=True,
+                 connection_rate=None):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), handler)
+        self.httpd.daemon_threads = True
+        # read by the handler, see the module docstring
+        self.httpd.ranges = ranges
+        self.httpd.connection_rate = connection_rate
+        self.port = self.httpd.server_address[1]
+
+    def start(self):
+        thread = Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def url(self, path, host="127.0.0.1"):
+        """
+        Returns the address of 'path' on this server; 'host' can be e.g.
+        "localhost" to make it look like a different website
+        """
+        return "http://{}:{}{}".format(host, self.port, path)
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    server = MediaServer(port)
+    print("Serving on {}".format(server.url("/media/example-1048576.mp4")))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
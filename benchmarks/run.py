@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Runs the benchmarks and keeps their results, so that changes between
+versions show up. Every bench_*() function of every bench_*.py module in
+this directory is run (or those of the modules named on the command line,
+e.g. "format_lookup"); each module runs in a fresh interpreter, so one
+benchmark's imports and settings don't skew another's. Results are saved
+in benchmarks/results/<version>.json, the version being that of the
+checked out code (git describe) unless --label says otherwise; running
+only some modules updates just their part of the file.
+
+    python3 benchmarks/run.py
+    python3 benchmarks/run.py classifiers replay
+    python3 benchmarks/run.py --compare v0.2          # run, then compare
+    python3 benchmarks/run.py --compare v0.2 --no-run # compare saved ones
+
+Modules which can't be imported here (e.g. without PyGObject) are skipped.
+Those needing a display are run under xvfb-run if there is no display but
+xvfb-run is installed.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import platform
+import importlib
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+# Changes smaller than this (relative) are taken for noise; timings of
+# runs on one machine easily differ by 10%
+DEFAULT_THRESHOLD = 0.2
+
+# Result names saying which way is better; anything else is just shown
+LOWER_IS_BETTER = re.compile(r"(_ms|_us|_s|_bytes|_kib|stalls_over_\w+)$")
+HIGHER_IS_BETTER = re.compile(r"(_mib_s|speedup)$")
+
+
+def bench_modules():
+    """ Returns the names of all benchmark modules, e.g. "bench_replay" """
+    return sorted(name[:-3] for name in os.listdir(BENCH_DIR)
+                  if name.startswith("bench_") and name.endswith(".py"))
+
+def bench_functions(module):
+    """ Returns the bench_*() functions of 'module' in source order """
+    functions = [function for name, function
+                 in inspect.getmembers(module, inspect.isfunction)
+                 if name.startswith("bench_")
+                 and function.__module__ == module.__name__]
+    return sorted(functions, key=lambda f: f.__code__.co_firstlineno)
+
+def run_in_process(module_name):
+    """
+    Imports and runs one benchmark module; prints {function name: result}
+    (or {"skipped": reason}) as JSON on the last line of the output
+    """
+    sys.path.insert(0, BENCH_DIR)
+    try:
+        module = importlib.import_module(module_name)
+    except (ImportError, ValueError) as error:
+        # ValueError: gi.require_version of a library that isn't there
+        results = {"skipped": str(error)}
+    else:
+        results = {}
+        for function in bench_functions(module):
+            try:
+                results[function.__name__] = function()
+            except Exception as error:
+                results[function.__name__] = {
+                    "error": "{}: {}".format(type(error).__name__, error)
+                }
+
+    print(json.dumps(results))
+
+def run_module(module_name):
+    """ Runs one benchmark module in a new interpreter; returns its results """
+    command = [sys.executable, os.path.abspath(__file__),
+               "--in-process", module_name]
+    if not (os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY")) \
+    and shutil.which("xvfb-run"):
+        command = ["xvfb-run", "-a"] + command
+
+    process = subprocess.run(command, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        return {"error": process.stderr.strip().splitlines()[-1:]}
+    return json.loads(lines[-1])
+
+def code_version():
+    """ Returns the version of the checked out code, e.g. "v0.2-5-gabc123" """
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--tags", "--always", "--dirty"],
+            cwd=BENCH_DIR, stderr=subprocess.DEVNULL, universal_newlines=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unversioned"
+
+def results_path(label):
+    return os.path.join(RESULTS_DIR, "{}.json".format(label))
+
+def load_results(label):
+    """ Returns the saved results of 'label', or None if there are none """
+    try:
+        with open(results_path(label), encoding="utf-8") as results_file:
+            return json.load(results_file)
+    except FileNotFoundError:
+        return None
+
+def save_results(label, module_results):
+    """ Adds the results of some modules to the saved ones of 'label' """
+    saved = load_results(label) or {"label": label, "modules": {}}
+    saved.update({
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": "{} {}".format(platform.system(), platform.machine()),
+    })
+    saved["modules"].update(module_results)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(results_path(label), "w", encoding="utf-8") as results_file:
+        json.dump(saved, results_file, indent=2, sort_keys=True)
+        results_file.write("\n")
+
+def flatten(results, prefix=""):
+    """
+    Returns {"module.function.name": number} of every number in nested
+    result dicts
+    """
+    numbers = {}
+    for name, value in results.items():
+        full_name = prefix + name
+        if isinstance(value, dict):
+            numbers.update(flatten(value, full_name + "."))
+        # bool is an int too, but not something to compare
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            numbers[full_name] = value
+    return numbers
+
+def compare(old, new, threshold=DEFAULT_THRESHOLD):
+    """
+    Prints the results both have side by side; changes of more than
+    'threshold' for the worse are marked as regressions. Returns how many
+    there were.
+    """
+    old_numbers = flatten(old["modules"])
+    new_numbers = flatten(new["modules"])
+    regressions = 0
+
+    print("{:60} {:>12} {:>12} {:>8}".format(
+        "", old["label"], new["label"], "change"))
+    for name in sorted(set(old_numbers) & set(new_numbers)):
+        old_value, new_value = old_numbers[name], new_numbers[name]
+        if old_value:
+            change = (new_value - old_value) / abs(old_value)
+            change_text = "{:+.0%}".format(change)
+        else:
+            change, change_text = 0, ""
+
+        # "_mib_s" before "_s"
+        if HIGHER_IS_BETTER.search(name):
+            worse = change < -threshold
+        elif LOWER_IS_BETTER.search(name):
+            worse = change > threshold
+        else:
+            worse = False
+        regressions += worse
+
+        print("{:60} {:12.4g} {:12.4g} {:>8}{}".format(
+            name, old_value, new_value, change_text,
+            "  <- regression" if worse else ""))
+
+    return regressions
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Run the benchmarks and compare their results "
+                    "between versions"
+    )
+    parser.add_argument(
+        "modules", nargs="*",
+        help="benchmark modules to run, e.g. format_lookup (default: all)"
+    )
+    parser.add_argument(
+        "--label", default=None,
+        help="name the results are saved under (default: git describe)"
+    )
+    parser.add_argument(
+        "--compare", metavar="LABEL",
+        help="compare the results with those saved under LABEL"
+    )
+    parser.add_argument(
+        "--no-run", action="store_true",
+        help="don't run anything, only compare saved results"
+    )
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="relative change counted as a regression "
+             "(default: %(default)s)"
+    )
+    parser.add_argument("--in-process", metavar="MODULE",
+                        help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    if args.in_process:
+        run_in_process(args.in_process)
+        return 0
+
+    label = args.label or code_version()
+    if not args.no_run:
+        modules = ["bench_" + name if not name.startswith("bench_") else name
+                   for name in args.modules] or bench_modules()
+        module_results = {}
+        for module_name in modules:
+            print("{} ...".format(module_name), end=" ", flush=True)
+            start = time.perf_counter()
+            module_results[module_name] = results = run_module(module_name)
+            if "skipped" in results:
+                print("skipped ({})".format(results["skipped"]))
+            elif "error" in results:
+                print("failed: {}".format(results["error"]))
+            else:
+                print("{:.1f} s".format(time.perf_counter() - start))
+        save_results(label, module_results)
+        print("Saved in {}".format(results_path(label)))
+
+    if args.compare:
+        old, new = load_results(args.compare), load_results(label)
+        for missing_label, results in ((args.compare, old), (label, new)):
+            if results is None:
+                print("No results saved for {}".format(missing_label))
+                return 1
+        regressions = compare(old, new, args.threshold)
+        print("{} regression(s)".format(regressions))
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Synthetic youtube_dl info dicts shaped like data/sample_dict.txt, for
+benchmarks that must not depend on the network. Everything is derived from
+the arguments, so the same call always returns the same dict.
+"""
+
+AUDIO_CODECS = ["opus", "mp4a.40.2", "vorbis"]
+VIDEO_CODECS = ["vp9", "avc1.4d401e", "avc1.42001E"]
+HEIGHTS = [144, 240, 360, 480, 720, 1080, 1440, 2160]
+EXTS = ["webm", "mp4", "m4a"]
+
+
+def make_http_headers():
+    """ youtube_dl puts a copy of these into every format """
+    return {
+        "Accept": "text/html,application/xhtml+xml,application/xml;"
+                  "q=0.9,*/*;q=0.8",
+        "Accept-Charset": "ISO-8859-1,utf-8;q=0.7,*;q=0.7",
+        "Accept-Encoding": "gzip, deflate",
+        "Accept-Language": "en-us,en;q=0.5",
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:10.0) "
+                      "Gecko/20150101 Firefox/47.0 (Chrome)"
+    }
+
+def make_format(video_id, number):
+    """
+    Returns one format dict; formats cycle through audio-only, video-only
+    and audio+video, like the DASH and legacy formats on YouTube
+    """
+    format_id = str(100 + number)
+    kind = number % 3
+    height = HEIGHTS[(number // 3) % len(HEIGHTS)]
+    ext = EXTS[number % len(EXTS)]
+
+    format_dict = {
+        "ext": ext,
+        "filesize": 1000000 + number * 7919,
+        "format_id": format_id,
+        "http_headers": make_http_headers(),
+        "player_url": "//s.ytimg.com/yts/jsbin/player-en_US-vflEz7zqU/base.js",
+        "preference": -50 + number,
+        "protocol": "https",
+        "tbr": 50.0 + number * 3.5,
+        "url": "https://media.example.com/videoplayback?id={}&itag={}"
+               "&signature={}".format(video_id, format_id, "A" * 80),
+    }
+
+    if kind == 0:
+        format_dict.update({
+            "abr": 48 + 16 * (number % 8),
+            "acodec": AUDIO_CODECS[number % len(AUDIO_CODECS)],
+            "format": "{} - audio only (DASH audio)".format(format_id),
+            "format_note": "DASH audio",
+            "vcodec": "none",
+        })
+    else:
+        format_dict.update({
+            "acodec": "none",
+            "format": "{} - {}x{} ({}p)".format(
+                format_id, height * 16 // 9, height, height),
+            "format_note": "{}p".format(height),
+            "fps": 30 if number % 2 else 60,
+            "height": height,
+            "vcodec": VIDEO_CODECS[number % len(VIDEO_CODECS)],
+            "width": height * 16 // 9,
+        })
+        if kind == 2:
+            format_dict["acodec"] = "mp4a.40.2"
+            format_dict["abr"] = 96
+            format_dict["format_note"] = "medium"
+            format_dict["resolution"] = "{}x{}".format(
+                format_dict["width"], height)
+
+    return format_dict
+
+def make_info_dict(index=0, n_formats=24):
+    """ Returns an info dict of a single video with 'n_formats' formats """
+    video_id = "vid{:08d}".format(index)
+    formats = [make_format(video_id, number) for number in range(n_formats)]
+
+    info_dict = {
+        "age_limit": 0,
+        "alt_title": None,
+        "annotations": None,
+        "automatic_captions": {},
+        "average_rating": 4.93,
+        "categories": ["People & Blogs"],
+        "description": "Synthetic video number {}\n\n".format(index) +
+                       "A rather long description. " * 20,
+        "display_id": video_id,
+        "duration": 60 + index % 3600,
+        "extractor": "youtube",
+        "extractor_key": "Youtube",
+        "formats": formats,
+        "id": video_id,
+        "like_count": 115,
+        "tags": ["cat", "video"],
+        "thumbnail": "https://i.example.com/vi/{}/hqdefault.jpg".format(
+            video_id),
+        "thumbnails": [{"id": "0", "url": "https://i.example.com/vi/"
+                                          "{}/hqdefault.jpg".format(video_id)}],
+        "title": "Synthetic cat video {}".format(index),
+        "upload_date": "20150706",
+        "uploader": "Bartje Bartmans",
+        "view_count": 17553,
+        "webpage_url": "https://www.youtube.com/watch?v={}".format(video_id),
+        "webpage_url_basename": "watch",
+    }
+    # like youtube_dl, the top level also describes the selected format
+    info_dict.update({
+        key: value for key, value in formats[-1].items()
+        if key != "http_headers"
+    })
+    info_dict["http_headers"] = make_http_headers()
+
+    return info_dict
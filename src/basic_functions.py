@@ -14,20 +14,124 @@ def h_m_s_time(seconds):
 
     return (duration_h, duration_m, duration_s)
 
-def get_format_by_id(format_id, ytdl_info_dict):
+def human_size(num_bytes):
+    """ Returns a byte count as a short human-readable text, e.g. 3.4 MiB """
+    if num_bytes < 1024:
+        return "{} B".format(int(num_bytes))
+
+    for unit in ("KiB", "MiB", "GiB"):
+        num_bytes /= 1024
+        if num_bytes < 1024:
+            break
+
+    return "{:.1f} {}".format(num_bytes, unit)
+
+def progress_text(progress_state):
+    """
+    Returns a short description of a download's progress (a ProgressState),
+    e.g. "42 % · 1.3 MiB/s · 0:01:05 left"
+    """
+    fraction = progress_state.fraction()
+    if fraction is not None:
+        parts = ["{:.0f} %".format(fraction * 100)]
+    else:
+        parts = [human_size(progress_state.downloaded_bytes)]
+
+    if progress_state.speed:
+        parts.append("{}/s".format(human_size(progress_state.speed)))
+
+    if progress_state.eta is not None:
+        eta_h, eta_m, eta_s = h_m_s_time(progress_state.eta)
+        parts.append(_("{}:{:02d}:{:02d} left").format(eta_h, eta_m, eta_s))
+
+    return " · ".join(parts)
+
+def duration_text(ytdl_info_dict):
     """
-    Searches given ytdl_info_dict and returns the (first) format dict that
-    has the given format_id
+    Returns the video's duration as "h:mm:ss", or "--:--:--" for videos
+    whose duration cannot be extracted
     """
+    if "duration" not in ytdl_info_dict or ytdl_info_dict["duration"] is None:
+        return "--:--:--"
+
+    # Convert time from seconds to h:m:s
+    dur_h, dur_m, dur_s = h_m_s_time(ytdl_info_dict["duration"])
+    # {:02d} means numbers are 2 digits long and padded with 0s if nec.
+    return "{}:{:02d}:{:02d}".format(dur_h, dur_m, dur_s)
+
+def hosting_name(ytdl_info_dict):
+    """ Returns the name of the website hosting the video """
+    if "extractor_key" in ytdl_info_dict:
+        return ytdl_info_dict["extractor_key"]
+    # not sure if all websites provide the more readable extractor_key
+    else:
+        return ytdl_info_dict["extractor"]
+
+def split_urls(text):
+    """
+    Returns a list of the video addresses found in the given text (e.g.
+    clipboard contents with one address per line). If nothing in the text
+    looks like an address, the whole (stripped) text is returned as the only
+    item, so that the user gets told it is not a valid address.
+    """
+    urls = [
+        word for word in text.split()
+        if word.startswith(("http://", "https://", "www."))
+    ]
+
+    if urls:
+        return urls
+    elif text.strip():
+        return [text.strip()]
+    else:
+        return []
+
+def index_formats(ytdl_info_dict):
+    """
+    Returns a {format_id: format dict} index of the formats in
+    ytdl_info_dict; the dict itself isn't changed. VideoItem keeps such an
+    index of its formats. If more formats share an ID, the first one is
+    indexed.
+    """
+    formats_by_id = {}
+
     for format_dict in ytdl_info_dict["formats"]:
+        formats_by_id.setdefault(format_dict["format_id"], format_dict)
+
+    return formats_by_id
+
+def get_format_by_id(format_id, ytdl_info_dict):
+    """
+    Returns the (first) format dict in given ytdl_info_dict that has
+    the given format_id, or None if there is no such format.
+    VideoItems are looked up in their index; youtube_dl's own dicts,
+    which are only looked at once or twice, are searched.
+    """
+    formats_by_id = getattr(ytdl_info_dict, "_formats_by_id", None)
+    if formats_by_id is not None:
+        return formats_by_id.get(format_id)
+
+    for format_dict in ytdl_info_dict.get("formats") or ():
         if format_dict["format_id"] == format_id:
             return format_dict
-        else:
-            pass
 
-    # if no correct format dict is found:
+    # a video with a single format is its own format dict
+    if ytdl_info_dict.get("format_id") == format_id:
+        return ytdl_info_dict
+
     return None
 
+def download_path(ytdl_info_dict, format_id, download_dir):
+    """
+    Returns the path the video is saved to in the given format. It only
+    depends on the video and format, so an interrupted download is
+    continued in the same (.part) file.
+    """
+    extension = get_format_by_id(format_id, ytdl_info_dict)["ext"]
+
+    return "{}/{} (fmt {}).{}".format(
+        download_dir, ytdl_info_dict["title"], format_id, extension)
+
 def human_readable_format(format_id, ytdl_info_dict, short=False):
     """
     Returns a string containing detailed, human-readable description
@@ -137,3 +241,48 @@ def is_both_a_v(formats_item):
     else:
         return False
 
+def format_quality(format_dict):
+    """
+    Returns a sort key ranking formats by quality: by height, then fps,
+    then total bitrate, then audio bitrate. Missing values count as 0.
+    """
+    return (
+        format_dict.get("height") or 0,
+        format_dict.get("fps") or 0,
+        format_dict.get("tbr") or 0,
+        format_dict.get("abr") or 0,
+    )
+
+def classify_formats(formats_list):
+    """
+    Sorts the given formats into a/v, video-only and audio-only ones in
+    a single pass (with the same rules as is_both_a_v, is_video_only and
+    is_audio_only) and returns the three lists as a tuple. Each list is
+    ordered by format_quality from the worst to the best format, so the
+    last item is always the highest quality one.
+    """
+    available_a_v_s = []
+    available_video_s = []
+    available_audio_s = []
+
+    for format_dict in formats_list:
+        # Some websites provide little information; by default evaluate to a/v
+        if "acodec" not in format_dict or "vcodec" not in format_dict:
+            available_a_v_s.append(format_dict)
+            continue
+
+        has_audio = format_dict["acodec"] != "none"
+        has_video = format_dict["vcodec"] != "none"
+
+        if has_audio and has_video:
+            available_a_v_s.append(format_dict)
+        elif has_video:
+            available_video_s.append(format_dict)
+        elif has_audio:
+            available_audio_s.append(format_dict)
+
+    available_a_v_s.sort(key=format_quality)
+    available_video_s.sort(key=format_quality)
+    available_audio_s.sort(key=format_quality)
+
+    return (available_a_v_s, available_video_s, available_audio_s)
@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Headless CatFetch: downloads videos without the GTK window, for servers and
+scripts. Uses the same extraction, format selection and download queue as
+the application and reports what is going on as JSON lines on stdout.
+
+    catfetch_cli.py download [-i FILE] [-o DIR] [-j JOBS] ...
+        downloads the addresses listed in FILE (or given on stdin)
+
+    catfetch_cli.py serve [--socket PATH] [-o DIR] [-j JOBS] ...
+        keeps running and accepts addresses over a Unix socket; events of
+        the videos sent over a connection are written back to it
+
+This must stay importable without GTK (no gi, no main_win & co.).
+"""
+
+import io
+import os
+import sys
+import json
+import argparse
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Lock, Thread, Event
+
+import basic_functions as bf
+import ytdl_wrapper as yw
+import log_sink
+import instrument
+import metrics
+from download_queue import (DownloadQueue, DownloadJob,
+                            DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST_LIMIT)
+from video_item import VideoItem
+from progress import ProgressBoard, REFRESH_RATE
+
+# How many addresses or playlist entries are extracted at once
+EXTRACTION_WORKERS = 4
+
+
+def default_socket_path():
+    """ Returns where the daemon listens unless told otherwise """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, "catfetch.sock")
+
+
+class Downloader(object):
+    """
+    The pipeline shared by all batches: an extraction pool, the download
+    queue and the progress board. Progress is reported at most
+    REFRESH_RATE times per second per video by a reporter thread, the same
+    way the window repaints it.
+    """
+
+    def __init__(self, jobs=DEFAULT_MAX_WORKERS,
+                 per_host_limit=DEFAULT_PER_HOST_LIMIT,
+                 extraction_workers=EXTRACTION_WORKERS):
+        self.extraction_pool = ThreadPoolExecutor(
+            max_workers=extraction_workers
+        )
+        self.download_queue = DownloadQueue(
+            yw.download_vid, max_workers=jobs, per_host_limit=per_host_limit,
+            status_callback=self.download_status_changed,
+            progress_callback=self.download_progress
+        )
+        self.progress_board = ProgressBoard()
+
+        self._stop = Event()
+        reporter = Thread(target=self._report_progress)
+        reporter.daemon = True
+        reporter.start()
+
+    def download_status_changed(self, job):
+        """ Runs (in a worker thread) when a download changes its status """
+        job.item.job_changed(job)
+        if job.status in ("downloaded", "failed"):
+            self.progress_board.forget(job)
+
+    def download_progress(self, job, hook_dict):
+        """ Runs (in a worker thread) for every progress report """
+        self.progress_board.update(job, hook_dict)
+
+    def stop(self):
+        """ Stops the progress reporter """
+        self._stop.set()
+
+    def _report_progress(self):
+        """ Reporter thread """
+        while not self._stop.wait(1 / REFRESH_RATE):
+            for job in self.progress_board.take_dirty():
+                if job.status != "downloading":
+                    continue
+                state = self.progress_board.state(job)
+                job.item.emit({
+                    "event": "progress",
+                    "url": job.url,
+                    "downloaded_bytes": state.downloaded_bytes,
+                    "total_bytes": state.total_bytes,
+                    "speed": state.speed,
+                    "eta": state.eta,
+                })
+
+
+class Batch(object):
+    """
+    Addresses submitted together (a file, stdin or one socket connection).
+    Each of them is extracted, playlists are resolved entry by entry and
+    every video is queued for download in its default format (or in
+    'format_id' if it has one). Events are passed to 'emit' as dicts;
+    wait() returns once everything has been downloaded or has failed.
+    """
+
+    def __init__(self, downloader, emit, download_dir, format_id=None):
+        self.downloader = downloader
+        self.emit = emit
+        self.download_dir = download_dir
+        self.format_id = format_id
+
+        # number of extractions and downloads not finished yet
+        self.unfinished = 0
+        self.failed = 0
+        self.condition = Condition()
+        # video keys (see yw.video_key) of addresses and videos seen so far;
+        # the same video may come from more than one address
+        self.seen_keys = set()
+
+    def add(self, url):
+        """ Starts extracting the given address. May be called repeatedly. """
+        self._started()
+        self.downloader.extraction_pool.submit(self.extract, url)
+
+    def extract(self, url, entry=None):
+        """
+        Runs in the extraction pool; extracts an address (or resolves a flat
+        playlist 'entry') and queues the video(s) found
+        """
+        try:
+            # other forms of an address seen before aren't even extracted
+            if entry is None and not self.first_time(yw.video_key(url)):
+                return
+
+            if entry is not None:
+                info_dict = yw.extract_entry_info(entry)
+            else:
+                info_dict = yw.extract_vid_info(url, flat=True)
+
+            # see MainWindow.url_evaluate
+            if info_dict["extractor_key"] == "Generic":
+                raise ValueError("No supported video found at this address")
+
+            if info_dict.get("_type") == "playlist":
+                # as MainWindow.add_playlist_entries does
+                for each_entry in yw.playlist_videos(info_dict):
+                    if yw.is_flat_entry(each_entry):
+                        self._started()
+                        self.downloader.extraction_pool.submit(
+                            self.extract, each_entry["url"], each_entry
+                        )
+                    else:
+                        self.enqueue(each_entry)
+            else:
+                self.enqueue(info_dict)
+        except Exception as error:
+            self.emit({"event": "error", "url": url, "error": str(error)})
+            with self.condition:
+                self.failed += 1
+        finally:
+            self._finished()
+
+    def enqueue(self, info_dict):
+        """ Selects the format of an extracted video and queues it """
+        video_item = VideoItem(info_dict)
+        url = video_item.webpage_url
+
+        key = yw.info_key(video_item) or url
+        if not self.first_time(key):
+            return
+
+        format_id = video_item.default_format_id
+        if self.format_id is not None:
+            if bf.get_format_by_id(self.format_id, video_item) is None:
+                self.emit({"event": "error", "url": url,
+                           "error": "Format {} not available".format(
+                               self.format_id)})
+                with self.condition:
+                    self.failed += 1
+                return
+            format_id = self.format_id
+
+        where = bf.download_path(video_item, format_id, self.download_dir)
+        self.emit({
+            "event": "extracted",
+            "url": url,
+            "title": video_item.title,
+            "format_id": format_id,
+            "format": bf.human_readable_format(format_id, video_item),
+            "filename": where,
+        })
+
+        self._started()
+        self.downloader.download_queue.submit(
+            DownloadJob(url, format_id, where, item=self, key=key)
+        )
+
+    def job_changed(self, job):
+        """ Reports a download's new status (called by the Downloader) """
+        event = {"event": "status", "url": job.url, "status": job.status}
+        if job.error is not None:
+            event["error"] = str(job.error)
+        self.emit(event)
+
+        if job.status == "failed":
+            with self.condition:
+                self.failed += 1
+        if job.status in ("downloaded", "failed"):
+            self._finished()
+
+    def first_time(self, key):
+        """ Returns True if the given video key hasn't been seen before """
+        with self.condition:
+            if key in self.seen_keys:
+                return False
+            self.seen_keys.add(key)
+            return True
+
+    def wait(self):
+        """ Blocks until all extractions and downloads are done """
+        with self.condition:
+            while self.unfinished:
+                self.condition.wait()
+
+    def _started(self):
+        with self.condition:
+            self.unfinished += 1
+
+    def _finished(self):
+        with self.condition:
+            self.unfinished -= 1
+            if not self.unfinished:
+                self.condition.notify_all()
+
+
+def json_emitter(stream):
+    """
+    Returns an emit function writing events to 'stream' as JSON lines;
+    events come from many threads, so lines are written one at a time
+    """
+    lock = Lock()
+
+    def emit(event):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with lock:
+            try:
+                stream.write(line)
+                stream.flush()
+            except (OSError, ValueError):
+                # nobody's listening anymore (e.g. the client disconnected)
+                pass
+
+    return emit
+
+
+def run_download(args):
+    """ The 'download' command; returns the exit status """
+    downloader = Downloader(args.jobs, args.per_host, args.extractors)
+    batch = Batch(downloader, json_emitter(sys.stdout), args.output_dir,
+                  args.format)
+
+    if args.input == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.input) as input_file:
+            text = input_file.read()
+
+    for line in text.splitlines():
+        for url in bf.split_urls(line):
+            if url:
+                batch.add(url)
+
+    batch.wait()
+    downloader.stop()
+
+    return 1 if batch.failed else 0
+
+
+class JobRequestHandler(socketserver.StreamRequestHandler):
+    """
+    One connection to the daemon. Each line sent is an address, or a JSON
+    object {"url": ..., "format_id": ..., "dir": ...} (only "url" is
+    required). Once the client is done sending (shuts down its side or
+    closes the connection), the handler waits until all its videos are
+    finished; events are written back as JSON lines.
+    """
+
+    def handle(self):
+        server = self.server
+        emit = json_emitter(
+            io.TextIOWrapper(self.wfile, encoding="utf-8", write_through=True)
+        )
+        batches = {}
+
+        for raw_line in self.rfile:
+            line = raw_line.decode("utf-8", "replace").strip()
+            if not line:
+                continue
+
+            if line.startswith("{"):
+                try:
+                    request = json.loads(line)
+                    url = request["url"]
+                except (ValueError, KeyError):
+                    emit({"event": "error", "error": "Invalid request"})
+                    continue
+            else:
+                request = {}
+                url = line
+
+            # videos with the same options share a batch
+            options = (request.get("dir") or server.download_dir,
+                       request.get("format_id"))
+            if options not in batches:
+                batches[options] = Batch(server.downloader, emit, *options)
+            batches[options].add(url)
+
+        for batch in batches.values():
+            batch.wait()
+        emit({"event": "done",
+              "failed": sum(batch.failed for batch in batches.values())})
+
+
+class JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ The daemon's socket server; every connection gets its own thread """
+    daemon_threads = True
+
+    def __init__(self, socket_path, downloader, download_dir):
+        self.downloader = downloader
+        self.download_dir = download_dir
+        socketserver.UnixStreamServer.__init__(self, socket_path,
+                                               JobRequestHandler)
+
+
+def run_serve(args):
+    """ The 'serve' command; runs until interrupted """
+    # a socket left behind by a daemon which didn't exit cleanly
+    if os.path.exists(args.socket):
+        os.unlink(args.socket)
+
+    downloader = Downloader(args.jobs, args.per_host, args.extractors)
+    server = JobServer(args.socket, downloader, args.output_dir)
+    # only the user running the daemon may send it jobs
+    os.chmod(args.socket, 0o600)
+
+    print(json.dumps({"event": "listening", "socket": args.socket}),
+          flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        downloader.stop()
+
+    return 0
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="catfetch_cli.py",
+        description="Download videos without the graphical interface."
+    )
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    download_parser = commands.add_parser(
+        "download", help="download addresses from a file or stdin"
+    )
+    download_parser.add_argument(
+        "-i", "--input", default="-",
+        help="file with addresses, one or more per line (default: stdin)"
+    )
+    download_parser.add_argument(
+        "-f", "--format", default=None,
+        help="format ID to download (default: the best with audio and video)"
+    )
+
+    serve_parser = commands.add_parser(
+        "serve", help="accept addresses over a Unix socket"
+    )
+    serve_parser.add_argument(
+        "--socket", default=default_socket_path(),
+        help="socket path (default: %(default)s)"
+    )
+
+    for command_parser in (download_parser, serve_parser):
+        command_parser.add_argument(
+            "-o", "--output-dir", default=os.getcwd(),
+            help="where to save videos (default: current directory)"
+        )
+        command_parser.add_argument(
+            "-j", "--jobs", type=int, default=DEFAULT_MAX_WORKERS,
+            help="videos downloaded at once (default: %(default)s)"
+        )
+        command_parser.add_argument(
+            "--per-host", type=int, default=DEFAULT_PER_HOST_LIMIT,
+            help="videos downloaded at once from one host "
+                 "(default: %(default)s)"
+        )
+        command_parser.add_argument(
+            "--extractors", type=int, default=EXTRACTION_WORKERS,
+            help="addresses extracted at once (default: %(default)s)"
+        )
+        command_parser.add_argument(
+            "--limit-rate", type=int, default=0, metavar="KIB",
+            help="total download speed limit in KiB/s (default: none)"
+        )
+        command_parser.add_argument(
+            "--host-limit-rate", type=int, default=0, metavar="KIB",
+            help="speed limit of downloads from one website in KiB/s "
+                 "(default: none)"
+        )
+        command_parser.add_argument(
+            "--timings", metavar="FILE",
+            help="time every phase of every address and save the timings "
+                 "in FILE (JSON) at the end"
+        )
+        command_parser.add_argument(
+            "--segments", type=int, default=yw.get_download_segments(),
+            help="connections used to download one file, where the server "
+                 "allows it (default: %(default)s)"
+        )
+        command_parser.add_argument(
+            "--metrics-file", metavar="FILE",
+            help="write Prometheus metrics to FILE every "
+                 "CATFETCH_METRICS_INTERVAL seconds (default: 15)"
+        )
+        command_parser.add_argument(
+            "--metrics-port", type=int, metavar="PORT",
+            help="serve Prometheus metrics on 127.0.0.1:PORT/metrics"
+        )
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    rate_limiter = yw.get_rate_limiter()
+    rate_limiter.set_rate(args.limit_rate * 1024)
+    rate_limiter.set_per_host_rate(args.host_limit_rate * 1024)
+    yw.set_download_segments(args.segments)
+    if args.timings:
+        instrument.get_instrument().set_enabled(True)
+    # the options, or CATFETCH_METRICS_FILE / CATFETCH_METRICS_PORT
+    metrics_server = metrics.start_exporters(args.metrics_file,
+                                             args.metrics_port)
+    if metrics_server is not None:
+        log_sink.get_sink().log(
+            log_sink.INFO, "Metrics served at http://127.0.0.1:{}/metrics"
+            .format(metrics_server.port))
+
+    try:
+        if args.command == "download":
+            return run_download(args)
+        return run_serve(args)
+    finally:
+        if args.timings:
+            instrument.get_instrument().export(args.timings)
+        metrics.stop_exporters()
+        # write out log records the background writer hasn't got to yet
+        log_sink.get_sink().close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import heapq
+import time
+from itertools import count
+from threading import Thread, Condition
+from urllib.parse import urlsplit
+
+import instrument
+import metrics
+
+# How many videos can be downloaded at the same time, in total
+DEFAULT_MAX_WORKERS = 3
+# How many videos can be downloaded at the same time from a single host;
+# None means there is no per-host limit
+DEFAULT_PER_HOST_LIMIT = 2
+
+# Lower numbers are downloaded first
+PRIORITY_HIGH = -10
+PRIORITY_NORMAL = 0
+
+
+class DownloadCancelled(Exception):
+    """
+    Raised from the progress hook of a job cancelled by
+    DownloadQueue.clear(), which stops its download
+    """
+
+
+class DownloadJob(object):
+    """
+    A single video waiting in (or taken from) the DownloadQueue. 'item' is
+    whatever the caller wants to get back in status callbacks, e.g. the
+    central_item_dict entry of the video. 'key' identifies the video in
+    the instrument's timings (see instrument), by default its address.
+    """
+
+    def __init__(self, url, format_id, where, item=None,
+                 priority=PRIORITY_NORMAL, key=None):
+        self.url = url
+        self.key = key or url
+        self.format_id = format_id
+        self.where = where
+        self.item = item
+        self.priority = priority
+        # Per-host limits are checked against this
+        self.host = urlsplit(url).hostname or ""
+        # "queued", "downloading", "downloaded", "failed" or "cancelled"
+        self.status = "queued"
+        # set by DownloadQueue.clear()
+        self.cancelled = False
+        self.error = None
+        # time.monotonic() of submit(), for the instrument's queue wait
+        self.queued_at = None
+
+
+class DownloadQueue(object):
+    """
+    Central download queue. Jobs are handed out to a pool of worker threads
+    which never grows above 'max_workers'; no more than 'per_host_limit'
+    jobs run against the same host at once.
+
+    With order="fifo" jobs are started in the order they were submitted,
+    with order="priority" jobs with a lower 'priority' number go first
+    (and the submission order is kept among jobs of the same priority).
+    """
+
+    def __init__(self, download_function, max_workers=DEFAULT_MAX_WORKERS,
+                 per_host_limit=DEFAULT_PER_HOST_LIMIT, order="priority",
+                 status_callback=None, progress_callback=None):
+        if order not in ("fifo", "priority"):
+            raise ValueError("Unknown queue order: {}".format(order))
+
+        # Called as download_function(url, format_id, where) in a worker;
+        # with a progress_callback, also with progress_hook=<function>
+        self.download_function = download_function
+        # Called as status_callback(job) whenever a job changes its status;
+        # runs in a worker thread, so GTK code must use GLib.idle_add
+        self.status_callback = status_callback
+        # Called as progress_callback(job, hook_dict) for every progress
+        # report of a running download, in its worker thread
+        self.progress_callback = progress_callback
+        self.order = order
+
+        self._max_workers = max_workers
+        self._per_host_limit = per_host_limit
+
+        # heap of (priority, sequence number, job)
+        self._heap = []
+        self._sequence = count()
+        # host: number of jobs currently running against it
+        self._running_per_host = {}
+        self._running = 0
+        # jobs being downloaded right now
+        self._running_jobs = set()
+        self._workers = 0
+
+        self._condition = Condition()
+
+    def submit(self, job):
+        """ Puts a DownloadJob into the queue """
+        priority = job.priority if self.order == "priority" else 0
+        job.queued_at = time.monotonic()
+
+        with self._condition:
+            heapq.heappush(self._heap, (priority, next(self._sequence), job))
+            metrics.QUEUE_DEPTH.inc()
+            self._spawn_workers()
+            # a waiting worker may be able to take it
+            self._condition.notify_all()
+
+        self._report(job)
+
+    def set_max_workers(self, max_workers):
+        """ Changes the size of the worker pool at runtime """
+        with self._condition:
+            self._max_workers = max_workers
+            self._spawn_workers()
+            # Superfluous workers notice the change and quit
+            self._condition.notify_all()
+
+    def set_per_host_limit(self, per_host_limit):
+        """ Changes the per-host concurrency cap at runtime """
+        with self._condition:
+            self._per_host_limit = per_host_limit
+            self._condition.notify_all()
+
+    def clear(self):
+        """
+        Cancels all jobs: queued ones are dropped, running ones stop at
+        their next progress report (only with a progress_callback) and end
+        up "cancelled" instead of "downloaded" or "failed"
+        """
+        with self._condition:
+            dropped = [entry[2] for entry in self._heap]
+            self._heap = []
+            metrics.QUEUE_DEPTH.dec(len(dropped))
+            for job in dropped + list(self._running_jobs):
+                job.cancelled = True
+
+        for job in dropped:
+            job.status = "cancelled"
+            self._report(job)
+
+    def pending(self):
+        """ Returns the number of jobs still waiting for a worker """
+        with self._condition:
+            return len(self._heap)
+
+    def running(self):
+        """ Returns the number of jobs being downloaded right now """
+        with self._condition:
+            return self._running
+
+    def _spawn_workers(self):
+        """
+        Starts new worker threads if there is queued work and the pool
+        isn't full yet. Must be called with self._condition held.
+        """
+        idle_workers = self._workers - self._running
+        wanted = min(self._max_workers, self._running + len(self._heap))
+
+        while self._workers < wanted and idle_workers < len(self._heap):
+            self._workers += 1
+            idle_workers += 1
+            thread = Thread(target=self._worker)
+            # making this a daemon so that it stops when closing
+            # application window
+            thread.daemon = True
+            thread.start()
+
+    def _host_is_free(self, host):
+        """ Returns True if another job may be started against 'host' """
+        if self._per_host_limit is None:
+            return True
+        return self._running_per_host.get(host, 0) < self._per_host_limit
+
+    def _take_job(self):
+        """
+        Removes and returns the first queued job whose host is not at its
+        limit, or None if there is no such job.
+        Must be called with self._condition held.
+        """
+        skipped = []
+        job = None
+
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._host_is_free(entry[2].host):
+                job = entry[2]
+                break
+            skipped.append(entry)
+
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+
+        return job
+
+    def _worker(self):
+        """ Worker thread: downloads queued jobs until there are none """
+        while True:
+            with self._condition:
+                job = None
+                while job is None:
+                    if self._workers > self._max_workers or not self._heap:
+                        self._workers -= 1
+                        return
+                    job = self._take_job()
+                    if job is None:
+                        # everything left waits for a busy host
+                        self._condition.wait()
+
+                self._running += 1
+                self._running_jobs.add(job)
+                self._running_per_host[job.host] = \
+                    self._running_per_host.get(job.host, 0) + 1
+                metrics.QUEUE_DEPTH.dec()
+                metrics.ACTIVE_DOWNLOADS.inc()
+
+            job.status = "downloading"
+            self._report(job)
+
+            timings = instrument.get_instrument()
+            timings.record(job.key, "queue_wait", job.queued_at)
+            try:
+                with timings.phase(job.key, "download"):
+                    if self.progress_callback is not None:
+                        self.download_function(
+                            job.url, job.format_id, job.where,
+                            progress_hook=self.progress_hook_for(job)
+                        )
+                    else:
+                        self.download_function(job.url, job.format_id,
+                                               job.where)
+                job.status = "downloaded"
+            except Exception as error:
+                job.status = "failed"
+                job.error = error
+            if job.cancelled:
+                job.status = "cancelled"
+
+            with self._condition:
+                self._running -= 1
+                self._running_jobs.discard(job)
+                self._running_per_host[job.host] -= 1
+                metrics.ACTIVE_DOWNLOADS.dec()
+                # a host slot got free; jobs waiting for it can go now
+                self._condition.notify_all()
+
+            self._report(job)
+
+    def progress_hook_for(self, job):
+        """
+        Returns a progress hook passing progress of 'job' on; it stops the
+        download (by raising DownloadCancelled) once the job is cancelled
+        """
+        progress_callback = self.progress_callback
+
+        def progress_hook(hook_dict):
+            if job.cancelled:
+                raise DownloadCancelled(job.url)
+            progress_callback(job, hook_dict)
+
+        return progress_hook
+
+    def _report(self, job):
+        """ Passes a job's status change to the status_callback, if any """
+        if self.status_callback is not None:
+            self.status_callback(job)
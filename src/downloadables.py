@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
 
-from threading import Thread
-
 import gi
 gi.require_version('Gtk', '3.0')
 # Gio isn't used for now; may be later though
 # from gi.repository import Gtk, Gio, GLib
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
-import ytdl_wrapper as yw
 import basic_functions as bf
 from basic_functions import _
+from download_queue import PRIORITY_HIGH, PRIORITY_NORMAL
+from format_popover import FormatPopover
+from thumbnails import THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT
 
 class Downloadable(Gtk.ListBoxRow):
     """
@@ -24,12 +24,8 @@ class Downloadable(Gtk.ListBoxRow):
 
         self.main_window = main_window
         self.this_item_dict = this_item_dict
-        self.ytdl_info_dict = this_item_dict["ytdl_info_dict"]
-        self.url = self.ytdl_info_dict["webpage_url"]
-
-        # Directory where videos are saved. For now the user's Downloads dir.
-        self.default_download_dir = self.this_item_dict["default_download_dir"]
-        self.selected_download_dir = self.default_download_dir
+        self.video_item = this_item_dict["video_item"]
+        self.url = self.video_item.webpage_url
 
         # a horizontal box containing all else in this row
         # TODO: could use borders separating ListBox rows
@@ -37,21 +33,18 @@ class Downloadable(Gtk.ListBoxRow):
         self.hbox.props.margin = 5
         self.add(self.hbox)
 
-        # a box for a cover picture; placeholder for now
-        # TODO: cover picture
-        self.cover_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        # the video's thumbnail; an icon until the row comes into view
+        # and load_thumbnail gets the picture (in the background)
+        self.cover_box = cover_image()
         self.hbox.pack_start(self.cover_box, 0, 0, 5)
-        cover_placeholder = Gtk.Label("cover")
-        cover_placeholder.props.xalign = 0.5
-        cover_placeholder.props.yalign = 0.5
-        self.cover_box.add(cover_placeholder)
+        self.thumbnail_requested = False
 
         # middle part of the row; contains video info
         video_title_label = Gtk.Label()
         # Video title as a label
         # "size='large'" could also be added
         video_title_label.set_markup(
-            "<span weight='bold'>{}</span>".format(self.ytdl_info_dict["title"])
+            "<span weight='bold'>{}</span>".format(self.video_item.title)
         )
         # ellipsize characters at the end
         video_title_label.props.ellipsize = 3
@@ -65,16 +58,7 @@ class Downloadable(Gtk.ListBoxRow):
         self.video_details_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL)
 
         # For some videos, time cannot be extracted
-        if "duration" in self.ytdl_info_dict:
-            # Convert time from seconds to h:m:s
-            dur_h, dur_m, dur_s = bf.h_m_s_time(self.ytdl_info_dict["duration"])
-
-            video_duration_label = Gtk.Label(
-                # {:02d} means numbers are 2 digits long and padded with 0s if nec.
-                "{}:{:02d}:{:02d}".format(dur_h, dur_m, dur_s)
-            )
-        else:
-            video_duration_label = Gtk.Label("--:--:--")
+        video_duration_label = Gtk.Label(bf.duration_text(self.video_item))
 
         # align text to the left
         video_duration_label.props.xalign = 0
@@ -85,12 +69,7 @@ class Downloadable(Gtk.ListBoxRow):
         self.video_details_box.pack_start(separator(), 0, 0, 0)
 
         # label displaying the website hosting the video
-        if "extractor_key" in self.ytdl_info_dict:
-            video_hosting = self.ytdl_info_dict["extractor_key"]
-        # not sure if all websites provide the more readable extractor_key
-        else:
-            video_hosting = self.ytdl_info_dict["extractor"]
-
+        video_hosting = bf.hosting_name(self.video_item)
         video_hosting_label = Gtk.Label(video_hosting)
         video_hosting_label.props.xalign = 0
         self.video_details_box.pack_start(video_hosting_label, 0, 0, 0)
@@ -106,22 +85,13 @@ class Downloadable(Gtk.ListBoxRow):
 
         self.info_widget.pack_start(self.video_details_box, 0, 0, 0)
 
-        self.hbox.pack_start(self.info_widget, 1, 1, 0)
-
-        # and now a ComboBox for format selection
-        # this one contains downloads with video and audio
-        self.a_v_format_store = self.create_format_store("av")
-
-        # this one contains downloads with video only
-        self.video_format_store = self.create_format_store("v")
+        # download progress; only shown once the video is queued
+        self.progress_bar = Gtk.ProgressBar()
+        self.progress_bar.props.show_text = True
+        self.progress_bar.set_no_show_all(True)
+        self.info_widget.pack_start(self.progress_bar, 0, 0, 0)
 
-        # this one contains downloads with audio only
-        self.audio_format_store = self.create_format_store("a")
-
-        # a ComboBox containing available formats for current mode.
-        # Creating the formats selection earlier because mode selection
-        # requires it to exist
-        self.format_selection = self.create_format_selection(initial=True)
+        self.hbox.pack_start(self.info_widget, 1, 1, 0)
 
         # self.hbox.pack_end(self.format_selection, 0, 0, 0)
 
@@ -157,31 +127,6 @@ class Downloadable(Gtk.ListBoxRow):
         # format_opts_button.connect("clicked", self.show_opts_box)
 
 
-        # a ComboBox for mode selection (a/v/both)
-        self.mode_store = Gtk.ListStore(str, str)
-        self.mode_store.append(["av", _("Video and audio")])
-        self.mode_store.append(["v", _("Video only")])
-        self.mode_store.append(["a", _("Audio only")])
-
-        self.mode_selection = Gtk.ComboBox.new_with_model(self.mode_store)
-        self.mode_selection.connect("changed", self.mode_has_been_selected)
-        mode_renderer_text = Gtk.CellRendererText()
-        self.mode_selection.pack_start(mode_renderer_text, True)
-        self.mode_selection.add_attribute(mode_renderer_text, "text", 1)
-        # this specifies which columns is used by get_active_id()
-        self.mode_selection.props.id_column = 0
-        # this means the first item (Video and audio) will be pre-selected
-        self.mode_selection.props.active = 0
-        # self.av_selection_box.pack_start(self.mode_selection, 0, 0, 0)
-
-        # If there are only a/v formats available, disable the dropdown
-        # TODO: Do this more pleasantly, also avoiding creation of stores
-        if len(self.this_item_dict["available_audio_s"]) == 0 \
-        and len(self.this_item_dict["available_video_s"]) == 0:
-            self.mode_selection.props.sensitive = False
-        else:
-            pass
-
         # self.main_window.options_button = Gtk.Button("Formats")
         # self.main_window.options_button.connect("clicked", self.open_formats_dialog)
         # self.hbox.pack_end(self.options_button, 0, 0, 0)
@@ -201,6 +146,9 @@ class Downloadable(Gtk.ListBoxRow):
         self.download_item_button.set_tooltip_text(
             _("Download this video")
         )
+        # a restored video may have been queued already
+        self.download_item_button.props.sensitive = \
+            self.this_item_dict["status"] == "waiting"
         self.status_box.pack_start(self.download_item_button, 1, 1, 0)
 
         # # Button combining download and format
@@ -210,188 +158,79 @@ class Downloadable(Gtk.ListBoxRow):
         # self.download_and_format_button.set_menu(Gtk.Popover())
         # self.hbox.pack_end(self.download_and_format_button, 0, 0, 0)
 
-        # a Gtk.Box Popover
-        pop_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
-        pop_box.props.margin = 10
-
-        pop_mode_label = Gtk.Label(_("Mode:"))
-        pop_mode_label.props.xalign = 0
-        pop_format_label = Gtk.Label(_("Format:"))
-        pop_format_label.props.xalign = 0
-        pop_destination_label = Gtk.Label(_("Where to save:"))
-        pop_destination_label.props.xalign = 0
-
-        # Button used to open the filechooser (dir_chooser)
-        self.destination_button = Gtk.Button()
-        self.destination_button.connect("clicked", self.set_download_dir)
-        # tooltip show the whole path
-        self.destination_button.props.tooltip_text = self.selected_download_dir
-        self.destination_label = Gtk.Label(self.selected_download_dir)
-        # ellipsize in the middle
-        self.destination_label.props.ellipsize = 2
-        # Maximum width which is displayed fo the directory;
-        # it should be roughly similar to how long mode and format description
-        # are so 25 seems reasonable
-        self.destination_label.props.max_width_chars = 25
-        self.destination_button.add(self.destination_label)
-
-        pop_box.pack_start(pop_mode_label, 0, 0, 0)
-        pop_box.pack_start(self.mode_selection, 0, 0, 0)
-        pop_box.pack_start(pop_format_label, 0, 0, 0)
-        pop_box.pack_start(self.format_selection, 0, 0, 0)
-        pop_box.pack_start(pop_destination_label, 0, 0, 0)
-        pop_box.pack_start(self.destination_button, 0, 0, 0)
-
-        # ...from a button
-        pop_button = Gtk.MenuButton()
+        # Mode, format and destination selection live in a popover
+        # opened from a button. Most videos are downloaded in the default
+        # format, so the popover (with its format stores) is only built
+        # when the button is clicked for the first time.
+        self.popover = None
+        self.pop_button = Gtk.Button()
         # Possible icons: document-properties, applications-system
         pop_icon = Gtk.Image.new_from_icon_name(
             "document-properties-symbolic", Gtk.IconSize.BUTTON)
-        pop_button.add(pop_icon)
-        pop_button.set_tooltip_text(
+        self.pop_button.add(pop_icon)
+        self.pop_button.set_tooltip_text(
             _("Select video and audio format to download")
         )
-        popover = Gtk.Popover.new(pop_button)
-        popover.add(pop_box)
-        pop_button.set_popover(popover)
-        self.hbox.pack_end(pop_button, 0, 0, 0)
-
-        # this is needed or else the popover appears empty
-        pop_box.show_all()
+        self.pop_button.connect("clicked", self.show_popover)
+        self.hbox.pack_end(self.pop_button, 0, 0, 0)
 
+        # show the format which is pre-selected for download;
+        # this is the only format description needed up front
+        self.show_selected_format(self.this_item_dict["download_format_id"])
 
-    def get_current_mode(self):
+    def load_thumbnail(self):
         """
-        Returns currently selected 'mode' to be downloaded:
-        one of 'av', 'v', 'a'.
+        Requests the video's thumbnail from the main window's
+        ThumbnailService, once; called when the row is (nearly) visible
         """
-
-        mode = self.mode_selection.props.active_id
-        return mode
-
-    def mode_has_been_selected(self, combo):
+        if self.thumbnail_requested or not self.video_item.thumbnail:
+            return
+        self.thumbnail_requested = True
+        self.main_window.thumbnails.request(self.video_item.thumbnail,
+                                            self.thumbnail_loaded)
+
+    def thumbnail_loaded(self, url, pixbuf):
+        """ Shows the thumbnail; may be called from a worker thread """
+        if pixbuf is not None:
+            GLib.idle_add(self.cover_box.set_from_pixbuf, pixbuf)
+
+    def show_popover(self, widget):
         """
-        Runs when user selects video 'mode' (a/v/both) from menu.
-        Adjusts the specific formats menu according to 'mode'.
-        """
-
-        selected_mode = self.get_current_mode()
-
-        if selected_mode == "av":
-            store = self.a_v_format_store
-        elif selected_mode == "v":
-            store = self.video_format_store
-        elif selected_mode == "a":
-            store = self.audio_format_store
-        else:
-            exit("Error: Unknown mode {}".format(selected_mode))
-
-        self.format_selection.clear()
-        self.format_selection.set_model(store)
-
-        format_renderer_text = Gtk.CellRendererText()
-        self.format_selection.pack_start(format_renderer_text, True)
-        # that '1' at the end tells which list item should be displayed in the dropdown
-        self.format_selection.add_attribute(format_renderer_text, "text", 1)
-        # this specifies which columns is used by get_active_id()
-        self.format_selection.props.id_column = 0
-
-        # the last available item should be pre-selected; let's hope
-        # it always means the highest quality
-        last_item = len(store) - 1
-        self.format_selection.props.active = last_item
-
-    def create_format_selection(self, initial=False):
-        """
-        Creates a ComboBox listing available formats, according
-        to the currently selcted video 'mode'.
-        """
-
-        # TODO: Get rid of this 'initial' checking; can be done better
-        if initial:
-            mode = "av"
-        else:
-            mode = self.get_current_mode()
-
-        if mode == "av":
-            store = self.a_v_format_store
-        elif mode == "v":
-            store = self.video_format_store
-        elif mode == "a":
-            store = self.audio_format_store
-        else:
-            exit("Unknown media mode: {}".format(mode))
-
-        format_selection = Gtk.ComboBox.new_with_model(store)
-        format_selection.connect("changed", self.format_has_been_selected)
-        format_renderer_text = Gtk.CellRendererText()
-        format_selection.pack_start(format_renderer_text, True)
-        # that '1' at the end tells which list item should be displayed in the dropdown
-        format_selection.add_attribute(format_renderer_text, "text", 1)
-        # this specifies which columns is used by get_active_id()
-        format_selection.props.id_column = 0
-
-        # the last available item should be pre-selected; let's hope
-        # it always means the highest quality
-        last_item = len(store) - 1
-        format_selection.props.active = last_item
-
-        return format_selection
-
-    def format_has_been_selected(self, combo):
-        """
-        When the user selects a video format from list, write the format ID
-        to this item's info dict so that it can be used for download.
+        Opens the popover with download options, building it first
+        if it hasn't been opened before
         """
+        if self.popover is None:
+            self.popover = FormatPopover(
+                self.main_window, self.this_item_dict, self.pop_button,
+                format_changed=self.show_selected_format
+            )
 
-        selected_format = combo.props.active_id
-        self.this_item_dict["download_format_id"] = selected_format
-        # update the label displaying currently selected format
-        self.show_selected_format(selected_format)
+        self.popover.popup()
 
-    def create_format_store(self, mode):
+    def show_progress(self, progress_state):
         """
-        Returns a GTK 'ListStore' containing video formats for given 'mode',
-        in the form of (str: format_id, str: format_name).
+        Updates the progress bar according to the item's status and
+        the given ProgressState
         """
-
-        if mode == "av":
-            # this one contains downloads with video and audio
-            format_store = Gtk.ListStore(str, str)
-
-            for av_format in self.this_item_dict["available_a_v_s"]:
-                format_id = av_format["format_id"]
-                format_name = bf.human_readable_format(
-                    format_id, self.ytdl_info_dict, short=True
-                )
-                format_store.append([format_id, format_name])
-
-        elif mode == "v":
-            # this one contains downloads with video only
-            format_store = Gtk.ListStore(str, str)
-
-            for video_format in self.this_item_dict["available_video_s"]:
-                format_id = video_format["format_id"]
-                format_name = bf.human_readable_format(
-                    format_id, self.ytdl_info_dict, short=True
-                )
-                format_store.append([format_id, format_name])
-
-        elif mode == "a":
-            # this one contains downloads with audio only
-            format_store = Gtk.ListStore(str, str)
-
-            for audio_format in self.this_item_dict["available_audio_s"]:
-                format_id = audio_format["format_id"]
-                format_name = bf.human_readable_format(
-                    format_id, self.ytdl_info_dict, short=True
-                )
-                format_store.append([format_id, format_name])
-
+        status = self.this_item_dict["status"]
+        self.progress_bar.show()
+
+        if status == "queued":
+            self.progress_bar.set_fraction(0)
+            self.progress_bar.set_text(_("Queued"))
+        elif status == "downloaded":
+            self.progress_bar.set_fraction(1)
+            self.progress_bar.set_text(_("Downloaded"))
+        elif status == "failed":
+            self.progress_bar.set_text(_("Download failed"))
         else:
-            return None
-
-        return format_store
+            fraction = progress_state.fraction()
+            # Some websites don't tell the size in advance
+            if fraction is None:
+                self.progress_bar.pulse()
+            else:
+                self.progress_bar.set_fraction(fraction)
+            self.progress_bar.set_text(bf.progress_text(progress_state))
 
     def remove_item(self, widget):
         """
@@ -401,53 +240,99 @@ class Downloadable(Gtk.ListBoxRow):
         row_widget = self.this_item_dict["listbox_row"]
         self.main_window.downloadables_listbox.remove(row_widget)
         del self.main_window.central_item_dict[self.url]
+        self.main_window.queue_store.remove(self.url)
 
     def download_item(self, widget):
         """
-        Starts downloading this video based on selected 'format ID'
-        obtained from this item's info dict.
+        Puts this video into the main window's download queue based on
+        selected 'format ID' obtained from this item's info dict.
         """
 
-        widget.props.sensitive = False
+        self.download_item_button.props.sensitive = False
 
-        url = self.url
-        format_id = self.this_item_dict["download_format_id"]
-        format_dict = bf.get_format_by_id(format_id, self.ytdl_info_dict)
-
-        # Default dir or selected by the popover button
-        downloads_dir = self.selected_download_dir
-
-        title = self.ytdl_info_dict["title"]
-        extension = format_dict["ext"]
-
-        # This is where we create the actual download path and filename
-        where = "{}/{} (fmt {}).{}".format(
-            downloads_dir, title, format_id, extension)
+        # A single video requested with its own button jumps ahead of
+        # videos queued with 'Download All'
+        if widget is self.download_item_button:
+            priority = PRIORITY_HIGH
+        else:
+            priority = PRIORITY_NORMAL
 
-        # yw.download_vid(url, format_id, where)
-        thread = Thread(target=yw.download_vid, args=(url, format_id, where,))
-        # making this a daemon so that it stops when closing application window
-        thread.daemon = True
-        thread.start()
+        self.main_window.queue_download(self.this_item_dict, priority)
 
     def show_selected_format(self, format_id):
         """
         Updates text listing information about the currently selected video
         format -- self.selected_format_label
         """
-        hum_readable = bf.human_readable_format(format_id, self.ytdl_info_dict)
+        hum_readable = bf.human_readable_format(format_id, self.video_item)
         self.selected_format_label.set_markup("<b>{}</b>".format(hum_readable))
 
-    def set_download_dir(self, widget):
-        """
-        Runs the filechooser and updates the self.selected_download_dir variable
-        """
-        self.main_window.dir_chooser(self)
-        destination_text = self.selected_download_dir
-        self.destination_label.set_text(destination_text)
-        self.destination_button.props.tooltip_text = destination_text
 
 
+class PendingDownloadable(Gtk.ListBoxRow):
+    """
+    Placeholder row for a playlist entry whose details are still being
+    extracted. It shows whatever the playlist itself told us (usually the
+    title) and is replaced by a full Downloadable once the details arrive.
+    """
+
+    def __init__(self, main_window, this_item_dict):
+        super(Gtk.ListBoxRow, self).__init__()
+
+        self.main_window = main_window
+        self.this_item_dict = this_item_dict
+        flat_entry = this_item_dict["flat_entry"]
+
+        self.hbox = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=5)
+        self.hbox.props.margin = 5
+        self.add(self.hbox)
+
+        # same placeholder as in Downloadable, to keep rows aligned
+        self.cover_box = cover_image()
+        self.hbox.pack_start(self.cover_box, 0, 0, 5)
+
+        # Some playlists don't even provide titles of their videos
+        title = flat_entry.get("title") or flat_entry["url"]
+        video_title_label = Gtk.Label()
+        video_title_label.set_markup(
+            "<span weight='bold'>{}</span>".format(title)
+        )
+        video_title_label.props.ellipsize = 3
+        video_title_label.props.xalign = 0
+
+        self.status_label = Gtk.Label(_("Loading video details…"))
+        self.status_label.props.xalign = 0
+        self.status_label.props.ellipsize = 3
+
+        self.info_widget = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.info_widget.pack_start(video_title_label, 1, 0, 0)
+        self.info_widget.pack_start(self.status_label, 0, 0, 0)
+        self.hbox.pack_start(self.info_widget, 1, 1, 0)
+
+        self.spinner = Gtk.Spinner()
+        self.hbox.pack_end(self.spinner, 0, 0, 0)
+        self.spinner.start()
+
+    def load_thumbnail(self):
+        """ There's no thumbnail before the details are extracted """
+        pass
+
+    def show_error(self, error_msg):
+        """ Tells the user that this entry's details couldn't be extracted """
+        self.spinner.stop()
+        self.status_label.set_text(error_msg)
+        self.status_label.props.tooltip_text = error_msg
+
+
+def cover_image():
+    """
+    Returns a Gtk.Image with a placeholder icon, the size of a thumbnail,
+    to show a video's thumbnail in
+    """
+    image = Gtk.Image.new_from_icon_name("video-x-generic-symbolic",
+                                         Gtk.IconSize.DIALOG)
+    image.set_size_request(THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT)
+    return image
 
 def separator():
     """
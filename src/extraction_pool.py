@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+
+import ytdl_wrapper as yw
+import log_sink
+import instrument
+import metrics
+from video_item import VideoItem
+
+
+def prune(ytdl_info_dict):
+    """
+    Returns what the window needs of an extracted info dict: a VideoItem
+    for a video; for a playlist, a small dict with its "_type",
+    "extractor_key" and "entries" (see yw.playlist_videos: VideoItems, or
+    for entries still to be resolved, dicts with their "url", "title" and
+    "ie_key")
+    """
+    if ytdl_info_dict.get("_type") != "playlist":
+        return VideoItem(ytdl_info_dict)
+
+    entries = []
+    for entry_dict in yw.playlist_videos(ytdl_info_dict):
+        if yw.is_flat_entry(entry_dict):
+            entries.append({
+                "url": entry_dict["url"],
+                "title": entry_dict.get("title"),
+                "ie_key": entry_dict.get("ie_key"),
+            })
+        else:
+            entries.append(VideoItem(entry_dict))
+
+    return {
+        "_type": "playlist",
+        "extractor_key": ytdl_info_dict["extractor_key"],
+        "entries": entries,
+    }
+
+def init_worker():
+    """
+    Runs in every new worker process. Log records are kept in memory only
+    and handed over to the window's process with each result, and so are
+    the extraction metrics (see metrics.Registry.take); timings are taken
+    by the window's process (ProcessExtractor.extract); youtube_dl is
+    loaded right away instead of during the first extraction.
+    """
+    log_sink.set_sink(log_sink.LogSink())
+    instrument.set_instrument(instrument.Instrument())
+    yw.warm_up()
+
+def extract_pruned(url, use_cache=True, flat=False, ie_key=None):
+    """
+    Runs in a worker process: extract_vid_info, pruned by prune(). Returns
+    (pruned result, None, log records, metric changes) or, if the address
+    can't be extracted, (None, error message, log records, metric changes).
+    Other errors (e.g. of the info cache) come back the same way, logged
+    with their traceback, rather than as exceptions of the future.
+    """
+    sink = log_sink.get_sink()
+    try:
+        result = prune(yw.extract_vid_info(url, use_cache=use_cache,
+                                           flat=flat, ie_key=ie_key))
+        error_msg = None
+    except yw.ExtractionError as error:
+        result = None
+        error_msg = str(error)
+    except Exception as error:
+        result = None
+        error_msg = "{}: {}".format(type(error).__name__, error)
+        with sink.context(url, "extract"):
+            sink.log(log_sink.ERROR, traceback.format_exc())
+
+    # a worker runs one extraction at a time, so whatever is in its log
+    # buffer is about this address
+    records = sink.records()
+    sink.clear()
+
+    # likewise the metrics, counted from zero again for the next address
+    return result, error_msg, records, metrics.REGISTRY.take()
+
+
+class ProcessExtractor(object):
+    """
+    Runs extractions in a pool of worker processes, so that parsing pages
+    and running extractors doesn't compete with the GTK main loop for the
+    GIL. Only pruned results (see prune) are sent back.
+
+    extract() has the signature of ytdl_wrapper.extract_vid_info and blocks
+    until the result is there; it is meant to be called from the threads of
+    the window's extraction pool, which just wait for the processes.
+    If a worker process dies, extractions it took down fail with an
+    ExtractionError and the pool is replaced with a new one.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+
+        # Forking a process running GTK and threads isn't safe; new workers
+        # are forked from a clean server process (which doesn't import the
+        # main script, only this module) or, where that's not available,
+        # started from scratch
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            self._context = multiprocessing.get_context("forkserver")
+            self._context.set_forkserver_preload([__name__])
+        else:
+            self._context = multiprocessing.get_context("spawn")
+
+        self._lock = Lock()
+        self._pool = self._new_pool()
+
+    def extract(self, url, use_cache=True, flat=False, ie_key=None):
+        """
+        Extracts 'url' in a worker process; returns the pruned result,
+        raises ExtractionError if the address can't be extracted
+        """
+        pool = self._pool
+        try:
+            # timed here: that's how long the window waits for it
+            with instrument.get_instrument().phase(
+                    yw.video_key(url, ie_key), "extract"):
+                future = pool.submit(extract_pruned, url, use_cache, flat,
+                                     ie_key)
+                result, error_msg, records, metric_changes = future.result()
+        except BrokenProcessPool:
+            self._replace_pool(pool)
+            raise yw.ExtractionError(
+                "The extraction process ended unexpectedly"
+            )
+
+        log_sink.get_sink().add_records(records)
+        metrics.REGISTRY.merge(metric_changes)
+
+        if error_msg is not None:
+            raise yw.ExtractionError(error_msg)
+        return result
+
+    def close(self):
+        """ Stops the worker processes; pending extractions are dropped """
+        with self._lock:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=self._context,
+            initializer=init_worker
+        )
+
+    def _replace_pool(self, broken_pool):
+        """
+        Replaces 'broken_pool' with a new pool, unless another extraction
+        which failed with it has done so already
+        """
+        with self._lock:
+            if self._pool is broken_pool:
+                self._pool = self._new_pool()
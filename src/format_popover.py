@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk
+
+import basic_functions as bf
+from basic_functions import _
+
+class FormatPopover(Gtk.Popover):
+    """
+    Popover with the download options of one video: 'mode' (a/v, video only,
+    audio only), format and the directory where to save it. Selections are
+    written into the item's dict ("download_format_id", "download_dir").
+    Used by the Downloadable rows as well as by the compact QueueView.
+    """
+
+    def __init__(self, main_window, this_item_dict, relative_to,
+                 format_changed=None, download=None):
+        super(FormatPopover, self).__init__()
+        self.set_relative_to(relative_to)
+
+        self.main_window = main_window
+        self.this_item_dict = this_item_dict
+        self.video_item = this_item_dict["video_item"]
+        # Called as format_changed(format_id) after the user picks a format
+        self.format_changed = format_changed
+
+        # The format picked before (or by default) decides which mode
+        # is pre-selected
+        initial_mode = self.mode_of_format(
+            this_item_dict.get("download_format_id")
+        )
+
+        # a ComboBox containing available formats for current mode.
+        # Creating the formats selection earlier because mode selection
+        # requires it to exist
+        self.format_selection = Gtk.ComboBox()
+        self.format_selection.connect("changed", self.format_has_been_selected)
+
+        # a ComboBox for mode selection (a/v/both)
+        self.mode_store = Gtk.ListStore(str, str)
+        self.mode_store.append(["av", _("Video and audio")])
+        self.mode_store.append(["v", _("Video only")])
+        self.mode_store.append(["a", _("Audio only")])
+
+        self.mode_selection = Gtk.ComboBox.new_with_model(self.mode_store)
+        self.mode_selection.connect("changed", self.mode_has_been_selected)
+        mode_renderer_text = Gtk.CellRendererText()
+        self.mode_selection.pack_start(mode_renderer_text, True)
+        self.mode_selection.add_attribute(mode_renderer_text, "text", 1)
+        # this specifies which columns is used by get_active_id()
+        self.mode_selection.props.id_column = 0
+        # this fills in the formats selection too
+        self.mode_selection.props.active_id = initial_mode
+
+        # If there are only a/v formats available, disable the dropdown
+        if len(self.video_item.audio_formats) == 0 \
+        and len(self.video_item.video_formats) == 0:
+            self.mode_selection.props.sensitive = False
+
+        pop_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=5)
+        pop_box.props.margin = 10
+
+        pop_mode_label = Gtk.Label(_("Mode:"))
+        pop_mode_label.props.xalign = 0
+        pop_format_label = Gtk.Label(_("Format:"))
+        pop_format_label.props.xalign = 0
+        pop_destination_label = Gtk.Label(_("Where to save:"))
+        pop_destination_label.props.xalign = 0
+
+        # Button used to open the filechooser (dir_chooser)
+        download_dir = self.this_item_dict["download_dir"]
+        self.destination_button = Gtk.Button()
+        self.destination_button.connect("clicked", self.set_download_dir)
+        # tooltip show the whole path
+        self.destination_button.props.tooltip_text = download_dir
+        self.destination_label = Gtk.Label(download_dir)
+        # ellipsize in the middle
+        self.destination_label.props.ellipsize = 2
+        # Maximum width which is displayed fo the directory;
+        # it should be roughly similar to how long mode and format description
+        # are so 25 seems reasonable
+        self.destination_label.props.max_width_chars = 25
+        self.destination_button.add(self.destination_label)
+
+        pop_box.pack_start(pop_mode_label, 0, 0, 0)
+        pop_box.pack_start(self.mode_selection, 0, 0, 0)
+        pop_box.pack_start(pop_format_label, 0, 0, 0)
+        pop_box.pack_start(self.format_selection, 0, 0, 0)
+        pop_box.pack_start(pop_destination_label, 0, 0, 0)
+        pop_box.pack_start(self.destination_button, 0, 0, 0)
+
+        # Where the popover isn't shown next to a download button (the
+        # compact list), it gets one of its own
+        if download is not None:
+            download_button = Gtk.Button(_("Download"))
+            download_button.connect("clicked", lambda button: download())
+            download_button.props.sensitive = \
+                self.this_item_dict["status"] == "waiting"
+            pop_box.pack_start(download_button, 0, 0, 0)
+
+        # What YoutubeDL said while working on this video
+        log_button = Gtk.Button(_("Show log"))
+        log_button.connect(
+            "clicked",
+            lambda button: self.main_window.show_log_dialog(this_item_dict)
+        )
+        pop_box.pack_start(log_button, 0, 0, 0)
+
+        self.add(pop_box)
+
+        # this is needed or else the popover appears empty
+        pop_box.show_all()
+
+    def mode_of_format(self, format_id):
+        """
+        Returns the 'mode' ('av', 'v' or 'a') whose list contains the format
+        with the given ID; 'av' by default
+        """
+        for mode, formats in (("v", self.video_item.video_formats),
+                              ("a", self.video_item.audio_formats)):
+            for format_info in formats:
+                if format_info.format_id == format_id:
+                    return mode
+
+        return "av"
+
+    def get_current_mode(self):
+        """
+        Returns currently selected 'mode' to be downloaded:
+        one of 'av', 'v', 'a'.
+        """
+
+        mode = self.mode_selection.props.active_id
+        return mode
+
+    def mode_has_been_selected(self, combo):
+        """
+        Runs when user selects video 'mode' (a/v/both) from menu.
+        Adjusts the specific formats menu according to 'mode'.
+        """
+
+        selected_mode = self.get_current_mode()
+        store = self.create_format_store(selected_mode)
+
+        if store is None:
+            exit("Error: Unknown mode {}".format(selected_mode))
+
+        self.format_selection.clear()
+        self.format_selection.set_model(store)
+
+        format_renderer_text = Gtk.CellRendererText()
+        self.format_selection.pack_start(format_renderer_text, True)
+        # that '1' at the end tells which list item should be displayed in the dropdown
+        self.format_selection.add_attribute(format_renderer_text, "text", 1)
+        # this specifies which columns is used by get_active_id()
+        self.format_selection.props.id_column = 0
+
+        # Keep the format picked before if it is in this mode; otherwise
+        # the last available item should be pre-selected; formats are
+        # ordered by quality, so it's the best one
+        selected_format = self.this_item_dict.get("download_format_id")
+        if selected_format is None \
+        or not self.format_selection.set_active_id(selected_format):
+            last_item = len(store) - 1
+            self.format_selection.props.active = last_item
+
+    def format_has_been_selected(self, combo):
+        """
+        When the user selects a video format from list, write the format ID
+        to this item's info dict so that it can be used for download.
+        """
+
+        selected_format = combo.props.active_id
+        if selected_format is None:
+            return
+
+        self.this_item_dict["download_format_id"] = selected_format
+        self.main_window.persist_item(self.this_item_dict)
+        # update the label displaying currently selected format
+        if self.format_changed is not None:
+            self.format_changed(selected_format)
+
+    def create_format_store(self, mode):
+        """
+        Returns a GTK 'ListStore' containing video formats for given 'mode',
+        in the form of (str: format_id, str: format_name).
+        """
+
+        if mode == "av":
+            # this one contains downloads with video and audio
+            formats = self.video_item.a_v_formats
+        elif mode == "v":
+            # this one contains downloads with video only
+            formats = self.video_item.video_formats
+        elif mode == "a":
+            # this one contains downloads with audio only
+            formats = self.video_item.audio_formats
+        else:
+            return None
+
+        format_store = Gtk.ListStore(str, str)
+
+        for format_info in formats:
+            format_id = format_info.format_id
+            format_name = bf.human_readable_format(
+                format_id, self.video_item, short=True
+            )
+            format_store.append([format_id, format_name])
+
+        return format_store
+
+    def set_download_dir(self, widget):
+        """
+        Runs the filechooser and updates the item's "download_dir"
+        """
+        location = self.main_window.dir_chooser()
+
+        if location is not None:
+            self.this_item_dict["download_dir"] = location
+            self.main_window.persist_item(self.this_item_dict)
+            self.destination_label.set_text(location)
+            self.destination_button.props.tooltip_text = location
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import json
+import base64
+import hashlib
+import http.client
+import urllib.error
+import urllib.request
+import urllib.response
+from urllib.parse import urlsplit
+from threading import Lock
+
+# Response headers which aren't stored: they are private or meaningless
+# when replayed
+SKIPPED_HEADERS = frozenset(("set-cookie", "date", "expires"))
+
+
+class FixtureMissing(urllib.error.URLError):
+    """
+    Raised in replay mode for a request which wasn't recorded; YoutubeDL
+    reports it like any other network error
+    """
+
+    def __init__(self, method, url):
+        super(FixtureMissing, self).__init__(
+            "No recorded response for {} {}".format(method, url)
+        )
+
+
+def exchange_key(method, url, data):
+    """ Returns the name a request's exchange is stored under """
+    digest = hashlib.sha1(
+        "{} {}\n".format(method, url).encode("utf-8") + (data or b"")
+    )
+    return digest.hexdigest()
+
+def loose_key(method, url):
+    """
+    Returns what identifies a request apart from its query and body; used
+    when the exact request wasn't recorded (e.g. because the query contains
+    a timestamp or a random token)
+    """
+    parts = urlsplit(url)
+    return "{} {}://{}{}".format(method, parts.scheme, parts.netloc, parts.path)
+
+
+class FixtureStore(object):
+    """
+    Directory of recorded HTTP exchanges, one JSON file per request (named
+    by exchange_key) with the status, headers and body of the response.
+    Bodies are stored as text where they are UTF-8, so fixtures can be read
+    and edited by hand, and base64 otherwise.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = Lock()
+        # key: exchange dict
+        self._exchanges = {}
+        # loose key: keys of the exchanges not replayed yet, in the order
+        # they were recorded
+        self._unused = {}
+
+        names = [name for name in os.listdir(self.path)
+                 if name.endswith(".json")]
+        exchanges = []
+        for name in names:
+            with open(os.path.join(self.path, name), encoding="utf-8") as f:
+                exchanges.append(json.load(f))
+        for exchange in sorted(exchanges, key=lambda e: e["recorded"]):
+            self._add(exchange)
+
+    def record(self, method, url, data, final_url, status, reason, headers,
+               body):
+        """ Stores an exchange, replacing one recorded for the same request """
+        try:
+            body_text, encoding = body.decode("utf-8"), "text"
+        except UnicodeDecodeError:
+            body_text, encoding = base64.b64encode(body).decode("ascii"), \
+                "base64"
+
+        with self._lock:
+            exchange = {
+                "key": exchange_key(method, url, data),
+                "method": method,
+                "url": url,
+                "final_url": final_url,
+                "status": status,
+                "reason": reason,
+                "headers": [[name, value] for name, value in headers
+                            if name.lower() not in SKIPPED_HEADERS],
+                "body_encoding": encoding,
+                "body": body_text,
+                # order of recording, for matching by loose key
+                "recorded": len(self._exchanges),
+            }
+            path = os.path.join(self.path, exchange["key"] + ".json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(exchange, f, indent=1, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+            self._add(exchange)
+
+    def find(self, method, url, data):
+        """
+        Returns the exchange recorded for the request, or the next unused
+        one recorded for the same address without query; None if there is
+        neither
+        """
+        with self._lock:
+            exchange = self._exchanges.get(exchange_key(method, url, data))
+            unused = self._unused.get(loose_key(method, url), [])
+            if exchange is None and unused:
+                exchange = self._exchanges[unused[0]]
+            if exchange is not None and exchange["key"] in unused:
+                unused.remove(exchange["key"])
+            return exchange
+
+    def _add(self, exchange):
+        """ Indexes an exchange. Needs the lock (or runs in __init__). """
+        key = exchange["key"]
+        self._exchanges[key] = exchange
+        unused = self._unused.setdefault(
+            loose_key(exchange["method"], exchange["url"]), [])
+        if key not in unused:
+            unused.append(key)
+
+
+def exchange_response(exchange):
+    """
+    Returns a response object like the ones of urllib for a recorded
+    exchange, or raises the HTTPError urllib would have raised
+    """
+    if exchange["body_encoding"] == "base64":
+        body = base64.b64decode(exchange["body"])
+    else:
+        body = exchange["body"].encode("utf-8")
+
+    headers = http.client.HTTPMessage()
+    for name, value in exchange["headers"]:
+        headers[name] = value
+
+    if exchange["status"] >= 400:
+        raise urllib.error.HTTPError(exchange["final_url"], exchange["status"],
+                                     exchange["reason"], headers,
+                                     io.BytesIO(body))
+    return urllib.response.addinfourl(io.BytesIO(body), headers,
+                                      exchange["final_url"], exchange["status"])
+
+
+class FixtureOpener(object):
+    """
+    Stands in for the URL opener of a YoutubeDL (its _opener; everything an
+    extractor downloads goes through its open()). While fixtures are
+    recorded, responses of the real opener are stored in the FixtureStore
+    on their way through; while they are replayed, responses come from the
+    store only and the network isn't used at all. When neither is on,
+    requests go straight to the real opener.
+    """
+
+    def __init__(self, opener):
+        self.opener = opener
+
+    def open(self, request, data=None, timeout=None):
+        store, mode = _store, _mode
+        if store is None:
+            return self.opener.open(request, data, timeout)
+
+        if isinstance(request, str):
+            request = urllib.request.Request(request)
+        if data is not None:
+            request.data = data
+        method = request.get_method()
+        url = request.get_full_url()
+
+        if mode == "replay":
+            exchange = store.find(method, url, request.data)
+            if exchange is None:
+                raise FixtureMissing(method, url)
+            return exchange_response(exchange)
+
+        try:
+            response = self.opener.open(request, timeout=timeout)
+        except urllib.error.HTTPError as error:
+            # recorded too: extractors look at some error pages
+            body = error.read()
+            store.record(method, url, request.data, error.geturl(), error.code,
+                         error.reason, error.headers.items(), body)
+            raise urllib.error.HTTPError(error.geturl(), error.code,
+                                         error.reason, error.headers,
+                                         io.BytesIO(body))
+
+        # the body is read whole here; it's a web page or an API response
+        # (media files aren't downloaded through info YoutubeDLs)
+        body = response.read()
+        store.record(method, url, request.data, response.geturl(),
+                     response.status, getattr(response, "reason", "OK"),
+                     response.headers.items(), body)
+        return urllib.response.addinfourl(io.BytesIO(body), response.headers,
+                                          response.geturl(), response.status)
+
+    def __getattr__(self, name):
+        # add_handler() etc. of the real opener
+        return getattr(self.opener, name)
+
+
+# The store used by all FixtureOpeners and whether it's being recorded
+# ("record") or replayed ("replay"); set from CATFETCH_RECORD_DIR or
+# CATFETCH_REPLAY_DIR, or by use_fixtures()
+_store = None
+_mode = None
+
+def use_fixtures(mode=None, path=None):
+    """
+    Starts recording ("record") or replaying ("replay") the exchanges in
+    directory 'path'; mode=None goes back to the network
+    """
+    global _store, _mode
+    _store = FixtureStore(path) if mode is not None else None
+    _mode = mode
+
+def fixtures_active():
+    return _store is not None
+
+def install(ydl):
+    """
+    Puts a FixtureOpener in front of the opener of the given YoutubeDL
+    if fixtures are being recorded or replayed
+    """
+    if _store is not None and not isinstance(ydl._opener, FixtureOpener):
+        ydl._opener = FixtureOpener(ydl._opener)
+
+
+if os.environ.get("CATFETCH_REPLAY_DIR"):
+    use_fixtures("replay", os.environ["CATFETCH_REPLAY_DIR"])
+elif os.environ.get("CATFETCH_RECORD_DIR"):
+    use_fixtures("record", os.environ["CATFETCH_RECORD_DIR"])
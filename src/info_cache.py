@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import sqlite3
+import time
+import zlib
+from threading import Lock
+
+# Extracted format URLs usually expire after some hours, so cached info
+# can't be kept for too long
+DEFAULT_TTL = 3 * 60 * 60
+# Upper bound on the (compressed) size of all cached entries, in bytes
+DEFAULT_MAX_SIZE = 64 * 1048576
+# How long to wait for another process (e.g. an extraction worker, see
+# extraction_pool) to finish writing to the database, in seconds
+BUSY_TIMEOUT = 30
+
+
+def default_cache_path():
+    """ Returns the path of the cache database in the user's cache dir """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "catfetch", "info_cache.sqlite")
+
+
+class InfoCache(object):
+    """
+    Persistent cache of extracted info dicts, stored in an SQLite database
+    as zlib-compressed JSON. Entries older than 'ttl' seconds are ignored;
+    when the stored entries grow over 'max_size' bytes, the least recently
+    used ones are dropped.
+    """
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.path = path or default_cache_path()
+        self.ttl = ttl
+        self.max_size = max_size
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # The connection is shared by all extraction threads; the lock
+        # makes sure only one of them uses it at a time
+        self._lock = Lock()
+        self._db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                                   check_same_thread=False)
+        # every extraction process has its own connection; with WAL they
+        # can read while one of them writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS info ("
+            " url TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS info_last_used ON info (last_used)"
+        )
+        self._db.commit()
+
+    def get(self, url):
+        """
+        Returns the cached info dict for 'url', or None if there is none
+        or it has expired
+        """
+        now = time.time()
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data, created FROM info WHERE url = ?", (url,)
+            ).fetchone()
+
+            if row is None:
+                return None
+
+            data, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM info WHERE url = ?", (url,))
+                self._db.commit()
+                return None
+
+            self._db.execute(
+                "UPDATE info SET last_used = ? WHERE url = ?", (now, url)
+            )
+            self._db.commit()
+
+        return json.loads(zlib.decompress(data).decode("utf-8"))
+
+    def put(self, url, info_dict):
+        """ Stores 'info_dict' under 'url', replacing any older entry """
+        now = time.time()
+        # Some extractors put non-JSON values (e.g. datetimes) into the dict;
+        # their string form is good enough for us
+        data = zlib.compress(
+            json.dumps(info_dict, default=str).encode("utf-8")
+        )
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO info VALUES (?, ?, ?, ?, ?)",
+                (url, data, len(data), now, now)
+            )
+            self._evict()
+            self._db.commit()
+
+    def clear(self):
+        """ Drops all cached entries """
+        with self._lock:
+            self._db.execute("DELETE FROM info")
+            self._db.commit()
+
+    def _evict(self):
+        """
+        Deletes expired entries and then the least recently used ones until
+        the cache fits into self.max_size. Must be called with the lock held.
+        """
+        self._db.execute(
+            "DELETE FROM info WHERE created < ?", (time.time() - self.ttl,)
+        )
+
+        total_size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM info"
+        ).fetchone()[0]
+
+        if total_size <= self.max_size:
+            return
+
+        # Walk from the least recently used entry and delete until it fits
+        oldest_first = self._db.execute(
+            "SELECT url, size FROM info ORDER BY last_used ASC"
+        ).fetchall()
+
+        for url, size in oldest_first:
+            if total_size <= self.max_size:
+                break
+            self._db.execute("DELETE FROM info WHERE url = ?", (url,))
+            total_size -= size
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+import os
+import io
+import json
+import time
+import cProfile
+import pstats
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, current_thread
+
+# Phases timed for every address; see where Instrument.phase is used
+PHASES = ("extract", "add_new_video", "row_wait", "add_listbox_row",
+          "queue_wait", "download")
+
+# How often the main loop heartbeat runs, in ms; a heartbeat that comes
+# later than that means the main loop was busy (a stall)
+HEARTBEAT_MS = 10
+# Stalls shorter than this (ms) aren't recorded
+MIN_STALL_MS = 20
+# How many timings and stalls are kept; the oldest ones are dropped
+DEFAULT_CAPACITY = 20000
+# How many lines of profile statistics / allocation sites are exported
+TOP_LINES = 40
+
+
+def default_export_dir():
+    """ Returns where timings are exported by default (the state dir) """
+    state_home = os.environ.get("XDG_STATE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_home, "catfetch")
+
+
+class Timing(object):
+    """ How long one phase took for one address """
+    __slots__ = ("url", "phase", "start", "duration", "thread")
+
+    def __init__(self, url, phase, start, duration, thread):
+        self.url = url
+        self.phase = phase
+        # time.monotonic() values
+        self.start = start
+        self.duration = duration
+        self.thread = thread
+
+
+class Instrument(object):
+    """
+    Opt-in timing of what happens to each address: how long each of PHASES
+    took, plus how long the GLib main loop was stalled (see
+    watch_main_loop). Nothing is recorded while it's disabled, and the
+    timing helpers return right away. The 'url' of the timings is the video
+    key of the address (see ytdl_wrapper.video_key), so that all phases of
+    a video are grouped together however its address was given.
+
+    The phase named 'profile_phase' is also run under cProfile, and the
+    one named 'trace_phase' under tracemalloc (what it allocated, by
+    source line); both add up over all runs of the phase and are included
+    in export(). Only one run at a time is profiled or traced; runs of the
+    phase meanwhile in other threads are just timed.
+    """
+
+    def __init__(self, enabled=False, profile_phase=None, trace_phase=None,
+                 capacity=DEFAULT_CAPACITY):
+        self.enabled = enabled
+        self.profile_phase = profile_phase
+        self.trace_phase = trace_phase
+
+        self._lock = Lock()
+        self._timings = deque(maxlen=capacity)
+        # (start, duration) of main loop stalls
+        self._stalls = deque(maxlen=capacity)
+        # (url, phase): start of phases begun but not ended yet
+        self._open = {}
+        self._origin = time.monotonic()
+        self._origin_time = time.time()
+
+        self._capturing = False
+        self._profile_stats = None
+        # source line: [size, count] allocated in traced phases
+        self._allocations = {}
+
+        self._watching = False
+        self._heartbeat_running = False
+        self._last_beat = None
+
+    def set_enabled(self, enabled):
+        """ Starts or stops recording """
+        self.enabled = enabled
+        if enabled and self._watching and not self._heartbeat_running:
+            self._start_heartbeat()
+
+    @contextmanager
+    def phase(self, url, name):
+        """ Times the code in the with block as phase 'name' of 'url' """
+        if not self.enabled:
+            yield
+            return
+
+        profile = trace = started_tracing = False
+        if name in (self.profile_phase, self.trace_phase):
+            with self._lock:
+                if not self._capturing:
+                    self._capturing = True
+                    profile = name == self.profile_phase
+                    trace = name == self.trace_phase
+
+        if trace:
+            # tracing slows down every allocation, so it's only on during
+            # the phase (unless someone else had it on already)
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            snapshot = take_snapshot()
+        if profile:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler is running (e.g. python -m cProfile)
+                profile = False
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            if profile:
+                profiler.disable()
+                self._add_profile(profiler)
+            if trace:
+                self._add_allocations(snapshot)
+                if started_tracing:
+                    tracemalloc.stop()
+            if profile or trace:
+                with self._lock:
+                    self._capturing = False
+            self.record(url, name, start, end)
+
+    def begin(self, url, name):
+        """
+        Starts phase 'name' of 'url' which ends elsewhere (e.g. in another
+        thread) with end()
+        """
+        if self.enabled:
+            with self._lock:
+                self._open[(url, name)] = time.monotonic()
+
+    def end(self, url, name):
+        """ Ends a phase started with begin(); ignored if it wasn't """
+        if not self._open:
+            return
+        with self._lock:
+            start = self._open.pop((url, name), None)
+        if start is not None:
+            self.record(url, name, start)
+
+    def record(self, url, name, start, end=None):
+        """ Records phase 'name' of 'url' lasting from 'start' to 'end' """
+        if not self.enabled:
+            return
+        if end is None:
+            end = time.monotonic()
+        timing = Timing(url, name, start, end - start, current_thread().name)
+        with self._lock:
+            self._timings.append(timing)
+
+    def watch_main_loop(self):
+        """
+        Records stalls of the GLib main loop while enabled: a heartbeat
+        runs every HEARTBEAT_MS and notes how late it got to run.
+        Call from the main thread.
+        """
+        self._watching = True
+        if self.enabled and not self._heartbeat_running:
+            self._start_heartbeat()
+
+    def _start_heartbeat(self):
+        # imported here: the rest of this module works without GTK
+        from gi.repository import GLib
+
+        self._heartbeat_running = True
+        self._last_beat = time.monotonic()
+        GLib.timeout_add(HEARTBEAT_MS, self._heartbeat)
+
+    def _heartbeat(self):
+        now = time.monotonic()
+        late_ms = (now - self._last_beat) * 1000 - HEARTBEAT_MS
+        self._last_beat = now
+        if late_ms >= MIN_STALL_MS:
+            with self._lock:
+                self._stalls.append((now - late_ms / 1000, late_ms / 1000))
+
+        # the heartbeat stops while disabled; set_enabled starts it again
+        self._heartbeat_running = self.enabled
+        return self.enabled
+
+    def _add_profile(self, profiler):
+        with self._lock:
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profiler)
+            else:
+                self._profile_stats.add(profiler)
+
+    def _add_allocations(self, snapshot_before):
+        """ Adds what was allocated since 'snapshot_before', by line """
+        differences = take_snapshot().compare_to(snapshot_before, "lineno")
+        with self._lock:
+            for difference in differences:
+                if difference.size_diff <= 0:
+                    continue
+                frame = difference.traceback[0]
+                line = "{}:{}".format(frame.filename, frame.lineno)
+                totals = self._allocations.setdefault(line, [0, 0])
+                totals[0] += difference.size_diff
+                totals[1] += difference.count_diff
+
+    def clear(self):
+        """ Forgets everything recorded so far """
+        with self._lock:
+            self._timings.clear()
+            self._stalls.clear()
+            self._open.clear()
+            self._profile_stats = None
+            self._allocations = {}
+
+    def summary(self):
+        """
+        Returns {phase: {count, total_ms, mean_ms, p50_ms, p95_ms, max_ms}}
+        of the recorded timings, plus "main_loop_stall" for the stalls
+        """
+        with self._lock:
+            durations = {}
+            for timing in self._timings:
+                durations.setdefault(timing.phase, []).append(timing.duration)
+            durations["main_loop_stall"] = [duration for _, duration
+                                            in self._stalls]
+
+        summary = {}
+        for phase, values in durations.items():
+            if not values:
+                continue
+            values.sort()
+            summary[phase] = {
+                "count": len(values),
+                "total_ms": sum(values) * 1000,
+                "mean_ms": sum(values) / len(values) * 1000,
+                "p50_ms": values[len(values) // 2] * 1000,
+                "p95_ms": values[int(len(values) * 0.95)] * 1000,
+                "max_ms": values[-1] * 1000,
+            }
+        return summary
+
+    def as_dict(self):
+        """
+        Returns everything recorded, ready for JSON: the summary, timings
+        grouped by address (in the order they started; times in seconds
+        since the instrument was created), stalls and captures
+        """
+        summary = self.summary()
+
+        with self._lock:
+            timings = sorted(self._timings, key=lambda timing: timing.start)
+            stalls = list(self._stalls)
+            profile_stats = self._profile_stats
+            allocations = sorted(self._allocations.items(),
+                                 key=lambda item: -item[1][0])[:TOP_LINES]
+
+            by_url = {}
+            for timing in timings:
+                by_url.setdefault(timing.url, []).append({
+                    "phase": timing.phase,
+                    "start_s": round(timing.start - self._origin, 6),
+                    "duration_ms": round(timing.duration * 1000, 3),
+                    "thread": timing.thread,
+                })
+
+        exported = {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S",
+                                     time.localtime(self._origin_time)),
+            "summary": summary,
+            "urls": by_url,
+            "main_loop_stalls": [
+                {"start_s": round(start - self._origin, 6),
+                 "duration_ms": round(duration * 1000, 3)}
+                for start, duration in stalls
+            ],
+        }
+
+        if profile_stats is not None:
+            text = io.StringIO()
+            profile_stats.stream = text
+            profile_stats.sort_stats("cumulative").print_stats(TOP_LINES)
+            exported["profile"] = {"phase": self.profile_phase,
+                                   "stats": text.getvalue().splitlines()}
+        if allocations:
+            exported["allocations"] = {
+                "phase": self.trace_phase,
+                "top_lines": [{"line": line, "size_bytes": size,
+                               "count": count}
+                              for line, (size, count) in allocations],
+            }
+
+        return exported
+
+    def export(self, path=None):
+        """
+        Writes as_dict() as JSON to 'path' (by default a new file in
+        the state dir); returns the path
+        """
+        if path is None:
+            path = os.path.join(default_export_dir(), "timings-{}.json".format(
+                time.strftime("%Y%m%d-%H%M%S")))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        with open(path, "w", encoding="utf-8") as export_file:
+            json.dump(self.as_dict(), export_file, indent=1)
+        return path
+
+
+def take_snapshot():
+    """ Returns a tracemalloc snapshot without tracemalloc's own memory """
+    return tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+
+
+# The process-wide instrument; created on first use by get_instrument()
+_instrument = None
+_instrument_lock = Lock()
+
+def set_instrument(instrument):
+    """ Replaces the process-wide instrument """
+    global _instrument
+    _instrument = instrument
+
+def get_instrument():
+    """
+    Returns the process-wide instrument, creating it on first use; it's
+    enabled by CATFETCH_INSTRUMENT=1. CATFETCH_PROFILE and
+    CATFETCH_TRACEMALLOC name a phase to profile / trace (and enable it).
+    """
+    global _instrument
+
+    if _instrument is None:
+        with _instrument_lock:
+            if _instrument is None:
+                profile_phase = os.environ.get("CATFETCH_PROFILE") or None
+                trace_phase = os.environ.get("CATFETCH_TRACEMALLOC") or None
+                enabled = os.environ.get("CATFETCH_INSTRUMENT", "") \
+                    not in ("", "0") or bool(profile_phase or trace_phase)
+                _instrument = Instrument(enabled, profile_phase, trace_phase)
+
+    return _instrument
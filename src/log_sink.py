@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from threading import Thread, Event, Lock, current_thread, local
+
+# Levels are those of the standard logging module
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+# How many records the in-memory buffer keeps (the oldest are dropped)
+DEFAULT_CAPACITY = 5000
+# How often the background writer moves records to the log file, in seconds
+WRITE_INTERVAL = 0.5
+# The log file is rotated at this size, keeping this many old files
+MAX_FILE_SIZE = 1048576
+BACKUP_COUNT = 3
+
+
+def default_log_path():
+    """ Returns the path of the log file in the user's state dir """
+    state_home = os.environ.get("XDG_STATE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_home, "catfetch", "catfetch.log")
+
+
+class LogRecord(object):
+    """ One log message, tagged with what was being done and where """
+    __slots__ = ("created", "level", "url", "phase", "thread", "message")
+
+    def __init__(self, level, message, url, phase, thread):
+        self.created = time.time()
+        self.level = level
+        self.message = message
+        self.url = url
+        self.phase = phase
+        self.thread = thread
+
+    def as_dict(self):
+        """ Returns the record as a JSON-friendly dict """
+        return {
+            "time": self.created,
+            "level": logging.getLevelName(self.level),
+            "url": self.url,
+            "phase": self.phase,
+            "thread": self.thread,
+            "message": self.message,
+        }
+
+
+class LogSink(object):
+    """
+    Collects log records from all threads without blocking them on I/O.
+
+    Records at or above 'level' are appended to a bounded ring buffer (read
+    by the per-item log viewer) and to a bounded queue which a background
+    thread drains, every WRITE_INTERVAL seconds, into a rotating log file
+    of JSON lines, skipping records below 'file_level'. Appending to a
+    deque is atomic, so logging threads never wait for each other or for
+    the writer; if the writer falls behind, the oldest records are dropped.
+
+    Each record is tagged with the calling thread's context (item URL and
+    phase, see context) and the thread's name.
+    """
+
+    def __init__(self, path=None, level=DEBUG, file_level=INFO,
+                 capacity=DEFAULT_CAPACITY):
+        self.path = path
+        self.level = level
+        self.file_level = file_level
+
+        self._ring = deque(maxlen=capacity)
+        self._unwritten = deque(maxlen=capacity)
+        self._context = local()
+
+        self._file_handler = None
+        self._write_lock = Lock()
+        self._stop = Event()
+        if self.path is not None:
+            self._writer = Thread(target=self._write_loop)
+            self._writer.daemon = True
+            self._writer.start()
+
+    @contextmanager
+    def context(self, url, phase):
+        """
+        Within this 'with' block, records logged by the calling thread are
+        tagged with the given item URL and phase (e.g. "extract", "download")
+        """
+        context = self._context
+        previous = (getattr(context, "url", None),
+                    getattr(context, "phase", None))
+        context.url, context.phase = url, phase
+        try:
+            yield
+        finally:
+            context.url, context.phase = previous
+
+    def log(self, level, message):
+        """ Records a message; cheap enough to be called for every block """
+        if level < self.level:
+            return
+
+        context = self._context
+        record = LogRecord(
+            level, message,
+            getattr(context, "url", None), getattr(context, "phase", None),
+            current_thread().name
+        )
+        self._ring.append(record)
+        if level >= self.file_level:
+            self._unwritten.append(record)
+
+    def add_records(self, records):
+        """
+        Adds records logged elsewhere (e.g. by an extraction process, see
+        extraction_pool) as if they had been logged here
+        """
+        for record in records:
+            if record.level < self.level:
+                continue
+            self._ring.append(record)
+            if record.level >= self.file_level:
+                self._unwritten.append(record)
+
+    def clear(self):
+        """ Drops all buffered records """
+        self._ring.clear()
+
+    def records(self, urls=None, level=DEBUG):
+        """
+        Returns buffered records (oldest first) at or above 'level'; only
+        those tagged with one of the given item URLs if 'urls' is given
+        """
+        # copying a deque doesn't let other threads in, unlike iterating it
+        return [
+            record for record in self._ring.copy()
+            if record.level >= level and (urls is None or record.url in urls)
+        ]
+
+    def format_record(self, record):
+        """ Returns a one-line, human-readable form of the record """
+        return "{} {:7} {:8} [{}] {}".format(
+            time.strftime("%H:%M:%S", time.localtime(record.created)),
+            logging.getLevelName(record.level), record.phase or "-",
+            record.thread, record.message
+        )
+
+    def flush(self):
+        """ Writes all records waiting for the background writer """
+        if self.path is None:
+            return
+
+        with self._write_lock:
+            if self._file_handler is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._file_handler = RotatingFileHandler(
+                    self.path, maxBytes=MAX_FILE_SIZE,
+                    backupCount=BACKUP_COUNT, encoding="utf-8", delay=True
+                )
+
+            handler = self._file_handler
+            while self._unwritten:
+                record = self._unwritten.popleft()
+                line = json.dumps(record.as_dict(), ensure_ascii=False)
+                handler.emit(logging.makeLogRecord({"msg": line}))
+
+            handler.flush()
+
+    def close(self):
+        """ Stops the background writer after writing what's left """
+        self._stop.set()
+        self.flush()
+
+    def _write_loop(self):
+        """ Background writer thread """
+        while not self._stop.wait(WRITE_INTERVAL):
+            if self._unwritten:
+                self.flush()
+
+
+# The application-wide sink; created on first use by get_sink()
+_sink = None
+_sink_lock = Lock()
+
+def set_sink(sink):
+    """ Makes the given LogSink the one returned by get_sink() """
+    global _sink
+
+    with _sink_lock:
+        _sink = sink
+
+def get_sink():
+    """
+    Returns the shared LogSink, creating it on first use. CATFETCH_LOG_LEVEL
+    (e.g. "DEBUG", "WARNING") sets the lowest level written to the log file.
+    """
+    global _sink
+
+    with _sink_lock:
+        if _sink is None:
+            file_level = logging.getLevelName(
+                os.environ.get("CATFETCH_LOG_LEVEL", "INFO").upper()
+            )
+            if not isinstance(file_level, int):
+                file_level = INFO
+            _sink = LogSink(default_log_path(), file_level=file_level)
+
+    return _sink
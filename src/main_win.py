@@ -1,16 +1,36 @@
 #!/usr/bin/env python3
 
-from threading import Thread
+import os
+import traceback
+from threading import Lock, Thread
+from concurrent.futures import ThreadPoolExecutor
 
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk, Gdk, GLib
 
-import youtube_dl
 import basic_functions as bf
 from basic_functions import _
 import ytdl_wrapper as yw
-from downloadables import Downloadable
+import log_sink
+from downloadables import Downloadable, PendingDownloadable
+from download_queue import DownloadQueue, DownloadJob, PRIORITY_NORMAL
+from row_inserter import RowInserter
+from queue_view import QueueView
+from video_item import VideoItem
+from extraction_pool import ProcessExtractor
+from singleflight import SingleFlight
+from progress import ProgressBoard, REFRESH_RATE
+from queue_store import QueueStore
+from thumbnails import ThumbnailService
+import instrument
+import metrics
+
+# How many addresses or playlist entries can have their details
+# extracted at once
+EXTRACTION_WORKERS = 4
+# How long to wait (ms) after scrolling before loading thumbnails
+THUMBNAIL_DELAY = 100
 
 class MainWindow(Gtk.Window):
     """
@@ -27,13 +47,85 @@ class MainWindow(Gtk.Window):
         # {
         #   "https://video-address.net/example":
         #     {
-        #       "ytdl_info_dict":   <dict>,
-        #       "listbox_row":      a <ListBoxRow> instance,
-        #       "status":           "waiting" or "downloaded" or "downloading"
+        #       "video_item":       a <VideoItem> instance,
+        #       "listbox_row":      a <ListBoxRow> instance (or "tree_row",
+        #                           a <TreeRowReference>, in compact view),
+        #       "download_format_id": format selected for download,
+        #       "download_dir":     where the video is to be saved,
+        #       "status":           "waiting", "queued", "downloading",
+        #                           "downloaded" or "failed",
+        #       "source_url":       the address it was extracted from, if
+        #                           not the video's own (used by the log)
         #     }
         # }
+        # Playlist entries whose details are still being extracted are kept
+        # here too, under the address the playlist gave for them, with
+        # "flat_entry", "future" and "listbox_row" and status "resolving";
+        # videos being restored from self.queue_store also have "restored",
+        # their <StoredItem>.
         self.central_item_dict = {}
 
+        # Pasted addresses and entries of playlists are extracted in the
+        # background by this pool, so that rows appear before the whole
+        # batch or playlist is done
+        self.extraction_pool = ThreadPoolExecutor(
+            max_workers=EXTRACTION_WORKERS
+        )
+        # With CATFETCH_EXTRACTION=processes, the pool's threads just wait
+        # while the extraction itself runs in worker processes, so it doesn't
+        # hold the GIL the main loop needs; only compact results (VideoItems)
+        # come back. self.extract works like yw.extract_vid_info either way.
+        if os.environ.get("CATFETCH_EXTRACTION") == "processes":
+            self.process_extractor = ProcessExtractor(EXTRACTION_WORKERS)
+            self.extract = self.process_extractor.extract
+        else:
+            self.process_extractor = None
+            self.extract = yw.extract_vid_info
+        # Concurrent extractions of the same video (e.g. a short and a long
+        # form of its address pasted together) share one run through this
+        self.extraction_flights = SingleFlight()
+        # video key (see yw.video_key) of every item: its key in
+        # self.central_item_dict; addresses of videos which are in the list
+        # already are turned down before anything is extracted
+        self.video_keys = {}
+
+        # Number of extractions submitted to the pool and finished so far
+        # since it was last idle; shown next to the spinner
+        self.extractions_total = 0
+        self.extractions_done = 0
+        self.extraction_count_lock = Lock()
+
+        # New rows are added to the list in batches through this, so that
+        # big playlists don't freeze the window
+        self.row_inserter = RowInserter()
+        self.row_inserter.batch_callback = self.rows_inserted
+
+        # All downloads go through this queue; it limits how many videos
+        # are downloaded at once (in total and per host)
+        self.download_queue = DownloadQueue(
+            yw.download_vid, status_callback=self.download_status_changed,
+            progress_callback=self.download_progress
+        )
+
+        # With CATFETCH_INSTRUMENT=1 (or from the menu), phases of every
+        # address are timed, along with stalls of the main loop
+        instrument.get_instrument().watch_main_loop()
+
+        # Download workers write their progress here; a single timeout
+        # repaints the items that changed, at most REFRESH_RATE times
+        # per second, however many downloads are running
+        self.progress_board = ProgressBoard()
+        GLib.timeout_add(1000 // REFRESH_RATE, self.refresh_progress)
+
+        # The list of videos is saved here as it changes, so that it can be
+        # restored after the application is closed or crashes
+        self.queue_store = QueueStore()
+
+        # Thumbnails are downloaded and scaled in the background, only for
+        # rows in or near the visible part of the list
+        self.thumbnails = ThumbnailService()
+        self.thumbnails_scheduled = False
+
         # For pasting video address
         self.clipboard = Gtk.Clipboard.get(Gdk.SELECTION_CLIPBOARD)
 
@@ -57,6 +149,22 @@ class MainWindow(Gtk.Window):
         self.spinner = Gtk.Spinner()
         self.headerbar.pack_start(self.spinner)
 
+        # How many of the pasted addresses (and playlist entries) are done
+        self.extraction_label = Gtk.Label()
+        self.extraction_label.set_tooltip_text(
+            _("Addresses whose details have been extracted")
+        )
+        self.extraction_label.set_no_show_all(True)
+        self.headerbar.pack_start(self.extraction_label)
+
+        # The menu with settings which apply to all downloads
+        self.menu_button = Gtk.MenuButton()
+        self.menu_button.add(Gtk.Image.new_from_icon_name(
+            "open-menu-symbolic", Gtk.IconSize.BUTTON))
+        self.menu_button.set_popover(self.create_menu_popover())
+        self.menu_button.set_tooltip_text(_("Settings"))
+        self.headerbar.pack_end(self.menu_button)
+
         # The Download button
         # possible icons: document-save, go-down, emblem-downloads
         self.download_button = Gtk.Button.new_from_icon_name(
@@ -106,34 +214,260 @@ class MainWindow(Gtk.Window):
         self.downloadables_listbox.set_selection_mode(
             Gtk.SelectionMode.NONE
         )
-        self.scroll_envelope.add(self.downloadables_listbox)
 
+        # With CATFETCH_VIEW=compact, videos are listed in a plain TreeView
+        # instead, which stays fast even with thousands of items
+        if os.environ.get("CATFETCH_VIEW") == "compact":
+            self.queue_view = QueueView(self)
+            self.scroll_envelope.add(self.queue_view)
+            self.set_default_size(800, 400)
+        else:
+            self.queue_view = None
+            self.scroll_envelope.add(self.downloadables_listbox)
+            # scrolling, resizing and new rows may bring rows into view
+            vadjustment = self.scroll_envelope.get_vadjustment()
+            vadjustment.connect("value-changed", self.schedule_thumbnails)
+            vadjustment.connect("changed", self.schedule_thumbnails)
+
+        # Bring back the videos of the last session; their details are
+        # extracted in the background like those of a playlist
+        self.restore_queue()
+
+        # youtube_dl isn't imported until the window has been drawn
+        self.first_draw_handler = self.connect_after("draw",
+                                                     self.first_frame_drawn)
+
+    def first_frame_drawn(self, widget, cairo_context):
+        """
+        Runs after the window has been drawn for the first time; imports
+        youtube_dl and prepares its extractors in a background thread, so
+        that the first pasted address doesn't have to wait for that
+        """
+        self.disconnect(self.first_draw_handler)
+
+        warm_up_thread = Thread(target=yw.warm_up)
+        warm_up_thread.daemon = True
+        warm_up_thread.start()
+
+        return False
+
+
+    def schedule_thumbnails(self, *args):
+        """
+        Makes load_visible_thumbnails run shortly, once however many times
+        this is called meanwhile (e.g. during fast scrolling)
+        """
+        if not self.thumbnails_scheduled:
+            self.thumbnails_scheduled = True
+            GLib.timeout_add(THUMBNAIL_DELAY, self.load_visible_thumbnails)
+
+    def load_visible_thumbnails(self):
+        """
+        Asks the visible rows, and those within a page of them, to load
+        their thumbnails; rows further away don't, until scrolled to
+        """
+        self.thumbnails_scheduled = False
+
+        vadjustment = self.scroll_envelope.get_vadjustment()
+        page_size = vadjustment.props.page_size
+        top = max(0, vadjustment.props.value - page_size)
+        bottom = vadjustment.props.value + 2 * page_size
+
+        # only the rows in range are looked at, however long the list is
+        row = self.downloadables_listbox.get_row_at_y(top)
+        index = row.get_index() if row is not None else 0
+        row = self.downloadables_listbox.get_row_at_index(index)
+        while row is not None and row.get_allocation().y < bottom:
+            row.load_thumbnail()
+            index += 1
+            row = self.downloadables_listbox.get_row_at_index(index)
+
+        return False
+
+    def create_menu_popover(self):
+        """
+        Returns the popover of the headerbar menu: limits of the total
+        download speed and of the speed of downloads from one website,
+        and how many connections a video may be downloaded over
+        """
+        rate_limiter = yw.get_rate_limiter()
+
+        grid = Gtk.Grid(row_spacing=5, column_spacing=10)
+        grid.props.margin = 10
+
+        for row, (text, rate, callback) in enumerate((
+                (_("Speed limit (KiB/s):"), rate_limiter.rate,
+                 self.speed_limit_changed),
+                (_("Per website (KiB/s):"), rate_limiter.per_host_rate,
+                 self.host_speed_limit_changed))):
+            label = Gtk.Label(text)
+            label.props.xalign = 0
+            spin_button = Gtk.SpinButton.new_with_range(0, 1000000, 100)
+            spin_button.props.value = (rate or 0) / 1024
+            spin_button.connect("value-changed", callback)
+            grid.attach(label, 0, row, 1, 1)
+            grid.attach(spin_button, 1, row, 1, 1)
+
+        hint = Gtk.Label(_("0 means no limit"))
+        hint.props.xalign = 0
+        hint.get_style_context().add_class("dim-label")
+        grid.attach(hint, 0, 2, 2, 1)
+
+        segments_label = Gtk.Label(_("Connections per video:"))
+        segments_label.props.xalign = 0
+        segments_button = Gtk.SpinButton.new_with_range(1, 16, 1)
+        segments_button.props.value = yw.get_download_segments()
+        segments_button.connect("value-changed", self.segments_changed)
+        grid.attach(segments_label, 0, 3, 1, 1)
+        grid.attach(segments_button, 1, 3, 1, 1)
+
+        # Timing of extraction, rows and downloads (see instrument)
+        timings_check = Gtk.CheckButton(_("Record timings"))
+        timings_check.props.active = instrument.get_instrument().enabled
+        timings_check.connect("toggled", self.timings_toggled)
+        export_button = Gtk.Button(_("Export…"))
+        export_button.set_tooltip_text(_("Save the recorded timings as JSON"))
+        export_button.connect("clicked", self.export_timings)
+        grid.attach(timings_check, 0, 4, 1, 1)
+        grid.attach(export_button, 1, 4, 1, 1)
+
+        popover = Gtk.Popover()
+        popover.add(grid)
+        # this is needed or else the popover appears empty
+        grid.show_all()
+
+        return popover
+
+    def speed_limit_changed(self, spin_button):
+        """ Applies the total speed limit set in the menu (0 = none) """
+        yw.get_rate_limiter().set_rate(spin_button.props.value * 1024)
+
+    def host_speed_limit_changed(self, spin_button):
+        """ Applies the per-website speed limit set in the menu (0 = none) """
+        yw.get_rate_limiter().set_per_host_rate(spin_button.props.value * 1024)
+
+    def timings_toggled(self, check_button):
+        """ Starts or stops recording timings """
+        instrument.get_instrument().set_enabled(check_button.props.active)
+
+    def export_timings(self, widget):
+        """ Saves the recorded timings in a JSON file chosen by the user """
+        dialog = Gtk.FileChooserDialog(
+            _("Export Timings"), self, Gtk.FileChooserAction.SAVE,
+            (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+             Gtk.STOCK_SAVE, Gtk.ResponseType.OK)
+        )
+        dialog.set_do_overwrite_confirmation(True)
+        dialog.set_current_name("catfetch-timings.json")
+
+        if dialog.run() == Gtk.ResponseType.OK:
+            instrument.get_instrument().export(dialog.get_filename())
+        dialog.destroy()
+
+    def segments_changed(self, spin_button):
+        """ Sets how many connections downloads started from now on use """
+        yw.set_download_segments(spin_button.get_value_as_int())
 
     def launch_download(self, widget):
         """ Starts downloading all yet-to-be-downloaded videos in list """
 
-        # Simply execute the download method of each row instance
-        # This is already threaded
+        # Each video is put into the download queue; the queue
+        # takes care of threading
         for item in self.central_item_dict:
-            self.central_item_dict[item]["listbox_row"].download_item(widget)
+            item_dict = self.central_item_dict[item]
+            if item_dict["status"] != "waiting":
+                continue
 
-    def url_pasted(self, widget):
+            # rows also need to update their buttons
+            if item_dict.get("listbox_row") is not None:
+                item_dict["listbox_row"].download_item(widget)
+            else:
+                self.queue_download(item_dict)
+
+    def queue_download(self, item_dict, priority=PRIORITY_NORMAL):
         """
-        Gets text from the clipboard (if not empty) and hands it over
-        to the 'self.url_evaluate' function.
+        Puts a video into the download queue, in the format and into the
+        directory selected in its item dict
         """
+        video_item = item_dict["video_item"]
+        format_id = item_dict["download_format_id"]
+
+        # Default dir or selected by the popover button
+        downloads_dir = item_dict["download_dir"]
+
+        # This is where we create the actual download path and filename
+        where = bf.download_path(video_item, format_id, downloads_dir)
+
+        job = DownloadJob(video_item.webpage_url, format_id, where,
+                          item=item_dict, priority=priority,
+                          key=yw.info_key(video_item))
+        item_dict["status"] = "queued"
+        self.persist_item(item_dict)
+        self.download_queue.submit(job)
+
+    def download_status_changed(self, job):
+        """
+        Runs (in a worker thread) whenever a queued download changes its
+        status; records the new status in the item's dict
+        """
+        job.item["status"] = job.status
+        self.persist_item(job.item)
+        self.progress_board.mark_dirty(job.url)
+
+    def download_progress(self, job, hook_dict):
+        """
+        Runs (in a worker thread) for every progress report of a download;
+        just records it for the next refresh_progress
+        """
+        self.progress_board.update(job.url, hook_dict)
+
+    def refresh_progress(self):
+        """
+        Runs periodically in the main loop; shows the progress and status of
+        downloads which changed since the last run
+        """
+        for key in self.progress_board.take_dirty():
+            item_dict = self.central_item_dict.get(key)
+            # the item may have been removed in the meantime
+            if item_dict is None:
+                continue
+
+            progress_state = self.progress_board.state(key)
+            if self.queue_view is not None:
+                self.queue_view.show_progress(item_dict, progress_state)
+            elif item_dict.get("listbox_row") is not None:
+                item_dict["listbox_row"].show_progress(progress_state)
+
+        # keep running
+        return True
 
-        # Deactivate the 'Paste' button and start spinner animation
-        self.paste_button.props.sensitive = False
-        self.spinner.start()
+    def url_pasted(self, widget):
+        """
+        Gets text from the clipboard (if not empty), splits it into addresses
+        and hands each of them over to the 'self.url_evaluate' function
+        running in the extraction pool. The Paste button stays usable, so
+        more batches can be added while one is being extracted.
+        """
 
         text = self.clipboard.wait_for_text()
 
         if text != None:
-            # self.url_evaluate(text)
-            thread = Thread(target=self.url_evaluate, args=(text,))
-            thread.daemon = True
-            thread.start()
+            # Skip addresses pasted more than once
+            urls = []
+            seen_urls = set()
+            for url in bf.split_urls(text):
+                url_key = yw.canonical_url(url)
+                if url_key not in seen_urls:
+                    seen_urls.add(url_key)
+                    urls.append(url)
+
+            self.extractions_started(len(urls))
+            for url in urls:
+                future = self.extraction_pool.submit(self.url_evaluate, url)
+                future.add_done_callback(self.extraction_finished)
+                future.add_done_callback(
+                    lambda future, url=url: self.url_evaluated(url, future)
+                )
         else:
             # Clipboard is empty; show an error window
             title = _("Clipboard empty")
@@ -144,14 +478,68 @@ class MainWindow(Gtk.Window):
             GLib.idle_add(dialog.run)
             GLib.idle_add(dialog.destroy)
 
-            self.paste_button.props.sensitive = True
+    def url_evaluated(self, url, future):
+        """
+        Done-callback of url_evaluate: errors it doesn't handle itself
+        (anything but ExtractionError) are logged and shown
+        """
+        if future.cancelled() or future.exception() is None:
+            return
+
+        error = future.exception()
+        with log_sink.get_sink().context(url, "extract"):
+            log_sink.get_sink().log(log_sink.ERROR, "".join(
+                traceback.format_exception(type(error), error,
+                                           error.__traceback__)))
+        GLib.idle_add(self.invalid_url_dialog, url,
+                      "{}: {}".format(type(error).__name__, error))
+
+    def extractions_started(self, count):
+        """
+        Records that 'count' more extractions have been submitted to the
+        extraction pool. May be called from any thread.
+        """
+        with self.extraction_count_lock:
+            self.extractions_total += count
+
+        GLib.idle_add(self.show_extraction_progress)
+
+    def extraction_finished(self, future):
+        """
+        Records that an extraction from the pool is done (successfully or
+        not); used as a done-callback of its future, so it runs in a worker.
+        """
+        with self.extraction_count_lock:
+            self.extractions_done += 1
+            # the whole batch is done; start counting from zero next time
+            if self.extractions_done >= self.extractions_total:
+                self.extractions_done = 0
+                self.extractions_total = 0
+
+        GLib.idle_add(self.show_extraction_progress)
+
+    def show_extraction_progress(self):
+        """
+        Updates the spinner and the 'done/total' label in the headerbar
+        according to the extraction counters
+        """
+        with self.extraction_count_lock:
+            done = self.extractions_done
+            total = self.extractions_total
+
+        if total > 0:
+            self.spinner.start()
+            self.extraction_label.set_text("{}/{}".format(done, total))
+            self.extraction_label.show()
+        else:
             self.spinner.stop()
+            self.extraction_label.hide()
 
     def url_evaluate(self, text):
         """
         Checks if the text if a valid youtube_dl video address and if so,
-        extracts info from it to the 'self.central_item_dict' dict of dicts
-        and launches further functions for adding the video.
+        extracts info from it and has add_extracted add the video (or the
+        videos of a playlist) in the main loop. Runs in the extraction pool.
         """
 
         # self.url_entry.set_progress_fraction(0.4)
@@ -159,20 +547,35 @@ class MainWindow(Gtk.Window):
         # url_entered = self.url_entry.props.text
         url_entered = text
 
+        # All forms of a video's address have the same key
+        key = yw.video_key(url_entered)
+        known_item_dict = self.known_item(key)
+        if known_item_dict is not None:
+            GLib.idle_add(self.duplicate_url_dialog, url_entered,
+                          self.item_title(known_item_dict))
+            return
+
         try:
-            ytdl_info_dict = yw.extract_vid_info(url_entered)
+            # Addresses looked at recently come from the on-disk info cache.
+            # Playlists are extracted 'flat': we get the list of entries
+            # right away and resolve each of them in the background.
+            ytdl_info_dict, shared = self.extraction_flights.do(
+                key, self.extract, url_entered, flat=True
+            )
             # pprint(self.ytdl_info_dict)
-        except youtube_dl.utils.DownloadError as ytdl_msg:
-            # Slicing off the initial 18 characters from exception here because
-            # the messages's beginning is just a general 'ERROR' text
-            # with red-color formatting which doesn't translate nicely
-            # into non-terminal output anyway.
-            error_msg = "{}".format(ytdl_msg)[18:]
+        except yw.ExtractionError as ytdl_msg:
+            # the message comes without YoutubeDL's 'ERROR' prefix
+            # and its terminal colors
+            error_msg = "{}".format(ytdl_msg)
             # Show an error dialog
             GLib.idle_add(self.invalid_url_dialog, url_entered, error_msg)
-            # Make Paste button sensitive and stop spinner animation
-            self.paste_button.props.sensitive = True
-            self.spinner.stop()
+            return
+
+        # The same video was pasted again while being extracted; the first
+        # paste adds it
+        if shared:
+            GLib.idle_add(self.duplicate_url_dialog, url_entered,
+                          ytdl_info_dict.get("title", url_entered))
             return
 
         # youtube_dl falls back on 'Generic' extractor if the website
@@ -186,76 +589,327 @@ class MainWindow(Gtk.Window):
                  "may not. Guessing could lead to bad results. ",
                  "Better download it using another application."]))
             GLib.idle_add(self.invalid_url_dialog, url_entered, error_msg)
-            self.paste_button.props.sensitive = True
-            self.spinner.stop()
             return
 
-        # Register the extracted information globally
-        # The retrieved information can contain a single video or a playlist.
+        # The list is only changed in the main loop: url_evaluate runs in
+        # several pool threads at once, and clear_vid_list goes through
+        # the list in the main loop
+        GLib.idle_add(self.add_extracted, url_entered, ytdl_info_dict)
+
+    def add_extracted(self, url_entered, ytdl_info_dict):
+        """
+        Registers the extracted information globally; runs in the main loop.
+        The retrieved information can contain a single video or a playlist.
+        """
         # If it's a playlist, add all contained videos:
         if "_type" in ytdl_info_dict and ytdl_info_dict["_type"] == "playlist":
-
-            for each_entry_dict in ytdl_info_dict["entries"]:
-                self.add_new_video(each_entry_dict)
+            self.add_playlist_entries(ytdl_info_dict)
 
         # If it's just a regular video, add it:
         else:
-            self.add_new_video(ytdl_info_dict)
+            self.add_new_video(ytdl_info_dict, source_url=url_entered)
 
-        self.download_button.props.sensitive = True
-        self.paste_button.props.sensitive = True
-        self.clear_button.props.sensitive = True
-        self.spinner.stop()
+    def add_pending_video(self, flat_entry, restored=None):
+        """
+        Adds a playlist entry whose details are not known yet: shows
+        a placeholder row for it and lets the extraction pool resolve it.
+        'restored' is the <StoredItem> of a video restored from the last
+        session (see restore_queue). Must run in the main loop.
+        """
+        key = flat_entry["url"]
+
+        if key in self.central_item_dict:
+            return
+
+        # Entries of a restored queue are known to be different videos; the
+        # check would only make the window load youtube_dl at startup
+        if restored is None:
+            entry_key = yw.video_key(key, flat_entry.get("ie_key"))
+            # e.g. a video which is in two pasted playlists
+            if self.known_item(entry_key) is not None:
+                return
+            self.video_keys[entry_key] = key
+
+        # Formats and the 'Downloads' dir. are filled in once the details
+        # are known
+        pending_item_dict = {
+            "flat_entry": flat_entry,
+            "listbox_row": None,
+            "status": "resolving"
+        }
+        if restored is not None:
+            pending_item_dict["restored"] = restored
+        self.central_item_dict[key] = pending_item_dict
+
+        self.row_inserter.queue(self.add_pending_listbox_row, pending_item_dict)
+
+        self.extractions_started(1)
+        # see yw.extract_entry_info
+        future = self.extraction_pool.submit(
+            self.extract, flat_entry["url"], ie_key=flat_entry.get("ie_key")
+        )
+        future.add_done_callback(self.extraction_finished)
+        pending_item_dict["future"] = future
+        # This goes through the row inserter too, so that the placeholder
+        # row surely exists by the time it is to be replaced
+        future.add_done_callback(
+            lambda future: self.row_inserter.queue(
+                self.pending_video_resolved, key, pending_item_dict, future
+            )
+        )
+
+    def pending_video_resolved(self, key, pending_item_dict, future):
+        """
+        Runs in the main loop when the details of a playlist entry have been
+        extracted (or failed to); has its placeholder replaced with a full row
+        """
+        # The list may have been cleared in the meantime
+        if self.central_item_dict.get(key) is not pending_item_dict:
+            return
+        if future.cancelled():
+            return
+
+        try:
+            ytdl_info_dict = future.result()
+        except Exception as error:
+            # ExtractionError, but also e.g. a broken info cache; either
+            # way the placeholder mustn't keep spinning
+            if isinstance(error, yw.ExtractionError):
+                error_msg = "{}".format(error)
+            else:
+                error_msg = "{}: {}".format(type(error).__name__, error)
+            self.pending_video_failed(pending_item_dict, error_msg)
+            return
+
+        del self.central_item_dict[key]
+
+        # the entry was a playlist itself (e.g. a tab of a channel): its
+        # videos take the place of the placeholder
+        if ytdl_info_dict.get("_type") == "playlist":
+            self.remove_pending_row(pending_item_dict)
+            self.add_playlist_entries(ytdl_info_dict)
+            return
+
+        if not self.add_new_video(ytdl_info_dict, pending_item_dict,
+                                  source_url=key):
+            # a duplicate; the placeholder isn't needed anymore
+            self.remove_pending_row(pending_item_dict)
+            return
+
+        if "restored" in pending_item_dict:
+            item_dict = self.central_item_dict[ytdl_info_dict["webpage_url"]]
+            self.apply_restored(item_dict, pending_item_dict["restored"])
+
+    def pending_video_failed(self, pending_item_dict, error_msg):
+        """ Shows that a playlist entry couldn't be resolved """
+        pending_item_dict["status"] = "failed"
+        if self.queue_view is not None:
+            self.queue_view.show_pending_error(pending_item_dict, error_msg)
+        else:
+            pending_item_dict["listbox_row"].show_error(error_msg)
+
+    def remove_pending_row(self, pending_item_dict):
+        """ Removes the placeholder row of a playlist entry """
+        if self.queue_view is not None:
+            self.queue_view.remove_item(pending_item_dict)
+        else:
+            self.downloadables_listbox.remove(pending_item_dict["listbox_row"])
+
+    def add_playlist_entries(self, playlist_dict):
+        """
+        Adds the videos of a playlist (see yw.playlist_videos); entries
+        which are still to be resolved get placeholders (see
+        add_pending_video)
+        """
+        for entry_dict in yw.playlist_videos(playlist_dict):
+            if yw.is_flat_entry(entry_dict):
+                self.add_pending_video(entry_dict)
+            else:
+                self.add_new_video(entry_dict)
+
+    def add_pending_listbox_row(self, pending_item_dict):
+        """
+        Creates a placeholder row for a playlist entry that is being resolved.
+        Should be called through self.row_inserter; returns the new row
+        (None in the compact view, which has no row widgets).
+        """
+        if self.queue_view is not None:
+            self.queue_view.add_pending_item(pending_item_dict)
+            return None
+
+        listbox_row = PendingDownloadable(self, pending_item_dict)
+        pending_item_dict["listbox_row"] = listbox_row
+        self.downloadables_listbox.add(listbox_row)
 
-    def add_new_video(self, ytdl_info_dict):
+        return listbox_row
+
+    def add_new_video(self, ytdl_info_dict, pending_item_dict=None,
+                      source_url=None):
         """
-        Adds extracted video info to the global list. Then proceeds with
+        Adds extracted video info to the global list, keeping only what is
+        needed of it in a compact VideoItem. Then proceeds with
         the 'add_listbox_row' function which creates a new visible row for
-        the current video.
+        the current video (in place of the placeholder of
+        'pending_item_dict', if given). 'source_url' is the address the info
+        was extracted from. Must run in the main loop.
+        Returns False if the video is already in the list.
         """
         url = ytdl_info_dict["webpage_url"]
+        key = yw.info_key(ytdl_info_dict)
+        # all phases of a video are timed under its video key
+        timing_key = key or url
+        timings = instrument.get_instrument()
 
-        if url in self.central_item_dict:
-            v_title = ytdl_info_dict["title"]
-            # self.duplicate_url_dialog(url, v_title)
-            GLib.idle_add(self.duplicate_url_dialog, url, v_title)
-            return
+        with timings.phase(timing_key, "add_new_video"):
 
-        formats_list = ytdl_info_dict["formats"]
+            if url in self.central_item_dict \
+            or self.known_item(key) is not None:
+                v_title = ytdl_info_dict["title"]
+                # self.duplicate_url_dialog(url, v_title)
+                GLib.idle_add(self.duplicate_url_dialog, url, v_title)
+                return False
 
-        # Build lists containing audio-only, video-only and a/v format options
-        available_a_v_s = [av for av in formats_list if bf.is_both_a_v(av)]
-        available_video_s = [v for v in formats_list if bf.is_video_only(v)]
-        available_audio_s = [a for a in formats_list if bf.is_audio_only(a)]
+            # The item only keeps this compact record; the full info dict
+            # can be found in the info cache if it's ever needed again.
+            # Results of extraction processes are VideoItems already.
+            if isinstance(ytdl_info_dict, VideoItem):
+                video_item = ytdl_info_dict
+            else:
+                video_item = VideoItem(ytdl_info_dict)
 
-        # Provide a default download location; the 'Downloads' dir. for now
-        # TODO: Possibly make the default configurable in Preferences
-        downl_dir = GLib.get_user_special_dir(GLib.USER_DIRECTORY_DOWNLOAD)
+            # Provide a default download location; the 'Downloads' dir.
+            # for now
+            # TODO: Possibly make the default configurable in Preferences
+            downl_dir = GLib.get_user_special_dir(
+                GLib.USER_DIRECTORY_DOWNLOAD)
 
-        self.central_item_dict[url] = {
-            "ytdl_info_dict": ytdl_info_dict,
-            "available_a_v_s": available_a_v_s,
-            "available_video_s": available_video_s,
-            "available_audio_s": available_audio_s,
-            "default_download_dir": downl_dir,
-            "status": "waiting"
-        }
+            self.central_item_dict[url] = {
+                "video_item": video_item,
+                "download_format_id": video_item.default_format_id,
+                "download_dir": downl_dir,
+                "status": "waiting",
+                "source_url": source_url
+            }
+            if key is not None:
+                self.video_keys[key] = url
+            self.persist_item(self.central_item_dict[url])
 
-        # Add a new row to the videos list
-        # This must be done in a GTK-specific threading way
-        GLib.idle_add(self.add_listbox_row, self.central_item_dict[url])
+            # until add_listbox_row runs
+            timings.begin(timing_key, "row_wait")
+            # Add a new row to the videos list
+            # This must be done in a GTK-specific threading way
+            self.row_inserter.queue(
+                self.add_listbox_row, self.central_item_dict[url],
+                pending_item_dict
+            )
+
+            return True
 
-    def add_listbox_row(self, downloadable_item_dict):
+    def add_listbox_row(self, downloadable_item_dict, pending_item_dict=None):
         """
         Creates a ListBoxRow -- a new item showing selected video information
-        and options; adds it to the main windows ListBox.
-        Should be called in a non-blocking way.
+        and options; adds it to the main windows ListBox, replacing
+        the placeholder row of 'pending_item_dict' if given.
+        Should be called through self.row_inserter; returns the new row
+        (None in the compact view, which has no row widgets).
         """
+        video_item = downloadable_item_dict["video_item"]
+        timing_key = yw.info_key(video_item) or video_item.webpage_url
+        timings = instrument.get_instrument()
+        timings.end(timing_key, "row_wait")
 
-        listbox_row = Downloadable(self, downloadable_item_dict)
-        downloadable_item_dict["listbox_row"] = listbox_row
-        self.downloadables_listbox.add(listbox_row)
-        self.downloadables_listbox.show_all()
+        with timings.phase(timing_key, "add_listbox_row"):
+            if self.queue_view is not None:
+                self.queue_view.add_item(downloadable_item_dict,
+                                         pending_item_dict)
+                return None
+
+            listbox_row = Downloadable(self, downloadable_item_dict)
+            downloadable_item_dict["listbox_row"] = listbox_row
+            # a restored video may be queued before its row exists
+            if downloadable_item_dict["status"] != "waiting":
+                self.progress_board.mark_dirty(listbox_row.url)
+
+            if pending_item_dict is not None:
+                placeholder_row = pending_item_dict["listbox_row"]
+                position = placeholder_row.get_index()
+                self.downloadables_listbox.remove(placeholder_row)
+                self.downloadables_listbox.insert(listbox_row, position)
+            else:
+                self.downloadables_listbox.add(listbox_row)
+
+            return listbox_row
+
+    def restore_queue(self):
+        """
+        Adds the videos saved in self.queue_store which weren't downloaded
+        in the last session. They show up as placeholders right away;
+        extraction (mostly from the info cache) runs in the background and
+        apply_restored puts the saved settings back once it's done.
+        """
+        for stored_item in self.queue_store.load():
+            flat_entry = {"url": stored_item.url, "title": stored_item.title}
+            self.add_pending_video(flat_entry, restored=stored_item)
+
+    def apply_restored(self, item_dict, stored_item):
+        """
+        Gives a restored video the format, directory and status saved in the
+        last session; videos which were queued or being downloaded are
+        queued again. YoutubeDL continues partly downloaded files (.part)
+        with HTTP range requests, as the file name is the same as before;
+        segmented downloads continue theirs (.segmented.part) the same way.
+        """
+        video_item = item_dict["video_item"]
+
+        # the website may not offer the same formats anymore
+        if bf.get_format_by_id(stored_item.format_id, video_item) is not None:
+            item_dict["download_format_id"] = stored_item.format_id
+        if stored_item.download_dir and os.path.isdir(stored_item.download_dir):
+            item_dict["download_dir"] = stored_item.download_dir
+
+        if stored_item.status in ("queued", "downloading"):
+            self.queue_download(item_dict)
+        else:
+            # failed downloads can be tried again
+            self.persist_item(item_dict)
+
+    def known_item(self, key):
+        """
+        Returns the item dict of the video with the given video key,
+        or None if it isn't in the list
+        """
+        return self.central_item_dict.get(self.video_keys.get(key))
+
+    def item_title(self, item_dict):
+        """ Returns the title of an item, or its address if it's unknown """
+        if "video_item" in item_dict:
+            return item_dict["video_item"].title
+        flat_entry = item_dict["flat_entry"]
+        return flat_entry.get("title") or flat_entry["url"]
+
+    def persist_item(self, item_dict):
+        """
+        Saves the current state of a video into self.queue_store.
+        May be called from any thread.
+        """
+        video_item = item_dict["video_item"]
+        # e.g. a download which ended after the list was cleared
+        if self.central_item_dict.get(video_item.webpage_url) is not item_dict:
+            return
+        self.queue_store.save(
+            video_item.webpage_url, video_item.title,
+            item_dict["download_format_id"], item_dict["download_dir"],
+            item_dict["status"]
+        )
+
+    def rows_inserted(self):
+        """ Runs after self.row_inserter has added a batch of rows """
+        self.download_button.props.sensitive = True
+        self.clear_button.props.sensitive = True
+        # while the list is shorter than the window (or a placeholder is
+        # replaced in place), the scrollbar doesn't change and wouldn't
+        # have the new rows' thumbnails loaded
+        self.schedule_thumbnails()
 
     # def downloadables_refresh(self, items_list):
     #     self.outer_box.remove(self.downloadables_listbox)
@@ -306,18 +960,67 @@ class MainWindow(Gtk.Window):
         dialog.run()
         dialog.destroy()
 
+    def show_log_dialog(self, item_dict):
+        """
+        Shows what has been logged about the given video (its extraction and
+        download), as far as the in-memory log buffer goes back
+        """
+        sink = log_sink.get_sink()
+        urls = {item_dict["video_item"].webpage_url, item_dict["source_url"]}
+        lines = [sink.format_record(record)
+                 for record in sink.records(urls=urls)]
+        if not lines:
+            lines = [_("Nothing has been logged about this video.")]
+
+        dialog = Gtk.Dialog(
+            _("Log: {}").format(item_dict["video_item"].title), self, 0,
+            (_("Close"), Gtk.ResponseType.CLOSE)
+        )
+        dialog.set_default_size(700, 400)
+
+        text_view = Gtk.TextView()
+        text_view.props.editable = False
+        text_view.props.monospace = True
+        text_view.get_buffer().set_text("\n".join(lines))
+
+        log_scroll = Gtk.ScrolledWindow()
+        log_scroll.add(text_view)
+        dialog.get_content_area().pack_start(log_scroll, 1, 1, 0)
+        dialog.show_all()
+
+        dialog.run()
+        dialog.destroy()
+
     def clear_vid_list(self, widget):
         """ Executes each row's remove function to clear the list """
+        # rows not inserted yet won't be needed anymore
+        self.row_inserter.clear()
+        # nor downloads; their status changes mustn't put the items back
+        # into the queue store
+        self.download_queue.clear()
+
         for item in self.central_item_dict:
-            row = self.central_item_dict[item]["listbox_row"]
-            self.downloadables_listbox.remove(row)
+            item_dict = self.central_item_dict[item]
+            self.progress_board.forget(item)
+            # don't bother extracting entries nobody wants anymore
+            if "future" in item_dict:
+                item_dict["future"].cancel()
+            row = item_dict.get("listbox_row")
+            if row is not None:
+                self.downloadables_listbox.remove(row)
+
+        if self.queue_view is not None:
+            self.queue_view.clear()
 
         self.central_item_dict = {}
+        self.video_keys = {}
+        self.queue_store.clear()
 
-    def dir_chooser(self, listbox_row):
+    def dir_chooser(self):
         """
         A simple filechooser to select the directory where the video file
-        should be saved
+        should be saved; returns the selected directory or None if the user
+        cancelled the dialog
         """
         dialog = Gtk.FileChooserDialog(
             _("Select where to save the file:"), self,
@@ -330,18 +1033,32 @@ class MainWindow(Gtk.Window):
 
         if response == Gtk.ResponseType.OK:
             location = dialog.get_filename()
-            listbox_row.selected_download_dir = location
         else:
             # Cancel clicked
-            pass
+            location = None
 
         dialog.destroy()
 
+        return location
+
 
 
 if __name__ == "__main__":
+    # with CATFETCH_METRICS_FILE and/or CATFETCH_METRICS_PORT (see metrics)
+    metrics.start_exporters()
     main_win = MainWindow()
     main_win.connect("delete-event", Gtk.main_quit)
     main_win.show_all()
     Gtk.main()
+    if main_win.process_extractor is not None:
+        main_win.process_extractor.close()
+    main_win.thumbnails.close()
+    timings = instrument.get_instrument()
+    if timings.enabled:
+        log_sink.get_sink().log(log_sink.INFO, "Timings exported to {}".format(
+            timings.export()))
+    metrics.stop_exporters()
+    # write out queue changes and log records not written yet
+    main_win.queue_store.close()
+    log_sink.get_sink().close()
 
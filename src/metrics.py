@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import bisect
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, Event
+
+# How often the metrics file is rewritten, in seconds
+DEFAULT_INTERVAL = 15
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    """ Escapes a label value for the Prometheus text format """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n") \
+        .replace('"', '\\"')
+
+def format_labels(names, values, extra=()):
+    """ Returns '{name="value",...}', or "" if there are no labels """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, escape_label(value))
+                          for name, value in pairs) + "}"
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(object):
+    """
+    Base of the metric types below: a name, a help text and optionally
+    label names; values are kept per combination of label values, given
+    as keyword arguments (counter.inc(extractor="Youtube")).
+    """
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._lock = Lock()
+        # tuple of label values: value
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError("{} takes labels {}, not {}".format(
+                self.name, self.label_names, tuple(labels)))
+        return tuple(labels[name] for name in self.label_names)
+
+    def take(self):
+        """
+        Returns the values recorded so far, by label values, and starts
+        again from zero (see Registry.take)
+        """
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def render(self):
+        """ Returns the lines of this metric in the Prometheus text format """
+        lines = ["# HELP {} {}".format(self.name, self.help_text),
+                 "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            samples = sorted(self._values.items())
+        for label_values, value in samples:
+            lines.append("{}{} {}".format(
+                self.name, format_labels(self.label_names, label_values),
+                format_value(value)))
+        return lines
+
+
+class Counter(Metric):
+    """ A value that only goes up, e.g. the number of bytes downloaded """
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def merge(self, values):
+        """ Adds values returned by take() (e.g. of another process) """
+        with self._lock:
+            for key, amount in values.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, e.g. the number of running downloads.
+    set_function() makes it read its (unlabelled) value when rendered.
+    """
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=()):
+        super(Gauge, self).__init__(name, help_text, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        """ Makes the gauge's value function() whenever it's rendered """
+        self._function = function
+
+    def render(self):
+        if self._function is not None:
+            self.set(self._function())
+        return super(Gauge, self).render()
+
+
+class Histogram(Metric):
+    """
+    Counts observed values (e.g. extraction times) in buckets of upper
+    bounds 'buckets', and keeps their sum and count
+    """
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        super(Histogram, self).__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or \
+                ([0] * len(self.buckets), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def merge(self, values):
+        """ Adds values returned by take() (e.g. of another process) """
+        with self._lock:
+            for key, (counts, total) in values.items():
+                own_counts, own_total = self._values.get(key) or \
+                    ([0] * len(self.buckets), 0.0)
+                self._values[key] = (
+                    [own + other for own, other in zip(own_counts, counts)],
+                    own_total + total)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels)) or ((), 0)
+            return sum(counts)
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help_text),
+                 "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            samples = sorted((key, (list(counts), total))
+                             for key, (counts, total) in self._values.items())
+
+        for label_values, (counts, total) in samples:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append("{}_bucket{} {}".format(
+                    self.name,
+                    format_labels(self.label_names, label_values,
+                                  [("le", format_value(bound))]),
+                    cumulative))
+            labels = format_labels(self.label_names, label_values)
+            lines.append("{}_sum{} {}".format(self.name, labels,
+                                              format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, labels, cumulative))
+        return lines
+
+
+class Registry(object):
+    """ The metrics of the process, rendered together """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def take(self):
+        """
+        Returns {name: values} of the counters and histograms, starting them
+        again from zero. Extraction processes (see extraction_pool) hand
+        these over with each result, to be merge()d into the window's
+        process; gauges are about one process and are left out.
+        """
+        return {metric.name: metric.take() for metric in self._metrics
+                if isinstance(metric, (Counter, Histogram))}
+
+    def merge(self, changes):
+        """ Adds what another process's take() returned """
+        for metric in self._metrics:
+            if metric.name in changes:
+                metric.merge(changes[metric.name])
+
+    def render(self):
+        """ Returns all metrics in the Prometheus text format """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+EXTRACTION_SECONDS = REGISTRY.register(Histogram(
+    "catfetch_extraction_seconds",
+    "Time taken to extract an address (not counting info cache hits)",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+))
+EXTRACTION_FAILURES = REGISTRY.register(Counter(
+    "catfetch_extraction_failures_total",
+    "Addresses which couldn't be extracted, by extractor",
+    labels=("extractor",)
+))
+INFO_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "catfetch_info_cache_requests_total",
+    "Info cache lookups by result (hit or miss)",
+    labels=("result",)
+))
+DOWNLOADED_BYTES = REGISTRY.register(Counter(
+    "catfetch_downloaded_bytes_total",
+    "Bytes downloaded; its rate is the download speed"
+))
+DOWNLOAD_SPEED = REGISTRY.register(Histogram(
+    "catfetch_download_speed_bytes_per_second",
+    "Average speed of finished downloads",
+    buckets=(16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+))
+DOWNLOADS = REGISTRY.register(Counter(
+    "catfetch_downloads_total",
+    "Finished downloads by result (downloaded or failed)",
+    labels=("result",)
+))
+DOWNLOAD_FAILURES = REGISTRY.register(Counter(
+    "catfetch_download_failures_total",
+    "Failed downloads by extractor",
+    labels=("extractor",)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "catfetch_queue_depth",
+    "Downloads waiting for a worker"
+))
+ACTIVE_DOWNLOADS = REGISTRY.register(Gauge(
+    "catfetch_active_downloads",
+    "Downloads running right now"
+))
+LAST_PROGRESS = REGISTRY.register(Gauge(
+    "catfetch_last_progress_timestamp_seconds",
+    "When data was last downloaded (Unix time); stalls show up as this "
+    "falling behind while downloads are active"
+))
+START_TIME = REGISTRY.register(Gauge(
+    "catfetch_start_time_seconds",
+    "When the process started (Unix time)"
+))
+START_TIME.set(time.time())
+
+
+def count_downloaded(amount):
+    """ Accounts for 'amount' downloaded bytes; called for every block """
+    DOWNLOADED_BYTES.inc(amount)
+    LAST_PROGRESS.set(time.time())
+
+
+class MetricsFileWriter(object):
+    """
+    Writes the metrics to a file every 'interval' seconds, replacing it
+    in one go, as node_exporter's textfile collector expects
+    """
+
+    def __init__(self, path, interval=DEFAULT_INTERVAL, registry=REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stopped = Event()
+
+        self._thread = Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as metrics_file:
+            metrics_file.write(self.registry.render())
+        os.replace(temp_path, self.path)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError:
+                # e.g. a full disk; try again next time
+                pass
+
+    def close(self):
+        """ Stops the writer, writing the file one last time """
+        self._stopped.set()
+        try:
+            self.write()
+        except OSError:
+            pass
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """ Serves the metrics at /metrics """
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood the terminal
+        pass
+
+
+class MetricsServer(object):
+    """ HTTP server on localhost for scraping the metrics """
+
+    def __init__(self, port, registry=REGISTRY):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port),
+                                         MetricsRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.registry = registry
+        self.port = self.httpd.server_address[1]
+
+        thread = Thread(target=self.httpd.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# Exporters started by start_exporters()
+_exporters = []
+
+def start_exporters(path=None, port=None, interval=None):
+    """
+    Starts exporting the metrics: to file 'path' (CATFETCH_METRICS_FILE),
+    rewritten every 'interval' seconds (CATFETCH_METRICS_INTERVAL), and/or
+    over HTTP on localhost:'port' (CATFETCH_METRICS_PORT). Without either,
+    nothing is exported. Returns the MetricsServer, if any.
+    """
+    path = path or os.environ.get("CATFETCH_METRICS_FILE")
+    port = port or os.environ.get("CATFETCH_METRICS_PORT")
+    interval = interval or \
+        float(os.environ.get("CATFETCH_METRICS_INTERVAL") or DEFAULT_INTERVAL)
+
+    server = None
+    if path:
+        _exporters.append(MetricsFileWriter(path, interval))
+    if port:
+        server = MetricsServer(int(port))
+        _exporters.append(server)
+    return server
+
+def stop_exporters():
+    """ Stops the exporters; the metrics file is written a last time """
+    while _exporters:
+        _exporters.pop().close()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# How many times per second the UI repaints download progress at most
+REFRESH_RATE = 5
+
+
+class ProgressState(object):
+    """
+    Latest progress of one download, as reported by YoutubeDL's progress
+    hooks. Written by the download's worker thread, read by the UI.
+    """
+    __slots__ = ("downloaded_bytes", "total_bytes", "speed", "eta")
+
+    def __init__(self):
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.speed = None
+        self.eta = None
+
+    def fraction(self):
+        """ Returns the downloaded part as 0.0–1.0, or None if unknown """
+        if not self.total_bytes:
+            return None
+        return min(1.0, self.downloaded_bytes / self.total_bytes)
+
+
+class ProgressBoard(object):
+    """
+    Progress of all downloads, keyed by their central_item_dict key.
+
+    Worker threads only overwrite attributes of their own ProgressState and
+    add the key to a set of 'dirty' keys; the UI periodically takes the
+    dirty keys (take_dirty) and repaints just those items. Both are single
+    operations under the GIL, so no lock is needed and the workers never
+    wait for the UI; however often hooks fire, the UI does one repaint per
+    item per refresh.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._dirty = set()
+
+    def state(self, key):
+        """ Returns the ProgressState of the given item (maybe a new one) """
+        state = self._states.get(key)
+        if state is None:
+            state = self._states.setdefault(key, ProgressState())
+        return state
+
+    def update(self, key, hook_dict):
+        """
+        Records a YoutubeDL progress hook dict for the given item.
+        Called from the download's worker thread.
+        """
+        state = self.state(key)
+
+        if "downloaded_bytes" in hook_dict:
+            state.downloaded_bytes = hook_dict["downloaded_bytes"]
+        total_bytes = hook_dict.get("total_bytes") or \
+            hook_dict.get("total_bytes_estimate")
+        if total_bytes:
+            state.total_bytes = total_bytes
+        state.speed = hook_dict.get("speed")
+        state.eta = hook_dict.get("eta")
+
+        if hook_dict["status"] == "finished" and state.total_bytes is None:
+            state.total_bytes = state.downloaded_bytes
+
+        self._dirty.add(key)
+
+    def mark_dirty(self, key):
+        """ Makes the item repaint at the next refresh (e.g. status change) """
+        self._dirty.add(key)
+
+    def take_dirty(self):
+        """ Returns (and forgets) the keys of items changed since last call """
+        keys = []
+        while True:
+            try:
+                keys.append(self._dirty.pop())
+            except KeyError:
+                return keys
+
+    def forget(self, key):
+        """ Drops the progress of an item removed from the list """
+        self._states.pop(key, None)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import time
+from threading import Lock, Timer
+
+# Changes are collected for this long (in seconds) and then written to
+# the database in a single transaction
+FLUSH_DELAY = 1.0
+
+
+def default_store_path():
+    """ Returns the path of the queue database in the user's state dir """
+    state_home = os.environ.get("XDG_STATE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(state_home, "catfetch", "queue.sqlite")
+
+
+class StoredItem(object):
+    """ One video of the persisted queue, as returned by QueueStore.load() """
+    __slots__ = ("url", "title", "format_id", "download_dir", "status")
+
+    def __init__(self, url, title, format_id, download_dir, status):
+        self.url = url
+        self.title = title
+        self.format_id = format_id
+        self.download_dir = download_dir
+        self.status = status
+
+
+class QueueStore(object):
+    """
+    Keeps the list of videos (address, title, selected format, target
+    directory and status) in an SQLite database, so that the queue survives
+    closing or crashing the application.
+
+    save() and remove() only note the change in memory; the changes are
+    written together FLUSH_DELAY seconds after the first of them, by a timer
+    thread. A video changing its status several times in the meantime costs
+    a single row update. Safe to call from any thread.
+    """
+
+    def __init__(self, path=None, flush_delay=FLUSH_DELAY):
+        self.path = path or default_store_path()
+        self.flush_delay = flush_delay
+
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # url: StoredItem to be written, or None to be deleted
+        self._changes = {}
+        self._timer = None
+        self._lock = Lock()
+        # only used by whoever holds self._lock
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " url TEXT PRIMARY KEY,"
+            " title TEXT,"
+            " format_id TEXT,"
+            " download_dir TEXT,"
+            " status TEXT NOT NULL,"
+            " added REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def save(self, url, title, format_id, download_dir, status):
+        """ Records the current state of a video of the queue """
+        self._change(url, StoredItem(url, title, format_id, download_dir,
+                                     status))
+
+    def remove(self, url):
+        """ Removes a video from the stored queue """
+        self._change(url, None)
+
+    def clear(self):
+        """ Removes all videos from the stored queue, right away """
+        with self._lock:
+            self._changes.clear()
+            self._db.execute("DELETE FROM queue")
+            self._db.commit()
+
+    def load(self):
+        """
+        Returns the stored videos which haven't been downloaded yet, in the
+        order they were added, as StoredItem objects. Downloaded ones are
+        dropped from the store.
+        """
+        self.flush()
+
+        with self._lock:
+            self._db.execute("DELETE FROM queue WHERE status = 'downloaded'")
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT url, title, format_id, download_dir, status"
+                " FROM queue ORDER BY added"
+            ).fetchall()
+
+        return [StoredItem(*row) for row in rows]
+
+    def flush(self):
+        """ Writes all changes noted so far """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            changes = self._changes
+            self._changes = {}
+            if not changes:
+                return
+
+            now = time.time()
+            deleted = [(url,) for url, item in changes.items() if item is None]
+            saved = [
+                (item.url, item.title, item.format_id, item.download_dir,
+                 item.status, now)
+                for item in changes.values() if item is not None
+            ]
+            with self._db:
+                self._db.executemany("DELETE FROM queue WHERE url = ?",
+                                     deleted)
+                # an update keeps the original 'added' time, i.e. the place
+                # in the queue
+                self._db.executemany(
+                    "INSERT INTO queue"
+                    " (url, title, format_id, download_dir, status, added)"
+                    " VALUES (?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (url) DO UPDATE SET"
+                    " title = excluded.title,"
+                    " format_id = excluded.format_id,"
+                    " download_dir = excluded.download_dir,"
+                    " status = excluded.status",
+                    saved
+                )
+
+    def close(self):
+        """ Writes pending changes and closes the database """
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+    def _change(self, url, item):
+        """ Notes a change and makes sure a flush is coming """
+        with self._lock:
+            self._changes[url] = item
+            if self._timer is None:
+                self._timer = Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
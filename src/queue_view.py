@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, GObject
+
+import basic_functions as bf
+from basic_functions import _
+from download_queue import PRIORITY_HIGH
+from format_popover import FormatPopover
+
+# Columns of the QueueView's ListStore
+COL_ITEM = 0
+COL_TITLE = 1
+COL_DURATION = 2
+COL_HOST = 3
+COL_FORMAT = 4
+COL_STATUS = 5
+COL_PROGRESS = 6
+
+# Human-readable names of item statuses (see MainWindow.central_item_dict)
+STATUS_NAMES = {
+    "resolving": _("Loading details…"),
+    "waiting": _("Waiting"),
+    "queued": _("Queued"),
+    "downloading": _("Downloading"),
+    "downloaded": _("Downloaded"),
+    "failed": _("Failed"),
+}
+
+
+class QueueView(Gtk.TreeView):
+    """
+    Compact alternative to the ListBox of Downloadable rows, meant for very
+    long queues. Every video is just a row in a ListStore, which the TreeView
+    renders with a handful of shared cell renderers; no widgets are created
+    per video. The popover with download options is built only when a row
+    is activated (double-clicked or Enter) and destroyed once it's closed.
+
+    Each item dict keeps a Gtk.TreeRowReference to its row as "tree_row".
+    """
+
+    def __init__(self, main_window):
+        self.store = Gtk.ListStore(GObject.TYPE_PYOBJECT, str, str, str,
+                                   str, str, int)
+        super(QueueView, self).__init__(model=self.store)
+
+        self.main_window = main_window
+
+        for title, column_id, width in (
+                (_("Title"), COL_TITLE, 250),
+                (_("Duration"), COL_DURATION, 70),
+                (_("Website"), COL_HOST, 90),
+                (_("Format"), COL_FORMAT, 200),
+                (_("Status"), COL_STATUS, 180)):
+            if column_id == COL_STATUS:
+                # status text drawn over a progress bar
+                renderer = Gtk.CellRendererProgress()
+                column = Gtk.TreeViewColumn(title, renderer, text=column_id,
+                                            value=COL_PROGRESS)
+            else:
+                renderer = Gtk.CellRendererText()
+                # ellipsize characters at the end
+                renderer.props.ellipsize = 3
+                column = Gtk.TreeViewColumn(title, renderer, text=column_id)
+            # fixed sizing is needed for fixed_height_mode below
+            column.props.sizing = Gtk.TreeViewColumnSizing.FIXED
+            column.props.fixed_width = width
+            column.props.resizable = True
+            column.props.expand = column_id in (COL_TITLE, COL_FORMAT)
+            self.append_column(column)
+
+        # All rows have the same height, so GTK doesn't have to measure
+        # each of them; only the visible ones are ever rendered
+        self.props.fixed_height_mode = True
+        self.connect("row-activated", self.row_activated)
+
+    def add_pending_item(self, pending_item_dict):
+        """ Adds a row for a playlist entry whose details are not known yet """
+        flat_entry = pending_item_dict["flat_entry"]
+        # Some playlists don't even provide titles of their videos
+        title = flat_entry.get("title") or flat_entry["url"]
+
+        tree_iter = self.store.append([
+            pending_item_dict, title, "", "", "",
+            STATUS_NAMES["resolving"], 0
+        ])
+        pending_item_dict["tree_row"] = self.row_reference(tree_iter)
+
+    def add_item(self, item_dict, pending_item_dict=None):
+        """
+        Adds a row for the given video, reusing the row of
+        'pending_item_dict' if it's the resolved version of a playlist entry
+        """
+        video_item = item_dict["video_item"]
+        values = [
+            item_dict,
+            video_item.title,
+            bf.duration_text(video_item),
+            bf.hosting_name(video_item),
+            self.format_text(item_dict),
+            STATUS_NAMES[item_dict["status"]],
+            0
+        ]
+
+        tree_iter = self.tree_iter(pending_item_dict)
+        if tree_iter is not None:
+            self.store.set(tree_iter, list(range(len(values))), values)
+        else:
+            tree_iter = self.store.append(values)
+
+        item_dict["tree_row"] = self.row_reference(tree_iter)
+
+    def update_item(self, item_dict):
+        """ Refreshes the format and status columns of the given video """
+        tree_iter = self.tree_iter(item_dict)
+        if tree_iter is None:
+            return
+
+        if "video_item" in item_dict:
+            self.store.set_value(tree_iter, COL_FORMAT,
+                                 self.format_text(item_dict))
+        self.store.set_value(tree_iter, COL_STATUS,
+                             STATUS_NAMES[item_dict["status"]])
+
+    def show_progress(self, item_dict, progress_state):
+        """
+        Shows the status of the given video and, while it is being
+        downloaded, its progress (a ProgressState)
+        """
+        tree_iter = self.tree_iter(item_dict)
+        if tree_iter is None:
+            return
+
+        status = item_dict["status"]
+        if status == "downloading":
+            fraction = progress_state.fraction() or 0
+            status_text = bf.progress_text(progress_state)
+        else:
+            fraction = 1 if status == "downloaded" else 0
+            status_text = STATUS_NAMES[status]
+
+        self.store.set(tree_iter, [COL_STATUS, COL_PROGRESS],
+                       [status_text, int(fraction * 100)])
+
+    def show_pending_error(self, pending_item_dict, error_msg):
+        """ Tells the user that an entry's details couldn't be extracted """
+        tree_iter = self.tree_iter(pending_item_dict)
+        if tree_iter is not None:
+            self.store.set_value(tree_iter, COL_STATUS, error_msg)
+
+    def remove_item(self, item_dict):
+        """ Removes the given video's row """
+        tree_iter = self.tree_iter(item_dict)
+        if tree_iter is not None:
+            self.store.remove(tree_iter)
+
+    def clear(self):
+        """ Removes all rows """
+        self.store.clear()
+
+    def row_reference(self, tree_iter):
+        """ Returns a Gtk.TreeRowReference pointing to the given row """
+        return Gtk.TreeRowReference.new(self.store,
+                                        self.store.get_path(tree_iter))
+
+    def tree_iter(self, item_dict):
+        """
+        Returns a Gtk.TreeIter pointing to the item's row, or None if
+        the item has no (valid) row
+        """
+        if item_dict is None or "tree_row" not in item_dict:
+            return None
+
+        tree_row = item_dict["tree_row"]
+        if not tree_row.valid():
+            return None
+
+        return self.store.get_iter(tree_row.get_path())
+
+    def format_text(self, item_dict):
+        """ Describes the format selected for download """
+        format_id = item_dict.get("download_format_id")
+        if format_id is None:
+            return "-"
+
+        return bf.human_readable_format(format_id, item_dict["video_item"])
+
+    def row_activated(self, tree_view, path, column):
+        """
+        Builds and shows the download options popover of the activated
+        video, pointing at its row
+        """
+        item_dict = self.store[path][COL_ITEM]
+        # playlist entries still being resolved have no options yet
+        if "video_item" not in item_dict:
+            return
+
+        popover = FormatPopover(
+            self.main_window, item_dict, self,
+            format_changed=lambda format_id: self.update_item(item_dict),
+            download=lambda: self.download_item(item_dict, popover)
+        )
+        # cell areas are relative to the view's scrolled content
+        cell_area = self.get_cell_area(path, column)
+        cell_area.x, cell_area.y = self.convert_bin_window_to_widget_coords(
+            cell_area.x, cell_area.y
+        )
+        popover.set_pointing_to(cell_area)
+        # the popover is built again the next time it's needed
+        popover.connect("closed", lambda popover: popover.destroy())
+        popover.popup()
+
+    def download_item(self, item_dict, popover):
+        """ Queues the video for download from its options popover """
+        popover.popdown()
+        self.main_window.queue_download(item_dict, PRIORITY_HIGH)
+        self.update_item(item_dict)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+import time
+from threading import Lock
+
+# How much a bucket can save up while idle, in seconds of its rate; this is
+# how far above the limit a download can go for a moment
+BURST_SECONDS = 0.25
+# ... but never less than this many bytes, so small blocks aren't delayed
+MIN_BURST = 65536
+
+
+class TokenBucket(object):
+    """
+    Classic token bucket: 'rate' tokens (bytes) per second flow in, up to
+    a burst size. consume() takes tokens; if there aren't enough, the
+    caller sleeps until the debt has been paid back. Callers going into
+    debt one after another queue up behind each other, so however many
+    threads share the bucket, together they don't get more than 'rate'.
+    rate=None means no limit.
+    """
+
+    def __init__(self, rate=None):
+        self._lock = Lock()
+        self.rate = None
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """ Changes the rate (bytes per second, None = unlimited) """
+        with self._lock:
+            self._refill()
+            self.rate = rate or None
+            if self.rate is not None:
+                self._burst = max(self.rate * BURST_SECONDS, MIN_BURST)
+                self._tokens = min(self._tokens, self._burst)
+
+    def consume(self, amount):
+        """ Takes 'amount' tokens, sleeping as long as needed to get them """
+        with self._lock:
+            if self.rate is None:
+                return
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return
+            wait = -self._tokens / self.rate
+
+        time.sleep(wait)
+
+    def _refill(self):
+        """ Adds tokens for the time since the last call. Needs the lock. """
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._updated) * self.rate
+            )
+        self._updated = now
+
+
+class RateLimiter(object):
+    """
+    Caps the download speed of the whole process: all downloads draw from
+    one TokenBucket; with a per-host rate, downloads from each host also
+    draw from a bucket of that host. Rates can be changed at any time and
+    apply to running downloads right away.
+    """
+
+    def __init__(self, rate=None, per_host_rate=None):
+        self._total = TokenBucket(rate)
+        self._per_host_rate = per_host_rate
+        self._hosts = {}
+        self._lock = Lock()
+
+    @property
+    def rate(self):
+        return self._total.rate
+
+    @property
+    def per_host_rate(self):
+        return self._per_host_rate
+
+    def set_rate(self, rate):
+        """ Sets the total limit in bytes per second (None = unlimited) """
+        self._total.set_rate(rate)
+
+    def set_per_host_rate(self, rate):
+        """ Sets the limit of each host in bytes per second (None = none) """
+        with self._lock:
+            self._per_host_rate = rate or None
+            for bucket in self._hosts.values():
+                bucket.set_rate(self._per_host_rate)
+
+    def throttle(self, host, amount):
+        """
+        Accounts for 'amount' bytes downloaded from 'host'; blocks the
+        calling (download) thread while it is over the limits
+        """
+        if self._per_host_rate is not None:
+            with self._lock:
+                bucket = self._hosts.get(host)
+                if bucket is None:
+                    bucket = self._hosts[host] = TokenBucket(self._per_host_rate)
+            bucket.consume(amount)
+
+        self._total.consume(amount)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import traceback
+from collections import deque
+from threading import Lock
+from time import perf_counter
+
+import gi
+gi.require_version('Gtk', '3.0')
+from gi.repository import GLib
+
+import log_sink
+
+# How long one batch of row insertions may block the main loop, in seconds;
+# about half of a frame at 60 fps, leaving the rest for layout and drawing
+FRAME_BUDGET = 0.008
+
+
+class RowInserter(object):
+    """
+    Coalesces row insertions requested from any thread and runs them in the
+    GTK main loop in batches, each taking at most 'budget' seconds. Between
+    batches GTK gets to redraw the window and handle input, so adding
+    thousands of rows doesn't freeze the UI.
+
+    Insertions are queued as functions which create and add a row and return
+    it (or None); returned rows are shown with their own show_all(), never
+    by calling show_all() over the whole ListBox. Queued functions always
+    run in the order they were queued.
+    """
+
+    def __init__(self, budget=FRAME_BUDGET):
+        self.budget = budget
+
+        self._pending = deque()
+        self._lock = Lock()
+        # True while an idle callback for the next batch is registered
+        self._scheduled = False
+        # Called (in the main loop) after each batch
+        self.batch_callback = None
+
+    def queue(self, function, *args):
+        """
+        Queues function(*args) to be run in the main loop.
+        May be called from any thread.
+        """
+        with self._lock:
+            self._pending.append((function, args))
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        # Default idle priority is lower than redrawing, so each batch
+        # happens after the window has been updated
+        GLib.idle_add(self._insert_batch)
+
+    def clear(self):
+        """ Drops all insertions which haven't run yet """
+        with self._lock:
+            self._pending.clear()
+
+    def pending(self):
+        """ Returns the number of insertions which haven't run yet """
+        with self._lock:
+            return len(self._pending)
+
+    def _insert_batch(self):
+        """
+        Idle callback: runs queued insertions until the queue is empty or
+        the time budget is used up. Returns True (= run again) if anything
+        is left in the queue.
+        """
+        deadline = perf_counter() + self.budget
+        new_rows = []
+
+        try:
+            while True:
+                with self._lock:
+                    if not self._pending:
+                        break
+                    function, args = self._pending.popleft()
+
+                # one broken insertion mustn't stop the ones after it
+                row = self._run_logged(function, *args)
+                if row is not None:
+                    new_rows.append(row)
+
+                if perf_counter() >= deadline:
+                    break
+
+            for row in new_rows:
+                self._run_logged(row.show_all)
+
+            if self.batch_callback is not None:
+                self._run_logged(self.batch_callback)
+        finally:
+            # GLib drops the callback if it raises, so this must always
+            # say whether another batch is coming
+            with self._lock:
+                self._scheduled = bool(self._pending)
+                run_again = self._scheduled
+
+        return run_again
+
+    def _run_logged(self, function, *args):
+        """
+        Returns function(*args); if it raises, the error is logged and
+        None returned
+        """
+        try:
+            return function(*args)
+        except Exception:
+            log_sink.get_sink().log(
+                log_sink.ERROR, "Row insertion failed:\n{}".format(
+                    traceback.format_exc()))
+            return None
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import json
+import time
+import http.client
+import urllib.request
+from threading import Thread, Lock, Event
+
+# How many connections a segmented download uses by default
+DEFAULT_SEGMENTS = 4
+# Files smaller than this aren't worth splitting
+MIN_SEGMENT_SIZE = 4 * 1048576
+# Size of the blocks read from each connection
+BLOCK_SIZE = 65536
+# How many times a segment is resumed after a connection error
+SEGMENT_RETRIES = 3
+TIMEOUT = 30
+# How often the offsets reached by the segments are saved, in seconds
+STATE_INTERVAL = 1.0
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class RangesNotSupported(Exception):
+    """
+    Raised by download_segmented before anything is written if the server
+    doesn't answer range requests (or the file is too small to split);
+    the caller should download the file in the usual way
+    """
+
+
+def can_segment(format_dict):
+    """
+    Returns True if the given format is a single file fetched over plain
+    HTTP(S), i.e. a candidate for download_segmented
+    """
+    return format_dict is not None \
+        and format_dict.get("protocol") in ("http", "https") \
+        and bool(format_dict.get("url"))
+
+def request_headers(format_dict):
+    """
+    Returns the HTTP headers to send for the given format; compression is
+    turned off, as byte ranges refer to the file as it is
+    """
+    headers = dict(format_dict.get("http_headers") or {})
+    headers["Accept-Encoding"] = "identity"
+    return headers
+
+def probe_size(url, headers):
+    """
+    Asks for the first byte of 'url'; returns the size of the file if
+    the server answers with a partial response, raises RangesNotSupported
+    otherwise
+    """
+    request = urllib.request.Request(url, headers=dict(headers,
+                                                       Range="bytes=0-0"))
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        match = CONTENT_RANGE.match(response.headers.get("Content-Range", ""))
+        if response.status != 206 or match is None:
+            raise RangesNotSupported(url)
+        return int(match.group(3))
+
+def split_ranges(size, segments):
+    """ Returns [(start, end)] byte ranges (end excluded) covering 'size' """
+    segment_size = -(-size // segments)
+    return [(start, min(size, start + segment_size))
+            for start in range(0, size, segment_size)]
+
+
+class SegmentedDownload(object):
+    """
+    Downloads one file over several connections at once, each fetching
+    its own byte range and writing it at its offset (os.pwrite) into
+    a file preallocated to the full size. Progress is reported to
+    'progress_hook' in the shape of YoutubeDL's progress hook dicts;
+    'throttle(bytes)' is called for every block, e.g. to apply a rate limit.
+
+    How far each segment got is saved next to the file (".segmented.state")
+    every STATE_INTERVAL seconds and when the download fails, so an
+    interrupted download (e.g. of a restored queue) continues where its
+    segments stopped, as long as the file on the server has the same size.
+    """
+
+    def __init__(self, url, where, headers=None, segments=DEFAULT_SEGMENTS,
+                 progress_hook=None, throttle=None):
+        self.url = url
+        self.where = where
+        self.headers = headers or {}
+        self.segments = segments
+        self.progress_hook = progress_hook
+        self.throttle = throttle
+
+        # Not the name YoutubeDL uses for its .part files: it would
+        # 'continue' a preallocated file from its full size
+        self.part_path = where + ".segmented.part"
+        self.state_path = where + ".segmented.state"
+        self.size = None
+        # including what was downloaded before the download was continued
+        self.downloaded_bytes = 0
+        self.resumed_bytes = 0
+        # [start, offset reached, end] of every segment
+        self._ranges = []
+        self._state_saved = 0
+        self._lock = Lock()
+        self._failed = Event()
+        self._errors = []
+        self._start_time = None
+
+    def run(self):
+        """
+        Downloads the file; raises RangesNotSupported (before anything is
+        written) if it can't be downloaded in segments
+        """
+        if os.path.exists(self.where):
+            # like YoutubeDL, don't download it again
+            self.report("finished", os.path.getsize(self.where))
+            return
+
+        self.size = probe_size(self.url, self.headers)
+        if self.size < MIN_SEGMENT_SIZE:
+            raise RangesNotSupported("File too small: {}".format(self.url))
+
+        self._start_time = time.monotonic()
+        self._ranges = self.load_state()
+        if self._ranges is not None:
+            fd = os.open(self.part_path, os.O_WRONLY)
+            self.resumed_bytes = self.downloaded_bytes = sum(
+                offset - start for start, offset, end in self._ranges)
+        else:
+            self._ranges = [[start, start, end] for start, end
+                            in split_ranges(self.size, self.segments)]
+            fd = os.open(self.part_path,
+                         os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if not self.resumed_bytes:
+                # reserve the space up front, so segments don't make the
+                # file grow in pieces (and a full disk shows up right away)
+                if hasattr(os, "posix_fallocate"):
+                    os.posix_fallocate(fd, 0, self.size)
+                else:
+                    os.ftruncate(fd, self.size)
+
+            threads = [Thread(target=self.run_segment, args=(fd, segment))
+                       for segment in self._ranges if segment[1] < segment[2]]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            os.close(fd)
+
+        # every byte must have been written: the preallocated file would
+        # have holes of zeros otherwise
+        if not self._errors and self.downloaded_bytes != self.size:
+            self._errors.append(OSError(
+                "Incomplete download: {} of {} bytes of {}".format(
+                    self.downloaded_bytes, self.size, self.url)))
+
+        if self._errors:
+            if any(isinstance(error, RangesNotSupported)
+                   for error in self._errors):
+                # the caller downloads it another way
+                self.remove_partial()
+            else:
+                # kept for the next attempt
+                self.save_state()
+            self.report("error", self.downloaded_bytes)
+            raise self._errors[0]
+
+        os.replace(self.part_path, self.where)
+        self.remove_state()
+        self.report("finished", self.size)
+
+    def load_state(self):
+        """
+        Returns the segment ranges saved by an interrupted download of
+        the same file, or None if there are none (or they don't fit)
+        """
+        try:
+            with open(self.state_path, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+        try:
+            part_size = os.path.getsize(self.part_path)
+        except OSError:
+            return None
+        if state.get("size") != self.size or part_size != self.size:
+            return None
+        return state["ranges"]
+
+    def save_state(self):
+        """ Saves how far each segment got, see load_state """
+        with self._lock:
+            state = {"size": self.size,
+                     "ranges": [list(segment) for segment in self._ranges]}
+            self._state_saved = time.monotonic()
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self.state_path)
+
+    def remove_state(self):
+        try:
+            os.remove(self.state_path)
+        except FileNotFoundError:
+            pass
+
+    def remove_partial(self):
+        """ Removes the partly downloaded file and its state """
+        self.remove_state()
+        try:
+            os.remove(self.part_path)
+        except FileNotFoundError:
+            pass
+
+    def run_segment(self, fd, segment):
+        """
+        Segment thread: fetch_segment, recording any error it raises
+        (e.g. from the progress hook or throttle) so that run() fails
+        """
+        try:
+            self.fetch_segment(fd, segment)
+        except Exception as error:
+            self._errors.append(error)
+            self._failed.set()
+
+    def fetch_segment(self, fd, segment):
+        """
+        Segment thread: downloads the bytes of 'segment' ([start, offset
+        reached, end]) from its offset up to end-1 into 'fd'
+        """
+        _, offset, end = segment
+        retries = 0
+
+        while offset < end and not self._failed.is_set():
+            request = urllib.request.Request(
+                self.url, headers=dict(self.headers, Range="bytes={}-{}".format(
+                    offset, end - 1))
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+                    if response.status != 206:
+                        raise RangesNotSupported(self.url)
+                    while offset < end and not self._failed.is_set():
+                        block = response.read(min(BLOCK_SIZE, end - offset))
+                        if not block:
+                            # the response ended early; that's a failed
+                            # attempt too, or a server which always does
+                            # would keep this going forever
+                            raise http.client.IncompleteRead(b"",
+                                                             end - offset)
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                        segment[1] = offset
+                        self.block_done(len(block))
+            except (OSError, http.client.HTTPException,
+                    RangesNotSupported) as error:
+                retries += 1
+                if isinstance(error, RangesNotSupported) \
+                or retries > SEGMENT_RETRIES:
+                    self._errors.append(error)
+                    # no use going on with the other segments
+                    self._failed.set()
+                    return
+
+    def block_done(self, block_size):
+        """ Accounts for a block written by one of the segment threads """
+        with self._lock:
+            self.downloaded_bytes += block_size
+            downloaded_bytes = self.downloaded_bytes
+            save = time.monotonic() - self._state_saved >= STATE_INTERVAL
+            if save:
+                # the other segments needn't save it as well
+                self._state_saved = time.monotonic()
+
+        if save:
+            self.save_state()
+
+        self.report("downloading", downloaded_bytes)
+        if self.throttle is not None:
+            self.throttle(block_size)
+
+    def report(self, status, downloaded_bytes):
+        """ Calls the progress hook with a YoutubeDL-like dict """
+        if self.progress_hook is None:
+            return
+
+        hook_dict = {
+            "status": status,
+            "filename": self.where,
+            "downloaded_bytes": downloaded_bytes,
+            "total_bytes": self.size or downloaded_bytes,
+        }
+        if status == "downloading":
+            elapsed = time.monotonic() - self._start_time
+            speed = downloaded_bytes / elapsed if elapsed > 0 else None
+            hook_dict["speed"] = speed
+            if speed:
+                hook_dict["eta"] = (self.size - downloaded_bytes) / speed
+        self.progress_hook(hook_dict)
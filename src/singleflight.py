@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+from concurrent.futures import Future
+from threading import Lock
+
+
+class SingleFlight(object):
+    """
+    Makes concurrent calls for the same key share one execution: the first
+    caller runs the function, the others wait for its result (or exception)
+    instead of running it again. Once it's done, the key is forgotten;
+    the next call runs the function anew.
+    """
+
+    def __init__(self):
+        # key: Future of the call in progress
+        self._in_flight = {}
+        self._lock = Lock()
+
+    def do(self, key, function, *args, **kwargs):
+        """
+        Returns (result of function(*args, **kwargs), shared), where
+        'shared' is True if the result comes from a call started by someone
+        else. Exceptions of the function are raised to all callers.
+        """
+        with self._lock:
+            future = self._in_flight.get(key)
+            shared = future is not None
+            if not shared:
+                future = Future()
+                self._in_flight[key] = future
+
+        if shared:
+            return future.result(), True
+
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+        return future.result(), False
+
+    def in_flight(self, key):
+        """ Returns True if a call for 'key' is running right now """
+        with self._lock:
+            return key in self._in_flight
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+# Size thumbnails are scaled down to (keeping their aspect ratio)
+THUMBNAIL_WIDTH = 96
+THUMBNAIL_HEIGHT = 54
+# How many thumbnails are downloaded and decoded at once
+FETCH_WORKERS = 4
+# How many decoded thumbnails are kept in memory
+MEMORY_ITEMS = 300
+# Upper bound on the size of all thumbnails in the disk cache, in bytes
+DISK_MAX_SIZE = 32 * 1048576
+# Bigger downloads aren't thumbnails
+MAX_IMAGE_SIZE = 8 * 1048576
+TIMEOUT = 15
+
+
+def default_thumbnail_dir():
+    """ Returns the directory of cached thumbnails in the user's cache dir """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or \
+        os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "catfetch", "thumbnails")
+
+
+def fetch_image(url):
+    """ Downloads an image; raises OSError if it can't be had """
+    request = urllib.request.Request(url, headers={"User-Agent": "CatFetch"})
+    with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+        data = response.read(MAX_IMAGE_SIZE + 1)
+    if len(data) > MAX_IMAGE_SIZE:
+        raise OSError("Image too big: {}".format(url))
+    return data
+
+def decode_thumbnail(data, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """
+    Returns a GdkPixbuf of the image in 'data', scaled down to fit into
+    width x height; raises ValueError if it isn't an image GdkPixbuf can
+    read. Doesn't need the main loop, so it runs in the worker threads.
+    """
+    # imported here: the rest of this module works without GTK
+    import gi
+    gi.require_version('GdkPixbuf', '2.0')
+    from gi.repository import GdkPixbuf, Gio, GLib
+
+    stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data))
+    try:
+        return GdkPixbuf.Pixbuf.new_from_stream_at_scale(
+            stream, width, height, True, None
+        )
+    except GLib.Error as error:
+        raise ValueError(error.message)
+
+def encode_thumbnail(pixbuf):
+    """ Returns a decoded thumbnail as PNG data for the disk cache """
+    _, data = pixbuf.save_to_bufferv("png", [], [])
+    return data
+
+
+class DiskCache(object):
+    """
+    Directory of image files named after the hash of their address. When
+    they take more than 'max_size' bytes, the least recently used ones
+    (by modification time, which get() updates) are deleted.
+    """
+
+    def __init__(self, path=None, max_size=DISK_MAX_SIZE):
+        self.path = path or default_thumbnail_dir()
+        self.max_size = max_size
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock = Lock()
+        # file name: [size, last used]
+        self._files = {}
+        for entry in os.scandir(self.path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                self._files[entry.name] = [stat.st_size, stat.st_mtime]
+        self._size = sum(size for size, _ in self._files.values())
+
+    def get(self, url):
+        """ Returns the cached data for 'url', or None """
+        name = self.file_name(url)
+        path = os.path.join(self.path, name)
+        try:
+            with open(path, "rb") as cached_file:
+                data = cached_file.read()
+            os.utime(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            if name in self._files:
+                self._files[name][1] = os.path.getmtime(path)
+        return data
+
+    def put(self, url, data):
+        """ Stores 'data' for 'url', making room for it if needed """
+        name = self.file_name(url)
+        path = os.path.join(self.path, name)
+        # written under another name first, so get() never reads half a file
+        temp_path = path + ".tmp"
+        try:
+            with open(temp_path, "wb") as cached_file:
+                cached_file.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            old_size = self._files.get(name, [0])[0]
+            self._files[name] = [len(data), os.path.getmtime(path)]
+            self._size += len(data) - old_size
+            self._evict()
+
+    def file_name(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _evict(self):
+        """ Deletes the least recently used files while over max_size """
+        if self._size <= self.max_size:
+            return
+
+        by_last_use = sorted(self._files.items(), key=lambda item: item[1][1])
+        for name, (size, _) in by_last_use:
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            del self._files[name]
+            self._size -= size
+
+
+class ThumbnailService(object):
+    """
+    Loads thumbnails in the background: request() hands the address to a
+    small pool of threads, which take the image from the disk cache or
+    download it, scale it down with 'decode' and call back with the result.
+    The last 'memory_items' results are kept in memory (least recently used
+    are dropped first), so rows scrolled back into view get their thumbnail
+    right away. Concurrent requests for the same address share one load.
+
+    'decode(data)' turns image data into the thumbnail (decode_thumbnail by
+    default) and 'encode(thumbnail)' back into data for the disk cache, so
+    scaled-down images are what's cached. With decode=None, thumbnails are
+    the raw image data (e.g. for tools without GTK).
+    """
+
+    def __init__(self, workers=FETCH_WORKERS, cache_dir=None,
+                 disk_max_size=DISK_MAX_SIZE, memory_items=MEMORY_ITEMS,
+                 decode=decode_thumbnail, encode=encode_thumbnail):
+        self.decode = decode
+        self.encode = encode
+        self.disk_cache = DiskCache(cache_dir, disk_max_size)
+        self.memory_items = memory_items
+
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._lock = Lock()
+        # url: thumbnail (None if it couldn't be loaded), least recently
+        # used first
+        self._memory = OrderedDict()
+        # url: callbacks waiting for a load in progress
+        self._waiting = {}
+
+    def cached(self, url):
+        """ Returns the thumbnail of 'url' if it's in memory, else None """
+        with self._lock:
+            if url not in self._memory:
+                return None
+            self._memory.move_to_end(url)
+            return self._memory[url]
+
+    def request(self, url, callback):
+        """
+        Gets the thumbnail of image address 'url' and calls
+        callback(url, thumbnail), with thumbnail None if the image couldn't
+        be loaded. The callback is called right away if the thumbnail is in
+        memory, otherwise in a worker thread.
+        """
+        with self._lock:
+            if url in self._memory:
+                self._memory.move_to_end(url)
+                thumbnail = self._memory[url]
+            elif url in self._waiting:
+                self._waiting[url].append(callback)
+                return
+            else:
+                self._waiting[url] = [callback]
+                self._pool.submit(self.load, url)
+                return
+
+        callback(url, thumbnail)
+
+    def load(self, url):
+        """ Worker thread: loads a thumbnail and calls back its requesters """
+        thumbnail = None
+        try:
+            thumbnail = self.load_thumbnail(url)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # whatever went wrong, the requesters are told, or later
+            # requests of 'url' would only wait for this load forever
+            with self._lock:
+                self._memory[url] = thumbnail
+                while len(self._memory) > self.memory_items:
+                    self._memory.popitem(last=False)
+                callbacks = self._waiting.pop(url)
+
+            for callback in callbacks:
+                callback(url, thumbnail)
+
+    def load_thumbnail(self, url):
+        """ Returns the thumbnail from the disk cache or from the network """
+        data = self.disk_cache.get(url)
+        if data is not None:
+            return self.decode(data) if self.decode is not None else data
+
+        data = fetch_image(url)
+        if self.decode is None:
+            self.disk_cache.put(url, data)
+            return data
+
+        thumbnail = self.decode(data)
+        self.disk_cache.put(url, self.encode(thumbnail))
+        return thumbnail
+
+    def close(self):
+        """ Drops requests which haven't started yet """
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+from sys import intern
+
+import basic_functions as bf
+
+
+class Record(object):
+    """
+    Base of the compact records below. Besides attribute access, they can be
+    read like the youtube_dl dicts they are built from (record["title"],
+    "duration" in record, record.get("fps")), so basic_functions works with
+    both. A None value means the information is missing, as if the key
+    wasn't in the dict.
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        value = getattr(self, key, None)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return getattr(self, key, None) is not None
+
+    def get(self, key, default=None):
+        value = getattr(self, key, None)
+        return default if value is None else value
+
+
+class FormatInfo(Record):
+    """ What we keep of one format dict of a youtube_dl info dict """
+    __slots__ = (
+        "format_id", "format", "ext", "filesize", "vcodec", "acodec",
+        "resolution", "width", "height", "fps", "tbr", "abr",
+    )
+
+    def __init__(self, format_dict):
+        get = format_dict.get
+        # these repeat a lot (YouTube uses the same IDs and descriptions for
+        # every video), so all formats share the same string objects
+        self.format_id = intern_or_none(get("format_id"))
+        self.format = intern_or_none(get("format"))
+        self.ext = intern_or_none(get("ext"))
+        self.vcodec = intern_or_none(get("vcodec"))
+        self.acodec = intern_or_none(get("acodec"))
+        self.resolution = intern_or_none(get("resolution"))
+        self.filesize = get("filesize")
+        self.width = get("width")
+        self.height = get("height")
+        self.fps = get("fps")
+        self.tbr = get("tbr")
+        self.abr = get("abr")
+
+    def __setstate__(self, state):
+        # unpickled in another process (see extraction_pool), the strings
+        # are interned there again
+        _, slots = state
+        for key, value in slots.items():
+            setattr(self, key, intern_or_none(value))
+
+
+class VideoItem(Record):
+    """
+    What we keep of a youtube_dl info dict of one video: only what the rows
+    and the download need, instead of the whole dict with descriptions,
+    HTTP headers of every format, etc. (see data/sample_dict.txt).
+    The full dict stays in the on-disk info cache.
+
+    Formats are classified once: a_v_formats, video_formats and
+    audio_formats are ordered from the worst to the best quality (see
+    basic_functions.classify_formats) and share their FormatInfo objects
+    with 'formats'. '_formats_by_id' is the index get_format_by_id uses.
+    """
+    __slots__ = (
+        "id", "webpage_url", "title", "duration", "thumbnail", "extractor",
+        "extractor_key",
+        "formats", "a_v_formats", "video_formats", "audio_formats",
+        "_formats_by_id", "default_format_id",
+    )
+
+    def __init__(self, ytdl_info_dict):
+        get = ytdl_info_dict.get
+        self.id = get("id")
+        self.webpage_url = get("webpage_url")
+        self.title = get("title")
+        self.duration = get("duration")
+        # address of the image shown in the row (see thumbnails)
+        self.thumbnail = get("thumbnail")
+        self.extractor = intern_or_none(get("extractor"))
+        self.extractor_key = intern_or_none(get("extractor_key"))
+
+        raw_formats = get("formats") or []
+        # a video with a single format (e.g. a direct link) is its own
+        # format dict, like for basic_functions.get_format_by_id
+        if not raw_formats and get("format_id") is not None:
+            raw_formats = [ytdl_info_dict]
+        format_infos = {id(f): FormatInfo(f) for f in raw_formats}
+        self.formats = tuple(format_infos[id(f)] for f in raw_formats)
+
+        # classify the raw dicts so the rules stay exactly those of
+        # basic_functions, then swap in our records
+        a_v_s, video_s, audio_s = bf.classify_formats(raw_formats)
+        self.a_v_formats = tuple(format_infos[id(f)] for f in a_v_s)
+        self.video_formats = tuple(format_infos[id(f)] for f in video_s)
+        self.audio_formats = tuple(format_infos[id(f)] for f in audio_s)
+
+        # first format with a given ID wins, as in get_format_by_id
+        self._formats_by_id = {}
+        for format_info in self.formats:
+            self._formats_by_id.setdefault(format_info.format_id, format_info)
+
+        # Pre-select the best a/v format (the last one); if there are none,
+        # the best of the rest. Some extractors give no formats at all
+        # (e.g. for live streams).
+        if self.a_v_formats:
+            self.default_format_id = self.a_v_formats[-1].format_id
+        elif self.formats:
+            self.default_format_id = max(
+                self.formats, key=bf.format_quality).format_id
+        else:
+            self.default_format_id = get("format_id")
+
+
+def intern_or_none(value):
+    """ Returns sys.intern(value) for strings, other values unchanged """
+    if isinstance(value, str):
+        return intern(value)
+    return value
@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
+import os
+import re
+import time
 from sys import argv
 from pprint import pprint
-import youtube_dl
+from urllib.parse import urlsplit, urlunsplit
+from threading import Lock, local
+
+from info_cache import InfoCache
+from rate_limit import RateLimiter
+import segmented
+import http_fixtures
+import basic_functions as bf
+import log_sink
+import instrument
+import metrics
 
 # ydl_opts = {}
 # with youtube_dl.YoutubeDL(ydl_opts) as ydl:
@@ -13,40 +26,125 @@ import youtube_dl
 #     ydl.download(["https://www.youtube.com/watch?v=ylzkOPBrdx0"])
 
 
+# youtube_dl (with its over a thousand extractors) takes a good part of
+# a second to import, so it isn't imported along with this module: the
+# window can be shown first. load_youtube_dl() imports it when it's first
+# needed; warm_up() does it ahead of time, in the background.
+youtube_dl = None
+_import_lock = Lock()
+
+def load_youtube_dl():
+    """ Returns the youtube_dl module, importing it on first use """
+    global youtube_dl
+
+    if youtube_dl is None:
+        with _import_lock:
+            if youtube_dl is None:
+                import youtube_dl as youtube_dl_module
+                youtube_dl = youtube_dl_module
+
+    return youtube_dl
+
+def warm_up():
+    """
+    Imports youtube_dl and compiles the address patterns of all its
+    extractors, which YoutubeDL otherwise does during the first extraction
+    (the compiled patterns are kept by the extractor classes, so all threads
+    profit). Meant to be run in a background thread.
+    """
+    ytdl = load_youtube_dl()
+    for extractor_class in ytdl.extractor.gen_extractor_classes():
+        extractor_class.suitable("")
+
+
+class ExtractionError(Exception):
+    """
+    Raised by extract_vid_info when YoutubeDL can't get information about
+    an address; str() of it is YoutubeDL's message, without its 'ERROR:'
+    prefix and terminal colors
+    """
+
+    def __init__(self, ytdl_error):
+        message = str(ytdl_error)
+        # YoutubeDL colors the prefix red when stderr is a terminal
+        message = re.sub(r"\x1b\[[0-9;]*m", "", message)
+        if message.startswith("ERROR: "):
+            message = message[len("ERROR: "):]
+        super(ExtractionError, self).__init__(message)
+
+
 class MyLogger(object):
     """
     Used by YoutubeDL to pass various information into. There are three types
     of messages: debug (most common, just tells what YoutubeDL is doing ATM),
-    warning and error. For now, we just print them to the stdout.
+    warning and error. They go to the log sink (see log_sink.LogSink), tagged
+    with the address and phase the calling thread is working on, instead of
+    being printed by each worker thread.
     """
-    # TODO: Find a more meaningful way to handle log messages
+    def __init__(self):
+        self.sink = log_sink.get_sink()
+
     def debug(self, msg):
-        print("YDL DEBUG: {}".format(msg))
+        self.sink.log(log_sink.DEBUG, msg)
 
     def warning(self, msg):
-        print("YDL WARNING: {}".format(msg))
+        self.sink.log(log_sink.WARNING, msg)
 
     def error(self, msg):
-        print("YDL ERROR: {}".format(msg))
+        self.sink.log(log_sink.ERROR, msg)
+
+
+# What the download running in the current thread wants to be told, and
+# how much it has downloaded so far; set by download_vid, used by my_hook
+_current_download = local()
 
+# All downloads of the process draw from this; see get_rate_limiter()
+_rate_limiter = RateLimiter()
+
+def get_rate_limiter():
+    """
+    Returns the process-wide RateLimiter; its rates can be changed at any
+    time (e.g. from the window's menu) and apply to running downloads
+    """
+    return _rate_limiter
 
 def my_hook(hook_dict):
     """
-    Actions to be launched on various YoutubeDL events can be specified here
+    Actions to be launched on various YoutubeDL events can be specified here.
+    Progress ("downloading") events are passed on to the progress_hook given
+    to download_vid, if any; they come for every downloaded block, so they
+    must be cheap. They also go through the rate limiter, which holds the
+    download thread back (between two blocks) while it's over the limit.
     """
-    # TODO: Find a more meaningful use for the events
+    progress_hook = getattr(_current_download, "progress_hook", None)
+    if progress_hook is not None:
+        progress_hook(hook_dict)
+
+    downloaded_bytes = hook_dict.get("downloaded_bytes")
+    if hook_dict["status"] == "downloading" and downloaded_bytes is not None:
+        last_bytes = getattr(_current_download, "downloaded_bytes", None)
+        # the first report of a continued download includes what had been
+        # downloaded before; a smaller number means another file has begun
+        # (e.g. the audio part of a video)
+        if last_bytes is not None:
+            if downloaded_bytes >= last_bytes:
+                delta = downloaded_bytes - last_bytes
+            else:
+                delta = downloaded_bytes
+            metrics.count_downloaded(delta)
+            _rate_limiter.throttle(_current_download.host, delta)
+        _current_download.downloaded_bytes = downloaded_bytes
+
     if hook_dict['status'] == 'finished':
-        print('my_hook: finished')
-        print("filename: {}".format(hook_dict["filename"]))
-    if hook_dict['status'] == 'downloading':
-        print("my_hook: downloading")
-        # print("downloaded_bytes: {}".format(hook_dict["downloaded_bytes"]))
-        # print("total_bytes: {}".format(hook_dict["total_bytes"]))
-        # print("elapsed: {}".format(hook_dict["elapsed"]))
-        # print("eta: {}".format(hook_dict["eta"]))
-        # print("speed: {}".format(hook_dict["speed"]))
+        # no "elapsed" if the file had been downloaded already
+        if hook_dict.get("elapsed") and downloaded_bytes:
+            metrics.DOWNLOAD_SPEED.observe(
+                downloaded_bytes / hook_dict["elapsed"])
+        log_sink.get_sink().log(
+            log_sink.INFO, "Finished: {}".format(hook_dict["filename"])
+        )
     if hook_dict['status'] == "error":
-        print("my_hook: error")
+        log_sink.get_sink().log(log_sink.ERROR, "Download failed")
 
 
 # ydl_opts = {
@@ -64,28 +162,236 @@ def my_hook(hook_dict):
 #     ydl.download(['http://www.youtube.com/watch?v=BaW_jenozKc'])
 
 
-def extract_vid_info(url):
-    """
-    Lets YoutubeDL check out the given address and returns an 'info dict'
-    containing all data we can get about the video
-    """
-    info_ydl_opts = {
-        "logger": MyLogger(),
-        "progress_hooks": [my_hook],
+# Options the long-lived YoutubeDL objects are built with; per-call options
+# (format, outtmpl) are set right before each use
+YDL_BASE_OPTS = {
+    "info": {
         # this is so that we get information about the best possible format
         # on the first call and only go through the dictionary to find
         # lower quality formats
         "format": "best"
+    },
+    "download": {
+        # progress is shown by the UI; without this YoutubeDL would also
+        # format a progress line for the log for every downloaded block
+        "noprogress": True,
+        # continue .part files left by an interrupted download (e.g. of
+        # a restored queue) with a range request instead of starting over
+        "continuedl": True
     }
+}
+
+# Every thread gets its own YoutubeDL objects, one for extraction and one
+# for downloads. Building a YoutubeDL (option parsing, extractor registry,
+# cookie jar and URL opener) is expensive, while sharing one between threads
+# isn't safe, so each worker thread keeps and reuses its own.
+_thread_ydls = local()
+
+def get_ydl(kind):
+    """
+    Returns the calling thread's YoutubeDL object of the given 'kind'
+    ("info" or "download"), creating it on first use
+    """
+    ydl = getattr(_thread_ydls, kind, None)
+
+    if ydl is None:
+        ydl_opts = {
+            "logger": MyLogger(),
+            "progress_hooks": [my_hook],
+        }
+        ydl_opts.update(YDL_BASE_OPTS[kind])
+        ydl = load_youtube_dl().YoutubeDL(ydl_opts)
+        setattr(_thread_ydls, kind, ydl)
+
+    return ydl
+
+# The on-disk cache of info dicts; opened on first use by get_info_cache()
+_info_cache = None
+_info_cache_lock = Lock()
+
+def get_info_cache():
+    """ Returns the shared InfoCache instance, opening it if necessary """
+    global _info_cache
 
-    info_ydl = youtube_dl.YoutubeDL(info_ydl_opts)
-    # this creates a huge dict containing detailed video info
-    info_dict = info_ydl.extract_info(url, download=False)
+    with _info_cache_lock:
+        if _info_cache is None:
+            _info_cache = InfoCache()
 
-    # this prints format info to stdout, the way youtube-dl does. not really useful.
-    # ydl.list_formats(info_dict)
+    return _info_cache
 
-    return info_dict
+def canonical_url(url):
+    """
+    Returns a normalized form of 'url': surrounding whitespace and
+    the #fragment are dropped and the scheme and host are lowercased.
+    Used as the video key of addresses no extractor knows (see video_key).
+    """
+    parts = urlsplit(url.strip())
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(),
+                       parts.path, parts.query, ""))
+
+def video_key(url, ie_key=None):
+    """
+    Returns a key identifying the video (or playlist) at 'url' whatever
+    the form of the address: "<extractor>:<ID>" as matched by the address
+    pattern of the extractor YoutubeDL would use, e.g. "Youtube:GoImjQOEp-Q"
+    for youtu.be, youtube.com/watch?v= and m.youtube.com addresses alike.
+    It's the same as info_key() of the extracted info dict, so it can be
+    computed without extracting anything. Addresses only the Generic
+    extractor takes (or whose pattern has no ID) get canonical_url().
+    'ie_key' is the extractor given with a playlist entry, whose address
+    may be a bare ID.
+    """
+    url = url.strip()
+    if ie_key is not None and not urlsplit(url).scheme:
+        return "{}:{}".format(ie_key, url)
+
+    extractor = load_youtube_dl().extractor
+    if ie_key is not None:
+        extractor_classes = [extractor.get_info_extractor(ie_key)]
+    else:
+        # in the order YoutubeDL tries them
+        extractor_classes = extractor.gen_extractor_classes()
+
+    for extractor_class in extractor_classes:
+        if extractor_class.ie_key() == "Generic":
+            break
+        if not extractor_class.suitable(url):
+            continue
+        try:
+            video_id = extractor_class._match_id(url)
+        except IndexError:
+            # the pattern has no 'id' group
+            break
+        # an 'id' group which didn't match comes back as "None"
+        if video_id and video_id != "None":
+            return "{}:{}".format(extractor_class.ie_key(), video_id)
+        break
+
+    return canonical_url(url)
+
+def key_extractor(key):
+    """
+    Returns the extractor named by a video_key(), e.g. "Youtube", or
+    "Generic" for canonical addresses
+    """
+    if ":" not in key or "://" in key:
+        return "Generic"
+    return key.split(":", 1)[0]
+
+def info_key(info_dict):
+    """
+    Returns the video key (see video_key) of an extracted info dict,
+    or None if it lacks the extractor or ID
+    """
+    if not info_dict.get("extractor_key") or not info_dict.get("id"):
+        return None
+    return "{}:{}".format(info_dict["extractor_key"], info_dict["id"])
+
+def extract_vid_info(url, use_cache=True, flat=False, ie_key=None):
+    """
+    Lets YoutubeDL check out the given address and returns an 'info dict'
+    containing all data we can get about the video.
+    Info dicts extracted recently are taken from the on-disk cache unless
+    use_cache=False.
+    With flat=True, playlists are not resolved: their "entries" only contain
+    what the playlist page itself says about each video (see
+    extract_entry_info). 'ie_key' makes YoutubeDL use the given extractor.
+    Raises ExtractionError if the address can't be extracted.
+    """
+    # all forms of the address share one cache entry
+    cache_key = video_key(url, ie_key)
+    flat_cache_key = "flat:{}".format(cache_key)
+
+    # timed by video key, like the other phases of the video, whatever
+    # form of its address was given
+    with log_sink.get_sink().context(url, "extract"), \
+         instrument.get_instrument().phase(cache_key, "extract"):
+        if use_cache:
+            cache = get_info_cache()
+            info_dict = cache.get(cache_key)
+            # a fully resolved playlist is fine for flat extraction too
+            if info_dict is None and flat:
+                info_dict = cache.get(flat_cache_key)
+            if info_dict is not None:
+                metrics.INFO_CACHE_REQUESTS.inc(result="hit")
+                log_sink.get_sink().log(log_sink.DEBUG, "Taken from the cache")
+                return info_dict
+            metrics.INFO_CACHE_REQUESTS.inc(result="miss")
+
+        info_ydl = get_ydl("info")
+        # with CATFETCH_RECORD_DIR or CATFETCH_REPLAY_DIR (see http_fixtures)
+        http_fixtures.install(info_ydl)
+        info_ydl.params["extract_flat"] = "in_playlist" if flat else False
+        # this creates a huge dict containing detailed video info
+        start = time.monotonic()
+        try:
+            info_dict = info_ydl.extract_info(url, download=False,
+                                              ie_key=ie_key)
+        except youtube_dl.utils.DownloadError as ytdl_error:
+            metrics.EXTRACTION_FAILURES.inc(
+                extractor=key_extractor(cache_key))
+            raise ExtractionError(ytdl_error)
+        finally:
+            metrics.EXTRACTION_SECONDS.observe(time.monotonic() - start)
+
+        # this prints format info to stdout, the way youtube-dl does. not really useful.
+        # ydl.list_formats(info_dict)
+
+        if flat and info_dict.get("_type") == "playlist":
+            get_info_cache().put(flat_cache_key, info_dict)
+        else:
+            cache_info_dict(cache_key, info_dict)
+
+        return info_dict
+
+def extract_entry_info(entry_dict):
+    """
+    Returns the full info dict of a video listed by a flat playlist
+    extraction (see extract_vid_info); if the entry is a playlist itself
+    (e.g. a tab of a channel), that is a resolved playlist
+    """
+    return extract_vid_info(entry_dict["url"], ie_key=entry_dict.get("ie_key"))
+
+def playlist_videos(playlist_dict):
+    """
+    Yields the entries of a playlist which are videos, or still to be
+    resolved (see is_flat_entry); playlists in the playlist (e.g. the tabs
+    of a channel) are gone through as well, and the None entries of
+    unavailable videos are skipped
+    """
+    for entry_dict in playlist_dict["entries"]:
+        if not entry_dict:
+            continue
+        if entry_dict.get("_type") == "playlist":
+            yield from playlist_videos(entry_dict)
+        else:
+            yield entry_dict
+
+def is_flat_entry(entry_dict):
+    """
+    Returns True if the given playlist entry still needs to be resolved
+    by extract_entry_info
+    """
+    return "formats" not in entry_dict
+
+def cache_info_dict(cache_key, info_dict):
+    """
+    Stores an extracted info dict in the cache under 'cache_key' and also
+    under its info_key() if that's different (e.g. the address was
+    redirected to another extractor). Videos of a playlist are stored
+    individually.
+    """
+    cache = get_info_cache()
+    cache.put(cache_key, info_dict)
+
+    own_key = info_key(info_dict)
+    if own_key is not None and own_key != cache_key:
+        cache.put(own_key, info_dict)
+
+    if info_dict.get("_type") == "playlist":
+        for entry_dict in info_dict["entries"]:
+            if entry_dict and info_key(entry_dict) is not None:
+                cache.put(info_key(entry_dict), entry_dict)
 
 def pprint_info_dict(url):
     """
@@ -94,26 +400,121 @@ def pprint_info_dict(url):
     """
     try:
         info_dict = extract_vid_info(url)
-    except youtube_dl.utils.DownloadError:
+    except ExtractionError:
         exit("Website not supported")
 
     pprint(info_dict)
 
-def download_vid(url, vid_format, where):
+# How many connections download_vid may use for one file (see segmented);
+# 1 means downloads are left to YoutubeDL. Set by CATFETCH_SEGMENTS or
+# set_download_segments().
+_download_segments = int(os.environ.get("CATFETCH_SEGMENTS") or 1)
+
+def set_download_segments(segments):
+    """ Sets how many connections a download may use (1 = no segments) """
+    global _download_segments
+    _download_segments = max(1, segments)
+
+def get_download_segments():
+    return _download_segments
+
+def download_vid(url, vid_format, where, progress_hook=None):
     """
     Orders YoutubeDL to start downloading the video from an address ('url')
-    and in a format specified by id ('vid_format') into location ('where')
+    and in a format specified by id ('vid_format') into location ('where').
+    'progress_hook' is called with every YoutubeDL progress hook dict
+    (in this thread, or in segment threads, see download_segmented).
     """
-    dow_ydl_opts = {
-        "logger": MyLogger(),
-        "progress_hooks": [my_hook],
+    try:
+        if not (_download_segments > 1 and
+                download_segmented(url, vid_format, where, progress_hook)):
+            download_with_ytdl(url, vid_format, where, progress_hook)
+    except Exception:
+        metrics.DOWNLOADS.inc(result="failed")
+        metrics.DOWNLOAD_FAILURES.inc(
+            extractor=key_extractor(video_key(url)))
+        raise
+    metrics.DOWNLOADS.inc(result="downloaded")
+
+def download_with_ytdl(url, vid_format, where, progress_hook=None):
+    """ Lets YoutubeDL download the video; see download_vid """
+    dow_ydl = get_ydl("download")
+    # YoutubeDL looks these up in its params for every download, so they
+    # can be changed without building a new object
+    dow_ydl.params.update({
         "format": vid_format,
         "outtmpl": where
-    }
+    })
+
+    _current_download.progress_hook = progress_hook
+    # per-host rate limits go by the video's website, like the download
+    # queue's per-host limits
+    _current_download.host = urlsplit(url).hostname or ""
+    _current_download.downloaded_bytes = None
+    try:
+        with log_sink.get_sink().context(url, "download"):
+            if http_fixtures.fixtures_active():
+                # pages come from the fixtures: start from the recorded
+                # extraction instead of letting YoutubeDL extract it again
+                # (the media files themselves are downloaded for real)
+                dow_ydl.process_ie_result(extract_vid_info(url),
+                                          download=True)
+            else:
+                dow_ydl.download([url])
+    finally:
+        _current_download.progress_hook = None
+
+
+def download_segmented(url, vid_format, where, progress_hook=None):
+    """
+    Downloads the video over several connections at once (see segmented)
+    if the format is a single plain HTTP file and its server takes range
+    requests. Returns False, having downloaded nothing, if it isn't possible;
+    download_vid then leaves the download to YoutubeDL.
+    """
+    # A .part file of YoutubeDL is better continued by YoutubeDL
+    if os.path.exists(where + ".part"):
+        return False
+
+    # the info is usually in the cache, as the video has just been added
+    info_dict = extract_vid_info(url)
+    format_dict = bf.get_format_by_id(vid_format, info_dict)
+    # e.g. merged formats ("137+140") or streaming protocols
+    if not segmented.can_segment(format_dict):
+        return False
+
+    host = urlsplit(url).hostname or ""
+
+    def throttle(block_size):
+        metrics.count_downloaded(block_size)
+        _rate_limiter.throttle(host, block_size)
+
+    download = segmented.SegmentedDownload(
+        format_dict["url"], where,
+        headers=segmented.request_headers(format_dict),
+        segments=_download_segments, progress_hook=progress_hook,
+        throttle=throttle
+    )
 
-    dow_ydl = youtube_dl.YoutubeDL(dow_ydl_opts)
+    sink = log_sink.get_sink()
+    with sink.context(url, "download"):
+        start = time.monotonic()
+        try:
+            download.run()
+        except segmented.RangesNotSupported as reason:
+            sink.log(log_sink.DEBUG,
+                     "Not downloading in segments: {}".format(reason))
+            return False
+        elapsed = time.monotonic() - start
+        # nothing is downloaded if the file was there already, and only
+        # the rest of a continued one
+        downloaded_bytes = download.downloaded_bytes - download.resumed_bytes
+        if elapsed > 0 and downloaded_bytes:
+            metrics.DOWNLOAD_SPEED.observe(downloaded_bytes / elapsed)
+        sink.log(log_sink.INFO, "Finished ({} segments): {}".format(
+            _download_segments, where))
 
-    dow_ydl.download([url])
+    return True
 
 
 # info_dict = extract_vid_info("https://www.youtube.com/watch?v=ylzkOPBrdx0")